@@ -108,6 +108,7 @@ def fetch_results(
         logger.error(f"Failed to download results for {len(failed_computes)} channels")
         logger.error(failed_computes)
         raise Exception(f"Failed to download results for {len(failed_computes)} channels")
+    db_utils.publish_data_version(settings.POSTGRES_DSN.get_secret_value(), 'k3l_channel_openrank_results')
     return
 
 def process_domains(
@@ -163,7 +163,8 @@ def create_dag():
         refresh_db = BashOperator(
             task_id='refresh_ch_rank',
             bash_command='''cd /pipeline/ && ./run_eigen2_postgres_sql.sh -w . "
-            REFRESH MATERIALIZED VIEW CONCURRENTLY k3l_channel_rank;"
+            REFRESH MATERIALIZED VIEW CONCURRENTLY k3l_channel_rank;
+            SELECT k3l_publish_data_version('k3l_channel_rank');"
             ''',
             trigger_rule=TriggerRule.ALL_SUCCESS
         )
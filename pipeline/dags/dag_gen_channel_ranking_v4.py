@@ -158,7 +158,8 @@ def create_dag():
         refresh_ch_rank8 = BashOperator(
             task_id='refresh_ch_rank8',
             bash_command='''cd /pipeline/ && ./run_eigen8_postgres_sql.sh -w . "
-            REFRESH MATERIALIZED VIEW CONCURRENTLY k3l_channel_rank;"
+            REFRESH MATERIALIZED VIEW CONCURRENTLY k3l_channel_rank;
+            SELECT k3l_publish_data_version('k3l_channel_rank');"
             ''',
             trigger_rule=TriggerRule.ALL_SUCCESS
         )
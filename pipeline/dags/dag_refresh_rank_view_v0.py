@@ -27,7 +27,8 @@ with DAG(
     task1 = BashOperator(
         task_id='refresh_view_k3l_rank_e8',
         bash_command='''cd /pipeline/ && ./run_eigen8_postgres_sql.sh -w . "
-        REFRESH MATERIALIZED VIEW CONCURRENTLY k3l_rank; "
+        REFRESH MATERIALIZED VIEW CONCURRENTLY k3l_rank;
+        SELECT k3l_publish_data_version('k3l_rank');"
         '''
     )
 
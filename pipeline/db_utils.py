@@ -46,6 +46,11 @@ def execute_query(pg_dsn: str, query: str):
             cursor.execute(query)
 
 
+def publish_data_version(pg_dsn: str, dataset: str):
+    """Bump the version of `dataset` and notify listeners (see schema/k3l_data_versions.sql)"""
+    execute_query(pg_dsn, f"SELECT k3l_publish_data_version('{dataset}')")
+
+
 def ijv_df_read_sql_tmpfile(pg_dsn: str, query: SQL, **query_kwargs) -> pd.DataFrame:
     with Timer(name=query.name):
         sql_query = query.value.format(**query_kwargs)
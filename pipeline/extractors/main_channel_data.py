@@ -40,6 +40,8 @@ def fetch_data_from_api():
         with postgres_engine.begin() as conn:
             conn.execute(text("TRUNCATE TABLE warpcast_channels_data"))
             df_warpcast_channels.to_sql('warpcast_channels_data', con=conn, if_exists='append', index=False)
+            # same transaction; the serve app is notified only once the new data is visible
+            conn.execute(text("SELECT k3l_publish_data_version('warpcast_channels_data')"))
     except Exception as e:
         logger.error(f"Failed to insert data into postgres: {e}")
         raise e
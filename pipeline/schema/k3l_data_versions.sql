@@ -0,0 +1,33 @@
+-- Version counter per published dataset.
+-- Pipeline writers call k3l_publish_data_version() after each refresh,
+-- ... which bumps the version and notifies the serve app on the
+-- ... `k3l_data_version` channel so that it can drop cached results.
+-- The notification is delivered when the calling transaction commits.
+CREATE TABLE IF NOT EXISTS k3l_data_versions (
+    dataset text PRIMARY KEY,
+    version bigint NOT NULL,
+    published_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION k3l_publish_data_version(p_dataset text)
+RETURNS bigint
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    new_version bigint;
+BEGIN
+    INSERT INTO k3l_data_versions AS dv (dataset, version, published_at)
+    VALUES (p_dataset, 1, now())
+    ON CONFLICT (dataset) DO UPDATE
+    SET
+        version = dv.version + 1,
+        published_at = EXCLUDED.published_at
+    RETURNING version INTO new_version;
+
+    PERFORM pg_notify(
+        'k3l_data_version',
+        json_build_object('dataset', p_dataset, 'version', new_version)::text
+    );
+    RETURN new_version;
+END;
+$$;
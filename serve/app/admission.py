@@ -0,0 +1,107 @@
+import asyncio
+
+from loguru import logger
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .config import settings
+from .telemetry import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_SHED
+
+
+class RouteGroup:
+    """
+    Bounds how many requests of a group run at once and how many may wait.
+    Waiting is also bounded in time so that queued requests fail fast
+    instead of timing out at the client anyway.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path_prefixes: tuple[str, ...],
+        max_in_flight: int,
+        max_queued: int,
+        queue_timeout_secs: float,
+    ) -> None:
+        self.name = name
+        self.path_prefixes = path_prefixes
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._max_queued = max_queued
+        self._queue_timeout_secs = queue_timeout_secs
+        self._queued = 0
+
+    def matches(self, path: str) -> bool:
+        return path.startswith(self.path_prefixes)
+
+    async def acquire(self) -> str | None:
+        """Returns None once admitted, otherwise the reason for shedding."""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return None
+        if self._queued >= self._max_queued:
+            return "queue_full"
+        self._queued += 1
+        ADMISSION_QUEUED.labels(group=self.name).inc()
+        try:
+            async with asyncio.timeout(self._queue_timeout_secs):
+                await self._semaphore.acquire()
+            return None
+        except TimeoutError:
+            return "queue_timeout"
+        finally:
+            self._queued -= 1
+            ADMISSION_QUEUED.labels(group=self.name).dec()
+
+    def release(self):
+        self._semaphore.release()
+
+
+def default_route_groups() -> list[RouteGroup]:
+    # anything not listed here (metadata lookups, rankings, ...) is not limited
+    return [
+        RouteGroup(
+            "feed",
+            ("/casts/", "/channels/casts/"),
+            max_in_flight=settings.ADMISSION_FEED_MAX_IN_FLIGHT,
+            max_queued=settings.ADMISSION_FEED_MAX_QUEUED,
+            queue_timeout_secs=settings.ADMISSION_QUEUE_TIMEOUT_SECS,
+        ),
+        RouteGroup(
+            "graph",
+            ("/graph/", "/links/", "/scores/personalized/"),
+            max_in_flight=settings.ADMISSION_GRAPH_MAX_IN_FLIGHT,
+            max_queued=settings.ADMISSION_GRAPH_MAX_QUEUED,
+            queue_timeout_secs=settings.ADMISSION_QUEUE_TIMEOUT_SECS,
+        ),
+    ]
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, app: ASGIApp, groups: list[RouteGroup] | None = None) -> None:
+        self.app = app
+        self.groups = default_route_groups() if groups is None else groups
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        group = next((g for g in self.groups if g.matches(scope["path"])), None)
+        if group is None:
+            return await self.app(scope, receive, send)
+
+        reason = await group.acquire()
+        if reason is not None:
+            ADMISSION_SHED.labels(group=group.name, reason=reason).inc()
+            logger.warning(f"shedding {scope['path']} ({group.name}: {reason})")
+            response = JSONResponse(
+                {"detail": "Service Unavailable"},
+                status_code=503,
+                headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECS)},
+            )
+            return await response(scope, receive, send)
+
+        ADMISSION_IN_FLIGHT.labels(group=group.name).inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            ADMISSION_IN_FLIGHT.labels(group=group.name).dec()
+            group.release()
@@ -20,6 +20,14 @@ class Settings(BaseSettings):
     POSTGRES_ECHO: bool = False
     POSTGRES_TIMEOUT_SECS: int = 60
 
+    # read replicas share the primary's credentials, port and db name;
+    # ... reads fall back to the primary if no replica of their class is in sync
+    DB_LATENCY_REPLICA_HOSTS: list[str] = []
+    DB_HEAVY_REPLICA_HOSTS: list[str] = []
+    DB_REPLICA_POOL_SIZE: int = 5
+    DB_REPLICA_MAX_LAG_SECS: float = 30
+    DB_REPLICA_LAG_CHECK_SECS: int = 10
+
     CACHE_DB_ENABLED: bool = False
     CACHE_DB_USERNAME: str = "postgres"
     CACHE_DB_PASSWORD: SecretStr = "postgres"
@@ -38,6 +46,15 @@ class Settings(BaseSettings):
     EIGENTRUST_FLAT_TAIL: int = 2
 
     FEED_TIMEOUT_SECS: int = 30
+
+    # admission control per route group; beyond in-flight plus queued,
+    # ... or after waiting ADMISSION_QUEUE_TIMEOUT_SECS, requests get a 503
+    ADMISSION_FEED_MAX_IN_FLIGHT: int = 16
+    ADMISSION_FEED_MAX_QUEUED: int = 32
+    ADMISSION_GRAPH_MAX_IN_FLIGHT: int = 8
+    ADMISSION_GRAPH_MAX_QUEUED: int = 16
+    ADMISSION_QUEUE_TIMEOUT_SECS: float = 5
+    ADMISSION_RETRY_AFTER_SECS: int = 5
     FID_BATCH_SIZE: int = 1000
 
     CURA_SCMGR_URL: str = "changeme"
@@ -45,6 +62,14 @@ class Settings(BaseSettings):
     CURA_SCMGR_PASSWORD: SecretStr = "changeme"
 
     MAX_CHANNELS_PER_USER: int = 50
+    # for-you feed fan-out over a user's channels;
+    # concurrency is further capped to half of the db pool
+    FOR_YOU_CHANNEL_CONCURRENCY: int = 4
+    FOR_YOU_CHANNELS_PER_QUERY: int = 10
+    FOR_YOU_CANDIDATES_TARGET: int = 500
+    # trending casts count towards the target only if they are in the top
+    # ... percentiles of their channel, as they are ordered by age
+    FOR_YOU_CANDIDATES_PTILE: int = 50
 
     USE_PANDAS_PERF: bool
     LOG_LEVEL: str = "INFO"
@@ -69,8 +94,88 @@ class Settings(BaseSettings):
     # TODO(ek): rename to FEED_CACHE_*
     TOKEN_FEED_CACHE_TTL: timedelta = timedelta(minutes=5)
     TOKEN_FEED_CACHE_EARLY_TTL: timedelta = timedelta(minutes=4)
-    TOKEN_FEED_CACHE_REFRESH_THRESHOLD: timedelta = timedelta(seconds=3)
-    TOKEN_FEED_CACHE_SIZE: int = 1000
+
+    # in-process (L1) entries shared by all feed namespaces;
+    # ... the cache DB (L2) is used only if CACHE_DB_ENABLED
+    FEED_CACHE_L1_SIZE: int = 1000
+    CHANNEL_FEED_CACHE_TTL: timedelta = timedelta(minutes=30)
+    CHANNEL_FEED_CACHE_EARLY_TTL: timedelta = timedelta(minutes=10)
+    FEED_CACHE_PURGE_FREQ_SECS: int = 3600
+
+    # score lite popular/trending channel feeds in process over one cached
+    # ... fetch of the channel's actions instead of one query per variant;
+    # ... off by default until the size of those cached fetches is measured
+    CHANNEL_FEED_SCORING_IN_PROCESS: bool = False
+
+    # reconnect delay of the listener for pipeline data version notifications
+    DATA_VERSION_LISTEN_RETRY_SECS: int = 30
+
+    # channel id/url/metadata map; also reloaded when the pipeline publishes.
+    # the in-memory stores below are off by default: each one bulk-loads
+    # ... its tables at startup and on publishes, so enable them per
+    # ... deployment once those loads have been measured
+    CHANNEL_METADATA_IN_MEMORY: bool = False
+    CHANNEL_METADATA_REFRESH_SECS: int = 3600
+
+    # default trending/popular feeds of recently requested channels,
+    # ... precomputed in the background and served as list slices
+    FEED_MATERIALIZE_ENABLED: bool = False
+    FEED_MATERIALIZE_FREQ_SECS: int = 180
+    FEED_MATERIALIZE_DEPTH: int = 200
+    FEED_MATERIALIZE_MAX_CHANNELS: int = 500
+    FEED_MATERIALIZE_SEED_CHANNELS: int = 100
+    FEED_MATERIALIZE_IDLE_SECS: int = 3600
+    FEED_MATERIALIZE_CONCURRENCY: int = 2
+
+    # 60d channel ranks held in memory for per-fid lookups
+    CHANNEL_RANKS_IN_MEMORY: bool = False
+    CHANNEL_RANKS_REFRESH_SECS: int = 21600
+
+    # channel token balances and ERC20 holders held in memory;
+    # ... channel balances are refreshed incrementally by update_ts,
+    # ... holders of recently requested tokens are reloaded in full
+    TOKEN_BALANCES_IN_MEMORY: bool = False
+    TOKEN_BALANCES_REFRESH_SECS: int = 60
+    TOKEN_HOLDERS_REFRESH_SECS: int = 900
+    TOKEN_HOLDERS_MAX_TOKENS: int = 50
+    TOKEN_HOLDERS_IDLE_SECS: int = 3600
+
+    # /channels/trending from hourly activity buckets held in memory
+    TRENDING_CHANNELS_IN_MEMORY: bool = False
+    TRENDING_CHANNELS_REFRESH_SECS: int = 300
+    TRENDING_CHANNELS_OVERLAP_HOURS: int = 3
+    TRENDING_CHANNELS_FULL_REFRESH_SECS: int = 86400
+
+    # recent k3l_cast_action held in memory and tailed by created_at,
+    # for the popular neighbors feed; off by default, a few GB per 5 days
+    CAST_ACTION_STORE_ENABLED: bool = False
+    CAST_ACTION_STORE_POLL_SECS: int = 30
+    CAST_ACTION_STORE_OVERLAP_SECS: int = 600
+    CAST_ACTION_STORE_RELOAD_SECS: int = 86400
+    CAST_ACTION_STORE_WINDOW_DAYS: int = 5
+
+    # /_admin routes are disabled unless set; callers send it as X-Admin-Key
+    ADMIN_API_KEY: SecretStr | None = None
+
+    # queries slower than this are kept with their parameters and request
+    # ... in a ring buffer served at /_admin/slow_queries; 0 disables it
+    SLOW_QUERY_THRESHOLD_SECS: float = 1.0
+    SLOW_QUERY_BUFFER_SIZE: int = 200
+    SLOW_QUERY_MAX_PARAM_CHARS: int = 2000
+    # also fetch their plans (EXPLAIN without ANALYZE) in the background
+    SLOW_QUERY_EXPLAIN: bool = False
+
+    # sampling profiler, on demand at /_admin/profile; optionally also always
+    # ... on at a low rate, writing one collapsed-stack file per window
+    PROFILER_CONTINUOUS_ENABLED: bool = False
+    PROFILER_CONTINUOUS_RATE_HZ: float = 5
+    PROFILER_CONTINUOUS_WINDOW_SECS: int = 300
+    PROFILER_DIR: str = "/tmp/serve-profiles"
+    PROFILER_KEEP_FILES: int = 288
+
+    # for-you feed pages pinned to a sessionId; requires CACHE_DB_ENABLED
+    HOMEFEED_SESSION_TTL: timedelta = timedelta(minutes=30)
+    HOMEFEED_CANDIDATES_PER_CHANNEL: int = 100
 
     model_config = SettingsConfigDict(
         # `.env.prod` takes priority over `.env`
@@ -85,6 +190,13 @@ class Settings(BaseSettings):
             f"?random_page_cost=1.1"
         )
 
+    def replica_postgres_uri(self, host: str) -> SecretStr:
+        return SecretStr(
+            f"postgresql://{self.DB_USERNAME}:{self.DB_PASSWORD.get_secret_value()}"
+            f"@{host}:{self.DB_PORT}/{self.DB_NAME}"
+            f"?random_page_cost=1.1"
+        )
+
     @computed_field
     def POSTGRES_ASYNC_URI(self) -> SecretStr:
         return SecretStr(
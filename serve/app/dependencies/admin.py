@@ -0,0 +1,16 @@
+import secrets
+
+from fastapi import Header, HTTPException
+
+from ..config import settings
+
+
+def require_admin_key(x_admin_key: str | None = Header(None)):
+    """Route dependency of the /_admin routes, which do not exist unless ADMIN_API_KEY is set."""
+    if settings.ADMIN_API_KEY is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = settings.ADMIN_API_KEY.get_secret_value()
+    if x_admin_key is None or not secrets.compare_digest(
+        x_admin_key.encode(), expected.encode()
+    ):
+        raise HTTPException(status_code=401, detail="Unauthorized")
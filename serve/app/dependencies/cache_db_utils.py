@@ -1,25 +1,141 @@
-import json
+import pickle
+from datetime import UTC, datetime
 
+import asyncpg
 from asyncpg.pool import Pool
 from loguru import logger
 
+from ..config import settings
+from ..telemetry import acquire_timed, query_timer
+
+HOMEFEED_NAMESPACE = "homefeed"
+
+
+async def get_cache_entry(
+    namespace: str, key: str, cache_pool: Pool
+) -> asyncpg.Record | None:
+    sql_query = """
+        SELECT
+            value,
+            EXTRACT(EPOCH FROM stale_at) as stale_at,
+            EXTRACT(EPOCH FROM expires_at) as expires_at
+        FROM k3l_serve_cache
+        WHERE
+            namespace = $1
+            AND key = $2
+            AND expires_at > now()
+    """
+    try:
+        async with acquire_timed(cache_pool, "get_cache_entry") as connection:
+            with query_timer(cache_pool, "get_cache_entry"):
+                return await connection.fetchrow(
+                    sql_query,
+                    namespace,
+                    key,
+                    timeout=settings.CACHE_POSTGRES_TIMEOUT_SECS,
+                )
+    except Exception as e:
+        # the cache db is an optimization; never fail a request because of it
+        logger.error(f"Failed to read cache entry {namespace}:{key}: {e}")
+        return None
 
-async def set_homefeed_for_fid(
-    fid: int, cids: list[str], offset: int, cache_pool: Pool
-):
 
-    session_data = {"api": "homefeed", "cids": cids, "offset": offset}
-    session_value = json.dumps(session_data)
-    key = f"session:{fid}"
+async def get_cache_entries(
+    namespace: str, keys: list[str], cache_pool: Pool
+) -> dict[str, asyncpg.Record]:
+    """get_cache_entry for several keys in one query, by key; missing keys are absent."""
+    sql_query = """
+        SELECT
+            key,
+            value,
+            EXTRACT(EPOCH FROM stale_at) as stale_at,
+            EXTRACT(EPOCH FROM expires_at) as expires_at
+        FROM k3l_serve_cache
+        WHERE
+            namespace = $1
+            AND key = ANY($2::text[])
+            AND expires_at > now()
+    """
+    try:
+        async with acquire_timed(cache_pool, "get_cache_entries") as connection:
+            with query_timer(cache_pool, "get_cache_entries"):
+                rows = await connection.fetch(
+                    sql_query,
+                    namespace,
+                    keys,
+                    timeout=settings.CACHE_POSTGRES_TIMEOUT_SECS,
+                )
+    except Exception as e:
+        # the cache db is an optimization; never fail a request because of it
+        logger.error(f"Failed to read {len(keys)} cache entries of {namespace}: {e}")
+        return {}
+    return {row["key"]: row for row in rows}
 
-    # TODO update db using cache_pool
-    pass
 
+async def set_cache_entry(
+    namespace: str,
+    key: str,
+    value: bytes,
+    stale_at: datetime,
+    expires_at: datetime,
+    cache_pool: Pool,
+):
+    sql_query = """
+        INSERT INTO k3l_serve_cache (namespace, key, value, stale_at, expires_at)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (namespace, key) DO UPDATE
+        SET
+            value = EXCLUDED.value,
+            stale_at = EXCLUDED.stale_at,
+            expires_at = EXCLUDED.expires_at
+    """
+    try:
+        async with acquire_timed(cache_pool, "set_cache_entry") as connection:
+            with query_timer(cache_pool, "set_cache_entry"):
+                await connection.execute(
+                    sql_query,
+                    namespace,
+                    key,
+                    value,
+                    stale_at,
+                    expires_at,
+                    timeout=settings.CACHE_POSTGRES_TIMEOUT_SECS,
+                )
+    except Exception as e:
+        logger.error(f"Failed to write cache entry {namespace}:{key}: {e}")
+
+
+async def purge_expired_cache_entries(cache_pool: Pool):
+    sql_query = "DELETE FROM k3l_serve_cache WHERE expires_at < now()"
+    async with acquire_timed(cache_pool, "purge_expired_cache_entries") as connection:
+        with query_timer(cache_pool, "purge_expired_cache_entries"):
+            status = await connection.execute(
+                sql_query, timeout=settings.CACHE_POSTGRES_TIMEOUT_SECS
+            )
+    logger.info(f"purged expired cache entries: {status}")
 
-async def get_homefeed_for_fid(fid: int, cache_pool: Pool) -> dict:
 
-    key = f"session:{fid}"
+async def set_homefeed_for_fid(
+    fid: int, session_id: str, casts: list[dict], cache_pool: Pool
+):
+    now = datetime.now(UTC)
+    expires_at = now + settings.HOMEFEED_SESSION_TTL
+    await set_cache_entry(
+        HOMEFEED_NAMESPACE,
+        f"session:{fid}:{session_id}",
+        pickle.dumps(casts),
+        stale_at=expires_at,
+        expires_at=expires_at,
+        cache_pool=cache_pool,
+    )
 
-    # TODO get cached data from db using cache_pool
 
-    return {"cids": [], "offset": 0}
+async def get_homefeed_for_fid(
+    fid: int, session_id: str, cache_pool: Pool
+) -> list[dict] | None:
+    row = await get_cache_entry(
+        HOMEFEED_NAMESPACE, f"session:{fid}:{session_id}", cache_pool=cache_pool
+    )
+    if row is None:
+        return None
+    return pickle.loads(row["value"])
@@ -0,0 +1,280 @@
+import asyncio
+import io
+import time
+from collections.abc import Iterable
+from datetime import UTC, datetime, timedelta
+from typing import NamedTuple
+
+import numpy as np
+import pandas
+from asyncpg.pool import Pool
+from loguru import logger
+
+from ..config import settings
+from ..telemetry import acquire_timed, query_timer
+from .replicas import QueryClass, replica_router
+
+# cast hashes are 20 bytes; a void dtype keeps trailing zero bytes
+HASH_DTYPE = np.dtype("V20")
+_SECS_PER_HOUR = 3600
+
+ACTIONS_SQL = """
+    SELECT
+        fid,
+        encode(cast_hash, 'hex'),
+        casted,
+        replied,
+        recasted,
+        liked,
+        EXTRACT(EPOCH FROM action_ts)::float8,
+        EXTRACT(EPOCH FROM created_at)::float8
+    FROM k3l_cast_action
+    WHERE {condition}
+"""
+
+
+class CastActionColumns(NamedTuple):
+    fids: np.ndarray
+    cast_hashes: np.ndarray
+    casted: np.ndarray
+    replied: np.ndarray
+    recasted: np.ndarray
+    liked: np.ndarray
+    # epoch seconds
+    action_ts: np.ndarray
+
+    def take(self, idx: np.ndarray) -> "CastActionColumns":
+        return CastActionColumns(*(column[idx] for column in self))
+
+    @classmethod
+    def concat(cls, parts: list["CastActionColumns"]) -> "CastActionColumns":
+        return cls(*(np.concatenate(columns) for columns in zip(*parts)))
+
+    @classmethod
+    def empty(cls) -> "CastActionColumns":
+        return cls(
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=HASH_DTYPE),
+            *(np.empty(0, dtype=np.int8) for _ in range(4)),
+            np.empty(0, dtype=float),
+        )
+
+
+def _parse_actions(data: bytes) -> tuple[CastActionColumns, np.ndarray]:
+    df = pandas.read_csv(
+        io.BytesIO(data),
+        names=[
+            "fid",
+            "cast_hash",
+            "casted",
+            "replied",
+            "recasted",
+            "liked",
+            "action_ts",
+            "created_at",
+        ],
+        dtype={
+            "fid": np.int64,
+            "cast_hash": str,
+            "casted": np.int8,
+            "replied": np.int8,
+            "recasted": np.int8,
+            "liked": np.int8,
+            "action_ts": float,
+            "created_at": float,
+        },
+    )
+    df = df[df["cast_hash"].str.len() == 2 * HASH_DTYPE.itemsize]
+    hashes = np.frombuffer(bytes.fromhex("".join(df["cast_hash"])), dtype=HASH_DTYPE)
+    columns = CastActionColumns(
+        df["fid"].to_numpy(),
+        hashes,
+        df["casted"].to_numpy(),
+        df["replied"].to_numpy(),
+        df["recasted"].to_numpy(),
+        df["liked"].to_numpy(),
+        df["action_ts"].to_numpy(),
+    )
+    return columns, df["created_at"].to_numpy()
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, end) over all pairs."""
+    lengths = ends - starts
+    if lengths.sum() == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+class CastActionStore:
+    """
+    Rolling window of k3l_cast_action held in memory, in hourly chunks
+    of columns sorted by fid so that the actions of a set of fids are a
+    few binary searches per chunk. Tailed every CAST_ACTION_STORE_POLL_SECS
+    by created_at, which the pipeline copies from the source rows. Its
+    batches can land rows at or just below the latest created_at after
+    that was read, so each poll re-reads CAST_ACTION_STORE_OVERLAP_SECS
+    and skips the actions already held. The gapfill inserts rows with
+    older created_at still, which only the full reload every
+    CAST_ACTION_STORE_RELOAD_SECS picks up. Chunks older than the window
+    are evicted.
+    """
+
+    def __init__(self, window: timedelta) -> None:
+        self.window = window
+        self._chunks: dict[int, CastActionColumns] = {}
+        self._watermark: float | None = None
+        self._loaded_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._watermark is not None
+
+    def covers(self, lookback: timedelta) -> bool:
+        return self.loaded and lookback <= self.window
+
+    def actions_of(
+        self, fids: Iterable[int], since: float, until: float
+    ) -> CastActionColumns:
+        """Actions of `fids` with action_ts between `since` and `until`."""
+        fids = np.unique(np.fromiter(fids, dtype=np.int64))
+        parts = []
+        for hour, chunk in self._chunks.items():
+            if (hour + 1) * _SECS_PER_HOUR < since or hour * _SECS_PER_HOUR > until:
+                continue
+            idx = _ranges(
+                np.searchsorted(chunk.fids, fids, side="left"),
+                np.searchsorted(chunk.fids, fids, side="right"),
+            )
+            ts = chunk.action_ts[idx]
+            parts.append(chunk.take(idx[(ts >= since) & (ts <= until)]))
+        return CastActionColumns.concat(parts) if parts else CastActionColumns.empty()
+
+    def _holds(self, actions: CastActionColumns) -> np.ndarray:
+        """Whether each action, by (cast_hash, fid, action_ts), is held already."""
+        held = np.zeros(len(actions.fids), dtype=bool)
+        hours = (actions.action_ts // _SECS_PER_HOUR).astype(np.int64)
+        for hour in np.unique(hours):
+            chunk = self._chunks.get(int(hour))
+            if chunk is None:
+                continue
+            rows = np.flatnonzero(hours == hour)
+            starts = np.searchsorted(chunk.fids, actions.fids[rows], side="left")
+            ends = np.searchsorted(chunk.fids, actions.fids[rows], side="right")
+            # each action against the held actions of its fid in the hour
+            idx = _ranges(starts, ends)
+            owners = np.repeat(rows, ends - starts)
+            same = (chunk.cast_hashes[idx] == actions.cast_hashes[owners]) & (
+                chunk.action_ts[idx] == actions.action_ts[owners]
+            )
+            held[owners[same]] = True
+        return held
+
+    def _add(self, actions: CastActionColumns):
+        hours = (actions.action_ts // _SECS_PER_HOUR).astype(np.int64)
+        for hour in np.unique(hours):
+            part = actions.take(np.flatnonzero(hours == hour))
+            chunk = self._chunks.get(int(hour))
+            if chunk is not None:
+                part = CastActionColumns.concat([chunk, part])
+            self._chunks[int(hour)] = part.take(np.argsort(part.fids, kind="stable"))
+
+    def _evict(self):
+        oldest = (time.time() - self.window.total_seconds()) // _SECS_PER_HOUR
+        for hour in [h for h in self._chunks if h < oldest]:
+            del self._chunks[hour]
+
+    async def _fetch(
+        self, pool: Pool, query_name: str, condition: str, *args
+    ) -> tuple[CastActionColumns, np.ndarray]:
+        buf = io.BytesIO()
+        pool = replica_router.pool_for(pool, QueryClass.HEAVY)
+        async with acquire_timed(pool, query_name) as connection:
+            with query_timer(pool, query_name):
+                await connection.copy_from_query(
+                    ACTIONS_SQL.format(condition=condition),
+                    *args,
+                    output=buf,
+                    format="csv",
+                    timeout=settings.POSTGRES_TIMEOUT_SECS,
+                )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _parse_actions, buf.getvalue())
+
+    async def load(self, pool: Pool):
+        """
+        Loads the window an hour at a time, oldest first, up to the
+        created_at of the latest row at the start of the load so that
+        rows inserted meanwhile are left to the tail.
+        """
+        replica = replica_router.pool_for(pool, QueryClass.HEAVY)
+        async with acquire_timed(replica, "cast_actions_watermark") as connection:
+            with query_timer(replica, "cast_actions_watermark"):
+                watermark = await connection.fetchval(
+                    "SELECT EXTRACT(EPOCH FROM max(created_at))::float8"
+                    " FROM k3l_cast_action",
+                    timeout=settings.POSTGRES_TIMEOUT_SECS,
+                )
+        watermark = watermark or 0.0
+        now = datetime.now(UTC).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+        chunks = {}
+        hour = now - self.window
+        while hour <= now:
+            actions, _ = await self._fetch(
+                pool,
+                "load_cast_actions",
+                "action_ts >= $1 AND action_ts < $2"
+                " AND created_at <= to_timestamp($3) AT TIME ZONE 'UTC'",
+                hour,
+                hour + timedelta(hours=1),
+                watermark,
+            )
+            if len(actions.fids):
+                chunks[int(actions.action_ts[0] // _SECS_PER_HOUR)] = actions.take(
+                    np.argsort(actions.fids, kind="stable")
+                )
+            hour += timedelta(hours=1)
+        self._chunks = chunks
+        self._watermark = watermark
+        self._loaded_at = time.time()
+        logger.info(
+            f"Loaded {sum(len(c.fids) for c in chunks.values())} cast actions"
+            f" of the last {self.window}"
+        )
+
+    async def poll(self, pool: Pool):
+        if (
+            self._watermark is None
+            or time.time() - self._loaded_at > settings.CAST_ACTION_STORE_RELOAD_SECS
+        ):
+            await self.load(pool)
+            return
+        actions, created_at = await self._fetch(
+            pool,
+            "tail_cast_actions",
+            "created_at >= to_timestamp($1) AT TIME ZONE 'UTC'",
+            self._watermark - settings.CAST_ACTION_STORE_OVERLAP_SECS,
+        )
+        # only rows up to the watermark can have been read before
+        new = created_at > self._watermark
+        overlap = np.flatnonzero(~new)
+        new[overlap] = ~self._holds(actions.take(overlap))
+        self._add(actions.take(np.flatnonzero(new)))
+        self._watermark = max(self._watermark, created_at.max(initial=0.0))
+        self._evict()
+
+
+async def tail_cast_actions(store: CastActionStore, pool: Pool):
+    logger.info("Starting cast action store tail loop")
+    while True:
+        try:
+            await store.poll(pool)
+        except Exception as e:
+            logger.error(f"Failed to tail cast actions: {e}")
+        await asyncio.sleep(settings.CAST_ACTION_STORE_POLL_SECS)
+
+
+cast_action_store = CastActionStore(
+    timedelta(days=settings.CAST_ACTION_STORE_WINDOW_DAYS)
+)
@@ -0,0 +1,489 @@
+import random
+from datetime import UTC, datetime, timedelta
+from typing import Any, NamedTuple
+
+import numpy as np
+
+from app.models.feed_model import CastsTimeDecay, SortingOrder
+from app.models.score_model import ScoreAgg, Weights
+
+from .cast_action_store import CastActionColumns
+from .cursor import OrderBy
+
+
+class CastActions(NamedTuple):
+    """
+    Columnar cast actions of recent casts, before any weighting.
+    Cast columns are aligned with `cast_hashes`; action columns are aligned
+    with `action_cast`, the index of the cast each action is on.
+    """
+
+    # reference time for action and cast ages
+    now: datetime
+    cast_hashes: list[str]
+    fids: np.ndarray
+    timestamps: list[datetime]
+    cast_ages: np.ndarray
+    # raw balances stay exact (numeric) for ordering and output
+    balances: list[Any]
+    action_cast: np.ndarray
+    action_values: np.ndarray
+    casted: np.ndarray
+    recasted: np.ndarray
+    replied: np.ndarray
+    liked: np.ndarray
+    action_ages: np.ndarray
+
+    @classmethod
+    def from_rows(cls, now: datetime, rows: list[dict[str, Any]]) -> "CastActions":
+        """From one row per cast carrying its actions as aligned arrays."""
+        counts = np.array([len(row["action_values"]) for row in rows], dtype=np.int64)
+
+        def actions(column: str) -> np.ndarray:
+            if not rows:
+                return np.empty(0, dtype=float)
+            return np.concatenate(
+                [np.asarray(row[column], dtype=float) for row in rows]
+            )
+
+        return cls(
+            now=now,
+            cast_hashes=[row["cast_hash"] for row in rows],
+            fids=np.array([row["fid"] for row in rows], dtype=np.int64),
+            timestamps=[row["timestamp"] for row in rows],
+            cast_ages=np.array(
+                [(now - row["timestamp"]).total_seconds() for row in rows],
+                dtype=float,
+            ),
+            balances=[row["balance_raw"] for row in rows],
+            action_cast=np.repeat(np.arange(len(rows)), counts),
+            action_values=actions("action_values"),
+            casted=actions("casted"),
+            recasted=actions("recasted"),
+            replied=actions("replied"),
+            liked=actions("liked"),
+            action_ages=actions("action_ages"),
+        )
+
+
+def decay_factors(
+    ages_secs: np.ndarray,
+    period: CastsTimeDecay | timedelta,
+    base: float = 1 - (1 / 365),
+) -> np.ndarray:
+    """In-process equivalent of `db_utils.sql_for_decay`."""
+    if isinstance(period, CastsTimeDecay):
+        if period == CastsTimeDecay.NEVER:
+            base = 1
+        else:
+            period = period.timedelta
+    if base == 1:
+        return np.ones_like(ages_secs)
+    if not 0 < base <= 1:
+        raise ValueError(f"invalid time decay base {base}")
+    if period < timedelta():
+        raise ValueError(f"invalid time decay period {period}")
+    return np.power(base, ages_secs / period.total_seconds())
+
+
+def aggregate(
+    agg: ScoreAgg, groups: np.ndarray, values: np.ndarray, n_groups: int
+) -> np.ndarray:
+    """In-process equivalent of `db_utils.sql_for_agg`, grouped by `groups`."""
+    match agg:
+        case ScoreAgg.SUMSQUARE:
+            return np.bincount(groups, values**2, minlength=n_groups)
+        case ScoreAgg.RMS:
+            counts = np.bincount(groups, minlength=n_groups)
+            sums = np.bincount(groups, values**2, minlength=n_groups)
+            return np.sqrt(np.divide(sums, counts, where=counts > 0, out=sums))
+        case ScoreAgg.SUMCUBEROOT:
+            return np.bincount(groups, np.cbrt(values), minlength=n_groups)
+        case _:
+            return np.bincount(groups, values, minlength=n_groups)
+
+
+def _rank_within(keys: tuple[np.ndarray, ...], scores: np.ndarray) -> np.ndarray:
+    """1-based rank by descending score within each group of equal `keys`."""
+    order = np.lexsort((-scores, *reversed(keys)))
+    ranks = np.empty(len(scores), dtype=np.int64)
+    if len(order) == 0:
+        return ranks
+    sorted_keys = np.stack([key[order] for key in keys])
+    starts = np.r_[True, np.any(sorted_keys[:, 1:] != sorted_keys[:, :-1], axis=0)]
+    start_idx = np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))
+    ranks[order] = np.arange(len(order)) - start_idx + 1
+    return ranks
+
+
+def score_token_holder_casts(
+    actions: CastActions,
+    agg: ScoreAgg,
+    weights: Weights,
+    score_threshold: float,
+    time_decay_base: float,
+    time_decay_period: timedelta,
+    sorting_order: SortingOrder,
+    time_bucket_length: timedelta,
+    limit_casts: int | None,
+) -> list[dict[str, Any]]:
+    """
+    Token holder feed ranked from the holders' actions, with the same
+    semantics as the former single-query implementation: casts scoring
+    below the `score_threshold` percentile are dropped, and so are casts
+    beyond the top `limit_casts` of their author in each time bucket.
+    """
+    n_casts = len(actions.cast_hashes)
+    if n_casts == 0:
+        return []
+    contributions = (
+        actions.action_values
+        * (
+            float(weights.cast) * actions.casted
+            + float(weights.recast) * actions.recasted
+            + float(weights.reply) * actions.replied
+            + float(weights.like) * actions.liked
+        )
+        * decay_factors(actions.action_ages, time_decay_period, base=time_decay_base)
+    )
+    scores = aggregate(agg, actions.action_cast, contributions, n_casts)
+
+    match sorting_order:
+        case SortingOrder.HOUR:
+            time_bucket_length = timedelta(hours=1)
+        case SortingOrder.DAY:
+            time_bucket_length = timedelta(days=1)
+        case SortingOrder.BALANCE:
+            if limit_casts is None:
+                limit_casts = 3
+    time_buckets = np.floor(actions.cast_ages / time_bucket_length.total_seconds())
+
+    # percentile_cont(p) WITHIN GROUP (ORDER BY score DESC)
+    keep = scores >= np.quantile(scores, 1 - score_threshold)
+    if limit_casts is not None:
+        keep &= _rank_within((time_buckets, actions.fids), scores) <= limit_casts
+    kept = np.flatnonzero(keep)
+
+    match sorting_order:
+        case SortingOrder.RECENT:
+            kept = sorted(kept, key=lambda i: actions.timestamps[i], reverse=True)
+        case SortingOrder.TIME_BUCKET | SortingOrder.HOUR | SortingOrder.DAY:
+            kept = kept[np.lexsort((-scores[kept], time_buckets[kept]))]
+        case SortingOrder.BALANCE:
+            kept = sorted(
+                kept,
+                key=lambda i: (-time_buckets[i], actions.balances[i], scores[i]),
+                reverse=True,
+            )
+        case _:
+            kept = kept[np.argsort(-scores[kept], kind="stable")]
+
+    return [
+        {
+            "cast_hash": actions.cast_hashes[i],
+            "fid": int(actions.fids[i]),
+            "timestamp": actions.timestamps[i],
+            "balance_raw": actions.balances[i],
+            "cast_score": float(scores[i]),
+        }
+        for i in kept
+    ]
+
+
+class ChannelCastActions(NamedTuple):
+    """
+    Columnar actions by ranked, unbanned fids on a channel's recent casts,
+    before any weighting. Cast columns are aligned with `cast_hashes`;
+    action columns are aligned with `action_cast`.
+    """
+
+    # reference time for action and cast ages, epoch seconds
+    now: float
+    cast_hashes: list[str]
+    cast_timestamps: list[datetime]
+    cast_ts: np.ndarray
+    # whether the cast itself (not only its actions) is within the lookback
+    cast_in_window: np.ndarray
+    action_cast: np.ndarray
+    fids: np.ndarray
+    fid_scores: np.ndarray
+    casted: np.ndarray
+    recasted: np.ndarray
+    replied: np.ndarray
+    liked: np.ndarray
+    action_ts: np.ndarray
+
+    @classmethod
+    def from_rows(cls, now: float, rows: list[dict[str, Any]]) -> "ChannelCastActions":
+        """From one row per cast carrying its actions as aligned arrays."""
+        counts = np.array([len(row["fids"]) for row in rows], dtype=np.int64)
+
+        def actions(column: str, dtype=float) -> np.ndarray:
+            if not rows:
+                return np.empty(0, dtype=dtype)
+            return np.concatenate(
+                [np.asarray(row[column], dtype=dtype) for row in rows]
+            )
+
+        return cls(
+            now=now,
+            cast_hashes=[row["cast_hash"] for row in rows],
+            cast_timestamps=[row["cast_ts"] for row in rows],
+            cast_ts=np.array([row["cast_epoch"] for row in rows], dtype=float),
+            cast_in_window=np.array([row["in_window"] for row in rows], dtype=bool),
+            action_cast=np.repeat(np.arange(len(rows)), counts),
+            fids=actions("fids", dtype=np.int64),
+            fid_scores=actions("fid_scores"),
+            casted=actions("casted"),
+            recasted=actions("recasted"),
+            replied=actions("replied"),
+            liked=actions("liked"),
+            action_ts=actions("action_ts"),
+        )
+
+    def with_fid_scores(self, fid_scores: np.ndarray) -> "ChannelCastActions":
+        """These actions scored with `fid_scores`, without those scored NaN."""
+        keep = ~np.isnan(fid_scores)
+        return self._replace(
+            action_cast=self.action_cast[keep],
+            fids=self.fids[keep],
+            fid_scores=fid_scores[keep],
+            casted=self.casted[keep],
+            recasted=self.recasted[keep],
+            replied=self.replied[keep],
+            liked=self.liked[keep],
+            action_ts=self.action_ts[keep],
+        )
+
+
+def _ntile(n: int, buckets: int) -> np.ndarray:
+    """NTILE(buckets) of rows 0..n-1 in order, like Postgres."""
+    size, extra = divmod(n, buckets)
+    idx = np.arange(n)
+    large = extra * (size + 1)
+    return np.where(
+        idx < large,
+        idx // (size + 1) + 1,
+        extra + (idx - large) // max(size, 1) + 1,
+    )
+
+
+def _order_rows(rows: list[dict], order_by: OrderBy, shuffle: bool = False):
+    """Sorts rows in place like `ORDER BY` over `order_by`."""
+    if shuffle:
+        # random order within the leading bucket (hour, day, ...)
+        random.shuffle(rows)
+        order_by = order_by[:1]
+    for col, direction in reversed(order_by):
+        rows.sort(key=lambda row: row[col], reverse=direction == "DESC")
+
+
+def _is_after(row: dict, order_by: OrderBy, after: list) -> bool:
+    """In-process equivalent of `cursor.keyset_sql`."""
+    for (col, direction), value in zip(order_by, after):
+        if row[col] != value:
+            return row[col] > value if direction == "ASC" else row[col] < value
+    return False
+
+
+# same cap as the popular channel feed query: its most recent (cast, fid) pairs
+CHANNEL_MAX_PAIRS = 100000
+
+
+def _channel_cast_rows(
+    actions: ChannelCastActions,
+    agg: ScoreAgg,
+    weights: Weights,
+    normalize: bool,
+    time_decay: CastsTimeDecay,
+    trending: bool,
+    now: float,
+    max_pairs: int | None = CHANNEL_MAX_PAIRS,
+) -> list[dict[str, Any]]:
+    """
+    Unfiltered scores of a channel's casts: each fid's weighted actions
+    on a cast are summed, then aggregated over the fids with `agg`.
+    Ages and decay are relative to `now`, and later actions are ignored.
+    """
+    n_casts = len(actions.cast_hashes)
+    keep = actions.action_ts <= now
+    if trending:
+        keep &= actions.cast_in_window[actions.action_cast]
+    if not keep.any():
+        return []
+    action_cast = actions.action_cast[keep]
+    fids = actions.fids[keep]
+    action_ts = actions.action_ts[keep]
+    fid_scores = actions.fid_scores[keep]
+    if normalize:
+        fid_scores = np.cbrt(fid_scores)
+    contributions = (
+        float(weights.cast) * fid_scores * actions.casted[keep]
+        + float(weights.reply) * fid_scores * actions.replied[keep]
+        + float(weights.recast) * fid_scores * actions.recasted[keep]
+        + float(weights.like) * fid_scores * actions.liked[keep]
+    ) * decay_factors(now - action_ts, time_decay)
+
+    # one (cast, fid) pair per acting fid on a cast
+    pair_keys, pairs = np.unique(
+        action_cast * (int(fids.max()) + 1) + fids, return_inverse=True
+    )
+    pair_cast = pair_keys // (int(fids.max()) + 1)
+    pair_scores = np.bincount(pairs, contributions, minlength=len(pair_keys))
+    if trending:
+        pair_ts = actions.cast_ts[pair_cast]
+    else:
+        pair_ts = np.full(len(pair_keys), np.inf)
+        np.minimum.at(pair_ts, pairs, action_ts)
+        if max_pairs is not None and len(pair_keys) > max_pairs:
+            recent = np.argsort(-pair_ts, kind="stable")[:max_pairs]
+            pair_cast, pair_scores, pair_ts = (
+                pair_cast[recent],
+                pair_scores[recent],
+                pair_ts[recent],
+            )
+
+    fid_counts = np.bincount(pair_cast, minlength=n_casts)
+    scores = aggregate(agg, pair_cast, pair_scores, n_casts)
+    cast_ts = np.full(n_casts, np.inf)
+    np.minimum.at(cast_ts, pair_cast, pair_ts)
+    ages = now - cast_ts
+    as_of = datetime.fromtimestamp(now, UTC)
+    rows = []
+    for i in np.flatnonzero(fid_counts):
+        if trending:
+            ts = actions.cast_timestamps[i]
+        else:
+            ts = datetime.fromtimestamp(cast_ts[i], UTC).replace(tzinfo=None)
+        rows.append(
+            {
+                "cast_hash": actions.cast_hashes[i],
+                "age_hours": int(ages[i] // 3600),
+                "age_days": int(ages[i] // 86400),
+                "cast_ts": ts,
+                "cast_score": float(scores[i]),
+                "reaction_count": int(fid_counts[i]) - 1,
+                "as_of": as_of,
+            }
+        )
+    return rows
+
+
+def score_channel_casts(
+    actions: ChannelCastActions,
+    agg: ScoreAgg,
+    score_threshold: float,
+    reactions_threshold: int,
+    weights: Weights,
+    time_decay: CastsTimeDecay,
+    normalize: bool,
+    offset: int,
+    limit: int,
+    order_by: OrderBy,
+    after: list | None = None,
+    as_of: datetime | None = None,
+    trending: bool = False,
+    cutoff_ptile: int = 100,
+    shuffle: bool = False,
+) -> list[dict[str, Any]]:
+    """
+    A page of the popular channel feed, or of the trending channel feed
+    if `trending`, with the same rows and semantics as
+    `db_utils.get_popular_channel_casts_lite` and
+    `db_utils.get_trending_channel_casts_lite` at `as_of`, the time the
+    first page was computed at, or else at the time the actions were fetched.
+    """
+    now = actions.now if as_of is None else as_of.timestamp()
+    rows = [
+        row
+        for row in _channel_cast_rows(
+            actions, agg, weights, normalize, time_decay, trending, now
+        )
+        if row["cast_score"] >= score_threshold
+        and row["reaction_count"] >= reactions_threshold
+    ]
+    if trending:
+        rows.sort(key=lambda row: row["cast_score"], reverse=True)
+        for row, ptile in zip(rows, _ntile(len(rows), 100)):
+            row["ptile"] = int(ptile)
+        rows = [row for row in rows if row["ptile"] <= cutoff_ptile]
+    if after is not None:
+        rows = [row for row in rows if _is_after(row, order_by, after)]
+    _order_rows(rows, order_by, shuffle=shuffle)
+    return rows[offset : offset + limit]
+
+
+def score_given_channel_casts(
+    actions: ChannelCastActions,
+    agg: ScoreAgg,
+    score_threshold: float,
+    weights: Weights,
+    time_decay: CastsTimeDecay,
+    normalize: bool,
+    order_by: OrderBy,
+) -> list[dict[str, Any]]:
+    """
+    In-process equivalent of `db_utils.get_channel_casts_scores_lite`:
+    every cast of `actions` that scores at least `score_threshold`.
+    """
+    rows = [
+        row
+        for row in _channel_cast_rows(
+            actions,
+            agg,
+            weights,
+            normalize,
+            time_decay,
+            trending=False,
+            now=actions.now,
+            max_pairs=None,
+        )
+        if row["cast_score"] >= score_threshold
+    ]
+    _order_rows(rows, order_by)
+    columns = ("cast_hash", "age_hours", "age_days", "cast_ts", "cast_score")
+    return [{col: row[col] for col in columns} for row in rows]
+
+
+def score_neighbors_casts(
+    actions: CastActionColumns,
+    trust_scores: list[dict],
+    now: float,
+    agg: ScoreAgg,
+    weights: Weights,
+) -> tuple[list[bytes], list[float]]:
+    """
+    (cast hashes, scores) of the casts that the trusted fids acted on, as
+    in `db_utils.get_popular_neighbors_casts`: each fid's trust-weighted,
+    hourly decayed actions on a cast are summed, then aggregated with `agg`.
+    """
+    if len(actions.fids) == 0:
+        return [], []
+    trust_fids = np.array([row["fid"] for row in trust_scores], dtype=np.int64)
+    order = np.argsort(trust_fids, kind="stable")
+    trust_fids = trust_fids[order]
+    trust_values = np.array([float(row["score"]) for row in trust_scores])[order]
+    trust = trust_values[np.searchsorted(trust_fids, actions.fids)]
+    contributions = (
+        float(weights.cast) * trust * actions.casted
+        + float(weights.reply) * trust * actions.replied
+        + float(weights.recast) * trust * actions.recasted
+        + float(weights.like) * trust * actions.liked
+    ) * decay_factors(now - actions.action_ts, CastsTimeDecay.HOUR, 1 - 1 / (365 * 24))
+
+    cast_hashes, action_cast = np.unique(actions.cast_hashes, return_inverse=True)
+    width = int(actions.fids.max()) + 1
+    pair_keys, pairs = np.unique(
+        action_cast * width + actions.fids, return_inverse=True
+    )
+    pair_cast = pair_keys // width
+    pair_scores = np.bincount(pairs, contributions, minlength=len(pair_keys))
+    # same cap as the query: the most recent 100k (cast, fid) pairs
+    if len(pair_keys) > 100000:
+        pair_ts = np.full(len(pair_keys), -np.inf)
+        np.maximum.at(pair_ts, pairs, actions.action_ts)
+        recent = np.argsort(-pair_ts, kind="stable")[:100000]
+        pair_cast, pair_scores = pair_cast[recent], pair_scores[recent]
+    scores = aggregate(agg, pair_cast, pair_scores, len(cast_hashes))
+    scored = np.flatnonzero(np.bincount(pair_cast, minlength=len(cast_hashes)))
+    return [bytes(h) for h in cast_hashes[scored]], scores[scored].tolist()
@@ -0,0 +1,89 @@
+from asyncpg.pool import Pool
+from loguru import logger
+
+from ..config import settings
+from . import db_utils
+from .data_versions import data_versions
+from .reloadable import Reloadable
+
+
+class ChannelMetadataCache(Reloadable):
+    """
+    In-process map of warpcast_channels_data by channel id and by url.
+    Bulk-loaded at startup and reloaded every CHANNEL_METADATA_REFRESH_SECS,
+    or as soon as the pipeline publishes a new version of the table.
+    Lookups hit the DB only for channels missing from the last load.
+    Unless CHANNEL_METADATA_IN_MEMORY, nothing is loaded or kept and
+    every lookup hits the DB.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._by_id: dict[str, dict] = {}
+        self._id_by_url: dict[str, str] = {}
+
+    async def load(self, pool: Pool):
+        channels = db_utils.check_dict_rows(
+            await db_utils.get_all_channels_metadata(pool=pool), "channel metadata"
+        )
+        if not channels:
+            # never swap a good map for an empty one mid-refresh of the table
+            logger.warning("No channel metadata found; keeping the current map")
+            return
+        self._by_id = {channel["id"]: channel for channel in channels}
+        self._id_by_url = {channel["url"]: channel["id"] for channel in channels}
+        logger.info(f"Loaded metadata of {len(channels)} channels")
+
+    def _put(self, channels: list[dict]):
+        # without the refresh loop, nothing would ever evict them
+        if not settings.CHANNEL_METADATA_IN_MEMORY:
+            return
+        for channel in channels:
+            self._by_id[channel["id"]] = channel
+            self._id_by_url[channel["url"]] = channel["id"]
+
+    async def get(self, channel_id: str, pool: Pool) -> dict | None:
+        channel = self._by_id.get(channel_id)
+        if channel is None:
+            channels = db_utils.check_dict_rows(
+                await db_utils.get_channel_metadata_for_channel_id(
+                    channel_id, pool=pool
+                ),
+                "channel metadata",
+            )
+            self._put(channels)
+            channel = next((c for c in channels if c["id"] == channel_id), None)
+        return channel
+
+    async def get_by_url(self, url: str, pool: Pool) -> dict | None:
+        channel_id = self._id_by_url.get(url)
+        if channel_id is not None:
+            return self._by_id.get(channel_id)
+        channels = db_utils.check_dict_rows(
+            await db_utils.get_channel_metadata_for_url(url, pool=pool),
+            "channel metadata",
+        )
+        self._put(channels)
+        return next((c for c in channels if c["url"] == url), None)
+
+    async def url_for_id(self, channel_id: str, pool: Pool) -> str | None:
+        channel = await self.get(channel_id, pool)
+        return channel["url"] if channel else None
+
+    async def id_for_url(self, url: str, pool: Pool) -> str | None:
+        channel = await self.get_by_url(url, pool)
+        return channel["id"] if channel else None
+
+
+async def refresh_channel_metadata(cache: ChannelMetadataCache, pool: Pool):
+    logger.info("Starting channel metadata refresh loop")
+    while True:
+        await cache.wait_for_reload(settings.CHANNEL_METADATA_REFRESH_SECS)
+        try:
+            await cache.load(pool)
+        except Exception as e:
+            logger.error(f"Failed to refresh channel metadata: {e}")
+
+
+channel_metadata = ChannelMetadataCache()
+data_versions.subscribe("warpcast_channels_data", channel_metadata.request_reload)
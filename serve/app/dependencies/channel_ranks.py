@@ -0,0 +1,149 @@
+import asyncio
+import io
+from typing import NamedTuple
+
+import numpy as np
+import pandas
+from asyncpg.pool import Pool
+from loguru import logger
+
+from ..config import settings
+from ..models.channel_model import (
+    CHANNEL_RANKING_STRATEGY_NAMES,
+    ChannelRankingsTimeframe,
+)
+from ..telemetry import acquire_timed, query_timer
+from .data_versions import data_versions
+from .reloadable import Reloadable
+from .replicas import QueryClass, replica_router
+
+
+class RankArrays(NamedTuple):
+    # sorted ascending; ranks and scores are aligned with fids
+    fids: np.ndarray
+    ranks: np.ndarray
+    scores: np.ndarray
+
+
+def _parse_ranks(data: bytes) -> dict[str, RankArrays]:
+    df = pandas.read_csv(
+        io.BytesIO(data),
+        names=["channel_id", "fid", "rank", "score"],
+        dtype={"channel_id": str, "fid": np.int64, "rank": np.int64, "score": float},
+        # channel ids like "nan" are not missing values
+        keep_default_na=False,
+        na_values={"score": [""]},
+    )
+    channel_ids = df["channel_id"].to_numpy()
+    fids = df["fid"].to_numpy()
+    ranks = df["rank"].to_numpy()
+    scores = df["score"].to_numpy()
+    # rows come ordered by channel_id, fid; split them at every channel change
+    starts = np.flatnonzero(np.r_[True, channel_ids[1:] != channel_ids[:-1]])
+    ends = np.r_[starts[1:], len(df)]
+    return {
+        channel_ids[start]: RankArrays(
+            fids[start:end].copy(), ranks[start:end].copy(), scores[start:end].copy()
+        )
+        for start, end in zip(starts, ends)
+    }
+
+
+class ChannelRanks(Reloadable):
+    """
+    k3l_channel_rank of one strategy held in memory as per-channel arrays
+    sorted by fid, so that per-fid rank and score lookups do not need a DB
+    round trip or a join.
+    Reloaded every CHANNEL_RANKS_REFRESH_SECS and whenever the pipeline
+    publishes a new k3l_channel_rank.
+    """
+
+    def __init__(self, strategy_name: str) -> None:
+        super().__init__()
+        self.strategy_name = strategy_name
+        self._channels: dict[str, RankArrays] | None = None
+
+    def covers(self, strategy_name: str) -> bool:
+        """Whether lookups of `strategy_name` are answered from memory."""
+        return self._channels is not None and strategy_name == self.strategy_name
+
+    def fid_scores(
+        self, channel_id: str, strategy_name: str, fids: np.ndarray
+    ) -> np.ndarray | None:
+        """
+        Scores aligned with `fids`, NaN for the unranked ones, or None if
+        the caller should ask the DB instead.
+        """
+        if not self.covers(strategy_name):
+            return None
+        scores = np.full(len(fids), np.nan)
+        arrays = self._channels.get(channel_id)
+        if arrays is None or len(fids) == 0:
+            return scores
+        idx = np.searchsorted(arrays.fids, fids).clip(max=len(arrays.fids) - 1)
+        found = arrays.fids[idx] == fids
+        scores[found] = arrays.scores[idx[found]]
+        return scores
+
+    def lookup(
+        self, channel_id: str, strategy_name: str, fids: list[int]
+    ) -> list[dict] | None:
+        """
+        `{fid, rank}` of the ranked `fids` ordered by rank, like the lite
+        query, or None if the caller should ask the DB instead.
+        """
+        if not self.covers(strategy_name):
+            return None
+        arrays = self._channels.get(channel_id)
+        if arrays is None:
+            return []
+        query = np.unique(np.asarray(fids, dtype=np.int64))
+        idx = np.searchsorted(arrays.fids, query).clip(max=len(arrays.fids) - 1)
+        found = idx[arrays.fids[idx] == query]
+        found = found[np.argsort(arrays.ranks[found], kind="stable")]
+        return [
+            {"fid": int(fid), "rank": int(rank)}
+            for fid, rank in zip(arrays.fids[found], arrays.ranks[found])
+        ]
+
+    async def load(self, pool: Pool):
+        sql_query = """
+            SELECT channel_id, fid, rank, score
+            FROM k3l_channel_rank
+            WHERE strategy_name = $1
+            ORDER BY channel_id, fid
+        """
+        buf = io.BytesIO()
+        pool = replica_router.pool_for(pool, QueryClass.HEAVY)
+        async with acquire_timed(pool, "load_channel_ranks") as connection:
+            with query_timer(pool, "load_channel_ranks"):
+                await connection.copy_from_query(
+                    sql_query,
+                    self.strategy_name,
+                    output=buf,
+                    format="csv",
+                    timeout=settings.POSTGRES_TIMEOUT_SECS,
+                )
+        loop = asyncio.get_running_loop()
+        channels = await loop.run_in_executor(None, _parse_ranks, buf.getvalue())
+        self._channels = channels
+        logger.info(
+            f"Loaded {self.strategy_name} ranks of {len(channels)} channels"
+            f" ({sum(len(a.fids) for a in channels.values())} fids)"
+        )
+
+
+async def refresh_channel_ranks(ranks: ChannelRanks, pool: Pool):
+    logger.info("Starting channel ranks refresh loop")
+    while True:
+        try:
+            await ranks.load(pool)
+        except Exception as e:
+            logger.error(f"Failed to load channel ranks: {e}")
+        await ranks.wait_for_reload(settings.CHANNEL_RANKS_REFRESH_SECS)
+
+
+channel_ranks = ChannelRanks(
+    CHANNEL_RANKING_STRATEGY_NAMES[ChannelRankingsTimeframe.SIXTY_DAYS]
+)
+data_versions.subscribe("k3l_channel_rank", channel_ranks.request_reload)
@@ -0,0 +1,107 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Sequence
+
+from fastapi import HTTPException
+
+# (column, "ASC" | "DESC"); the last column must make the ordering unique
+OrderBy = list[tuple[str, str]]
+
+
+def _column_name(column: str) -> str:
+    # "ch.fid" -> "fid"
+    return column.rsplit(".", 1)[-1]
+
+
+def _encode_value(value: Any) -> Any:
+    # keep the python type so that asyncpg encodes the keyset params
+    # ... exactly like the column values it decoded
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+        raise ValueError(f"unknown cursor value {value}")
+    return value
+
+
+def encode_cursor(
+    order_by: OrderBy, values: Sequence[Any], as_of: datetime | None = None
+) -> str:
+    """Opaque token that resumes `order_by` right after the row with `values`."""
+    payload = {
+        "k": [_column_name(col) for col, _ in order_by],
+        "v": [_encode_value(v) for v in values],
+    }
+    if as_of is not None:
+        # ages and decayed scores of later pages are relative to this time
+        payload["t"] = as_of.isoformat()
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _payload(cursor: str) -> dict:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    return json.loads(raw)
+
+
+def decode_cursor(cursor: str, order_by: OrderBy) -> list[Any]:
+    """Keyset values from a token made by `encode_cursor` for the same ordering."""
+    try:
+        payload = _payload(cursor)
+        if payload["k"] != [_column_name(col) for col, _ in order_by]:
+            raise ValueError("cursor does not match sort order")
+        return [_decode_value(v) for v in payload["v"]]
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+
+def cursor_as_of(cursor: str | None) -> datetime | None:
+    """The time the first page was computed at, if the cursor carries one."""
+    if cursor is None:
+        return None
+    try:
+        as_of = _payload(cursor).get("t")
+        return datetime.fromisoformat(as_of) if as_of is not None else None
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+
+def next_cursor(order_by: OrderBy, rows: list, limit: int) -> str | None:
+    """Cursor for the page after `rows`, or None if this was the last page."""
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    values = [last[_column_name(col)] for col, _ in order_by]
+    return encode_cursor(order_by, values, last.get("as_of"))
+
+
+def keyset_sql(order_by: OrderBy, first_param: int) -> str:
+    """
+    Predicate selecting rows strictly after the cursor in `order_by`,
+    with the cursor values bound to $first_param, $first_param+1, ...
+    """
+    params = [f"${first_param + i}" for i in range(len(order_by))]
+    directions = {direction for _, direction in order_by}
+    if len(directions) == 1:
+        # uniform direction; a row comparison is index friendly
+        op = ">" if directions == {"ASC"} else "<"
+        columns = ", ".join(col for col, _ in order_by)
+        return f"({columns}) {op} ({', '.join(params)})"
+    clauses = []
+    for i, (col, direction) in enumerate(order_by):
+        op = ">" if direction == "ASC" else "<"
+        terms = [f"{c} = {p}" for (c, _), p in zip(order_by[:i], params)]
+        terms.append(f"{col} {op} {params[i]}")
+        clauses.append(f"({' AND '.join(terms)})")
+    return f"({' OR '.join(clauses)})"
@@ -0,0 +1,132 @@
+import asyncio
+import json
+from collections.abc import Callable
+
+import asyncpg
+from loguru import logger
+
+from ..config import settings
+from ..telemetry import DATA_VERSION
+from .replicas import replica_router
+from .tiered_cache import feed_cache
+
+# see pipeline/schema/k3l_data_versions.sql
+DATA_VERSION_CHANNEL = "k3l_data_version"
+
+# pipeline dataset -> feed cache namespaces computed from it
+DATASET_NAMESPACES: dict[str, tuple[str, ...]] = {
+    "k3l_rank": (),
+    "k3l_channel_rank": ("channel_feed",),
+    "k3l_channel_openrank_results": (),
+    "warpcast_channels_data": ("channel_feed",),
+}
+
+
+class DataVersions:
+    """
+    Latest published version of each pipeline dataset.
+    A new version of a dataset invalidates every feed cache namespace
+    computed from it by moving the namespace to a new version, which is
+    derived from its datasets' versions so that all replicas agree on it.
+    With read replicas, a new version is only applied once every replica
+    in rotation has replayed it, so that nothing computed from a lagging
+    replica is cached or validated under the new version.
+    """
+
+    def __init__(self) -> None:
+        self._versions: dict[str, int] = {}
+        self._pending: dict[str, int] = {}
+        self._subscribers: dict[str, list[Callable[[], None]]] = {}
+
+    def subscribe(self, dataset: str, callback: Callable[[], None]):
+        """Call `callback` whenever a newer version of `dataset` is published."""
+        self._subscribers.setdefault(dataset, []).append(callback)
+
+    def get(self, dataset: str) -> int:
+        return self._versions.get(dataset, 0)
+
+    def apply(self, dataset: str, version: int):
+        if version <= max(self.get(dataset), self._pending.get(dataset, 0)):
+            return
+        logger.info(f"{dataset} published version {version}")
+        if self.get(dataset) and replica_router.pools():
+            # replicas in rotation lag by at most DB_REPLICA_MAX_LAG_SECS as
+            # ... of their last check, DB_REPLICA_LAG_CHECK_SECS ago at most
+            delay = (
+                settings.DB_REPLICA_MAX_LAG_SECS + settings.DB_REPLICA_LAG_CHECK_SECS
+            )
+            self._pending[dataset] = version
+            asyncio.get_running_loop().call_later(delay, self._apply, dataset, version)
+            return
+        self._apply(dataset, version)
+
+    def _apply(self, dataset: str, version: int):
+        if version <= self.get(dataset):
+            return
+        if self._pending.get(dataset, 0) <= version:
+            self._pending.pop(dataset, None)
+        previous = self.get(dataset)
+        self._versions[dataset] = version
+        DATA_VERSION.labels(dataset=dataset).set(version)
+        for namespace in DATASET_NAMESPACES.get(dataset, ()):
+            feed_cache.set_version(namespace, self.namespace_version(namespace))
+        # the first version seen at startup is what was just loaded anyway
+        if previous:
+            for callback in self._subscribers.get(dataset, ()):
+                callback()
+
+    def namespace_version(self, namespace: str) -> str:
+        return ".".join(
+            str(self.get(dataset))
+            for dataset, namespaces in sorted(DATASET_NAMESPACES.items())
+            if namespace in namespaces
+        )
+
+    async def load(self, connection: asyncpg.Connection):
+        try:
+            rows = await connection.fetch(
+                "SELECT dataset, version FROM k3l_data_versions",
+                timeout=settings.POSTGRES_TIMEOUT_SECS,
+            )
+        except asyncpg.UndefinedTableError:
+            logger.warning("k3l_data_versions is missing; cache TTLs only")
+            return
+        for row in rows:
+            self.apply(row["dataset"], row["version"])
+
+    def on_notification(self, connection, pid: int, channel: str, payload: str):
+        try:
+            message = json.loads(payload)
+            self.apply(message["dataset"], int(message["version"]))
+        except Exception as e:
+            logger.error(f"Ignoring bad {channel} notification {payload!r}: {e}")
+
+
+async def listen_data_versions(versions: DataVersions, dsn: str):
+    """
+    Keeps a dedicated connection LISTENing for data version notifications.
+    Versions are reloaded after every (re)connect to catch up on
+    notifications missed while disconnected.
+    """
+    logger.info("Starting data version listener")
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(dsn)
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            await connection.add_listener(
+                DATA_VERSION_CHANNEL, versions.on_notification
+            )
+            await versions.load(connection)
+            await closed.wait()
+            logger.warning("Data version listener connection closed")
+        except Exception as e:
+            logger.error(f"Data version listener failed: {e}")
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(settings.DATA_VERSION_LISTEN_RETRY_SECS)
+
+
+data_versions = DataVersions()
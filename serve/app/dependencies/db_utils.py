@@ -1,20 +1,16 @@
 import asyncio
 import json
+import sys
 import time
-from collections.abc import Awaitable, Iterable
+from collections.abc import Iterable
 from datetime import UTC, datetime, timedelta
 from enum import Enum
 from typing import Any
 
+import asyncpg
 import pytz
 from asyncpg.pool import Pool
-from cashews import cache
 from loguru import logger
-from memoize.configuration import (
-    DefaultInMemoryCacheConfiguration,
-    MutableCacheConfiguration,
-)
-from memoize.wrapper import memoize
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -29,7 +25,21 @@ from app.models.feed_model import CastsTimeDecay, SortingOrder
 from app.models.score_model import ScoreAgg, Voting, Weights
 
 from ..config import DBVersion, settings
-from .memoize_utils import EncodedMethodNameAndArgsExcludedKeyExtractor
+from ..telemetry import acquire_timed, count_aborted_query, query_timer
+from .cast_action_store import cast_action_store
+from .cast_scoring import (
+    CHANNEL_MAX_PAIRS,
+    CastActions,
+    ChannelCastActions,
+    score_channel_casts,
+    score_neighbors_casts,
+    score_token_holder_casts,
+)
+from .cursor import OrderBy, keyset_sql
+from .deadlines import deadline, query_timeout_secs, shared_context
+from .replicas import QueryClass, replica_router
+from .slow_queries import slow_queries
+from .tiered_cache import feed_cache
 
 
 class DOW(Enum):
@@ -107,6 +117,52 @@ def sql_for_decay(
     """
 
 
+def channel_casts_order_by(sorting_order: SortingOrder) -> OrderBy:
+    # cast_hash breaks ties so that keyset cursors resume at a unique row.
+    # ages and time-decayed scores change with the clock, so feeds compute
+    # ... them relative to the as_of time that the first page stored in the
+    # ... cursor; later pages then see the same ranking as the first one.
+    # scores are aggregates, so the keyset predicate filters the scored feed:
+    # ... deep pages cost as much as OFFSET
+    match sorting_order:
+        case SortingOrder.SCORE | SortingOrder.POPULAR:
+            return [("cast_score", "DESC"), ("cast_hash", "DESC")]
+        case SortingOrder.RECENT:
+            return [("cast_ts", "DESC"), ("cast_hash", "DESC")]
+        case SortingOrder.HOUR:
+            return [("age_hours", "ASC"), ("cast_score", "DESC"), ("cast_hash", "DESC")]
+        case SortingOrder.DAY:
+            return [("age_days", "ASC"), ("cast_score", "DESC"), ("cast_hash", "DESC")]
+        case SortingOrder.REACTIONS:
+            return [
+                ("reaction_count", "DESC"),
+                ("cast_score", "DESC"),
+                ("cast_hash", "DESC"),
+            ]
+        case _:
+            return [("cast_score", "DESC"), ("cast_hash", "DESC")]
+
+
+def sql_for_order(order_by: OrderBy, shuffle: bool = False) -> str:
+    terms = [f"{col} {direction}" for col, direction in order_by]
+    if shuffle:
+        # shuffle within the leading bucket (hour, day, ...)
+        terms.insert(1, "random()")
+    return ", ".join(terms)
+
+
+def sql_for_as_of(param: int) -> str:
+    # the time that ages, decay and the lookback are relative to: the one a
+    # ... cursor carries over from the first page, else the query's now()
+    return f"COALESCE(${param}::timestamptz, now())"
+
+
+def sql_for_keyset(order_by: OrderBy, after: list | None, first_param: int) -> str:
+    if after is None:
+        return "TRUE"
+    return keyset_sql(order_by, first_param)
+
+
 def _9ampacific_in_utc_time():
     pacific_tz = pytz.timezone('US/Pacific')
     pacific_9am_str = ' '.join(
@@ -137,23 +193,224 @@ def _last_dow_utc_timestamp_str(dow: DOW):
     )
 
 
-async def fetch_rows(*args, sql_query: str, pool: Pool):
+def check_rows(rows: list, what: str) -> list:
+    """
+    `rows`, unless fetch_rows returned its error sentinel instead; raising
+    keeps a failed fetch out of the caches and gives callers a clear error.
+    """
+    if any(isinstance(row, set) for row in rows):
+        raise RuntimeError(f"failed to fetch {what}")
+    return rows
+
+
+def check_dict_rows(rows: list, what: str) -> list[dict]:
+    """
+    `check_rows` as dicts, for rows that are cached or kept in memory:
+    asyncpg Records are not picklable, which the shared cache tier requires.
+    """
+    return [dict(row) for row in check_rows(rows, what)]
+
+
+class _SharedQuery:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+# in-flight coalesced queries keyed on (pool, normalized sql, args)
+_inflight_queries: dict[tuple, _SharedQuery] = {}
+
+
+async def fetch_rows(
+    *args,
+    sql_query: str,
+    pool: Pool,
+    coalesce: bool = False,
+    timeout_secs: float | None = None,
+    query_name: str | None = None,
+    query_class: QueryClass = QueryClass.LATENCY,
+):
+    """
+    Run sql_query on a pooled connection.
+    With coalesce=True, concurrent calls with the same query and args
+    share one execution; only use it for read-only, caller-independent queries.
+    timeout_secs bounds that shared execution, POSTGRES_TIMEOUT_SECS by
+    default; the caller that starts it sets it for those that join it.
+    Each caller still stops waiting for it at its own request's deadline.
+    query_name labels the metrics and defaults to the calling function's name.
+    query_class picks the read replicas that queries on the primary pool go to.
+    """
+    if query_name is None:
+        query_name = sys._getframe(1).f_code.co_name
+    if coalesce:
+        return await _fetch_rows_coalesced(
+            *args,
+            sql_query=sql_query,
+            pool=pool,
+            timeout_secs=timeout_secs or settings.POSTGRES_TIMEOUT_SECS,
+            query_name=query_name,
+            query_class=query_class,
+        )
+    return await _fetch_rows(
+        *args,
+        sql_query=sql_query,
+        pool=pool,
+        query_name=query_name,
+        query_class=query_class,
+    )
+
+
+async def _fetch_rows_coalesced(
+    *args,
+    sql_query: str,
+    pool: Pool,
+    timeout_secs: float,
+    query_name: str,
+    query_class: QueryClass,
+):
+    key = (id(pool), " ".join(sql_query.split()), repr(args))
+    shared = _inflight_queries.get(key)
+    if shared is None:
+        shared = _SharedQuery(
+            asyncio.create_task(
+                _fetch_rows_with_timeout(
+                    *args,
+                    sql_query=sql_query,
+                    pool=pool,
+                    timeout_secs=timeout_secs,
+                    query_name=query_name,
+                    query_class=query_class,
+                ),
+                context=shared_context(),
+            )
+        )
+        _inflight_queries[key] = shared
+
+        def _forget(_):
+            if _inflight_queries.get(key) is shared:
+                del _inflight_queries[key]
+
+        shared.task.add_done_callback(_forget)
+    else:
+        logger.debug(f"coalescing query with {shared.waiters} waiter(s)")
+    shared.waiters += 1
+    try:
+        # shield so that a cancelled caller does not cancel it for the others;
+        # ... the shared task is not bound by any one caller's deadline,
+        # ... so each caller stops waiting at its own
+        async with asyncio.timeout(query_timeout_secs()):
+            rows = await asyncio.shield(shared.task)
+    except TimeoutError:
+        count_aborted_query(pool, query_name, "deadline")
+        logger.error(f"Request deadline passed while waiting for {query_name}")
+        return [{"Unknown error. Contact K3L team"}]
+    finally:
+        shared.waiters -= 1
+        if shared.waiters == 0 and not shared.task.done():
+            # nobody is waiting anymore; don't let late callers join a dying task
+            if _inflight_queries.get(key) is shared:
+                del _inflight_queries[key]
+            shared.task.cancel()
+    # callers get their own list; the rows themselves are immutable Records
+    return list(rows)
+
+
+async def _fetch_rows_with_timeout(
+    *args,
+    sql_query: str,
+    pool: Pool,
+    timeout_secs: float,
+    query_name: str,
+    query_class: QueryClass,
+):
+    # bounds pool acquisition too, which is where a stampede queues up;
+    # ... the deadline bounds the statement on the server as well
+    try:
+        async with asyncio.timeout(timeout_secs):
+            with deadline(timeout_secs):
+                return await _fetch_rows(
+                    *args,
+                    sql_query=sql_query,
+                    pool=pool,
+                    query_name=query_name,
+                    query_class=query_class,
+                )
+    except TimeoutError:
+        logger.error(f"Timed out executing coalesced query: {sql_query}")
+        return [{"Unknown error. Contact K3L team"}]
+
+
+async def _fetch_rows(
+    *args, sql_query: str, pool: Pool, query_name: str, query_class: QueryClass
+):
+    # route after coalescing so that identical queries share one replica
+    pool = replica_router.pool_for(pool, query_class)
     start_time = time.perf_counter()
     logger.debug(f"Execute query: {sql_query}")
-    # Take a connection from the pool.
-    async with pool.acquire() as connection:
-        logger.info(
-            f"db took {time.perf_counter() - start_time} secs for acquiring connection"
-        )
-        # Run the query passing the request argument.
-        try:
-            rows = await connection.fetch(
-                sql_query, *args, timeout=settings.POSTGRES_TIMEOUT_SECS
+    timeout_secs = query_timeout_secs()
+    try:
+        if timeout_secs <= 0:
+            raise TimeoutError()
+        # Take a connection from the pool.
+        # ... within the request's deadline if it has one
+        async with acquire_timed(
+            pool,
+            query_name,
+            timeout=(
+                timeout_secs if timeout_secs < settings.POSTGRES_TIMEOUT_SECS else None
+            ),
+        ) as connection:
+            acquired_time = time.perf_counter()
+            logger.info(
+                f"db took {acquired_time - start_time} secs for acquiring connection"
+            )
+            timeout_secs = query_timeout_secs()
+            if timeout_secs <= 0:
+                raise TimeoutError()
+            # Run the query passing the request argument.
+            try:
+                with query_timer(pool, query_name):
+                    # on timeout asyncpg also cancels the statement on the server
+                    rows = await connection.fetch(
+                        sql_query, *args, timeout=timeout_secs
+                    )
+            except asyncio.CancelledError:
+                # asyncpg sends the server a cancel request for the statement
+                count_aborted_query(pool, query_name, "cancelled")
+                raise
+            except (TimeoutError, asyncpg.QueryCanceledError) as e:
+                count_aborted_query(pool, query_name, "timeout")
+                slow_queries.record(
+                    pool,
+                    query_name,
+                    sql_query,
+                    args,
+                    duration_secs=time.perf_counter() - acquired_time,
+                    pool_wait_secs=acquired_time - start_time,
+                    rows=None,
+                    error="timeout",
+                )
+                logger.error(f"Timed out after {timeout_secs} secs: {sql_query}")
+                logger.error(f"{e}")
+                return [{"Unknown error. Contact K3L team"}]
+            except Exception as e:
+                logger.error(f"Failed to execute query: {sql_query}")
+                logger.error(f"{e}")
+                return [{"Unknown error. Contact K3L team"}]
+            slow_queries.record(
+                pool,
+                query_name,
+                sql_query,
+                args,
+                duration_secs=time.perf_counter() - acquired_time,
+                pool_wait_secs=acquired_time - start_time,
+                rows=len(rows),
             )
-        except Exception as e:
-            logger.error(f"Failed to execute query: {sql_query}")
-            logger.error(f"{e}")
-            return [{"Unknown error. Contact K3L team"}]
+    except TimeoutError:
+        # the request ran out of time before the query could start
+        count_aborted_query(pool, query_name, "deadline")
+        logger.error(f"Request deadline passed before running {query_name}")
+        return [{"Unknown error. Contact K3L team"}]
     logger.info(f"db took {time.perf_counter() - start_time} secs for {len(rows)} rows")
     return rows
 
@@ -858,6 +1115,23 @@ async def get_fid_channel_token_balance(channel_id: str, fid: int, pool: Pool):
     return None
 
 
+async def get_channel_token_balances(updated_since: datetime | None, pool: Pool):
+    if updated_since is None:
+        sql_query = """
+            SELECT fid, channel_id, balance, latest_earnings, insert_ts, update_ts
+            FROM k3l_channel_tokens_bal
+        """
+        return await fetch_rows(
+            sql_query=sql_query, pool=pool, query_class=QueryClass.HEAVY
+        )
+    sql_query = """
+        SELECT fid, channel_id, balance, latest_earnings, insert_ts, update_ts
+        FROM k3l_channel_tokens_bal
+        WHERE update_ts >= $1
+    """
+    return await fetch_rows(updated_since, sql_query=sql_query, pool=pool)
+
+
 async def get_points_distrib_preview(
     channel_id: str, offset: int, limit: int, pool: Pool
 ):
@@ -961,11 +1235,29 @@ async def get_tokens_distrib_preview(
     return await fetch_rows(channel_id, offset, limit, sql_query=sql_query, pool=pool)
 
 
+CHANNEL_PROFILES_ORDER_BY: OrderBy = [("rank", "ASC"), ("ch.fid", "ASC")]
+
+
 async def get_top_channel_profiles(
-    channel_id: str, strategy_name: str, offset: int, limit: int, lite: bool, pool: Pool
+    channel_id: str,
+    strategy_name: str,
+    offset: int,
+    limit: int,
+    lite: bool,
+    pool: Pool,
+    after: list | None = None,
 ):
+    if after is None:
+        # a full page even if ranks have gaps or ties, so that a short page
+        # ... reliably means the last one
+        page_sql = "rank > $3"
+        limit_sql = "LIMIT $4"
+    else:
+        # resume after the cursor's (rank, fid); offset is relative to it
+        page_sql = keyset_sql(CHANNEL_PROFILES_ORDER_BY, first_param=5)
+        limit_sql = "OFFSET $3 LIMIT $4"
     if lite:
-        sql_query = """
+        sql_query = f"""
         SELECT
             ch.fid,
             rank
@@ -973,11 +1265,12 @@ async def get_top_channel_profiles(
         WHERE
             channel_id = $1
             AND strategy_name = $2
-            AND rank > $3 AND rank <= ($3 + $4)
-        ORDER BY rank ASC
+            AND {page_sql}
+        ORDER BY rank ASC, ch.fid ASC
+        {limit_sql}
         """
     else:
-        sql_query = """
+        sql_query = f"""
         WITH total AS (
             SELECT count(*) as total from k3l_channel_rank
             WHERE channel_id = $1
@@ -990,6 +1283,18 @@ async def get_top_channel_profiles(
             SELECT v.claim->>'address' as address, fid
             FROM verifications v
         ),
+        -- the page is taken before the joins, which give several rows per fid
+        page as (
+            SELECT ch.fid, rank, score
+            FROM k3l_channel_rank as ch
+            WHERE
+                ch.channel_id = $1
+                AND
+                ch.strategy_name=$2
+                AND {page_sql}
+            ORDER BY rank ASC, ch.fid ASC
+            {limit_sql}
+        ),
         top_records as (
             SELECT
                 ch.fid,
@@ -1008,18 +1313,12 @@ async def get_top_channel_profiles(
                 END as daily_earnings,
                 bal.latest_earnings as latest_earnings,
                 bal.update_ts as bal_update_ts
-            FROM k3l_channel_rank as ch
+            FROM page as ch
             CROSS JOIN total
             LEFT JOIN fnames on (fnames.fid = ch.fid)
             LEFT JOIN user_data on (user_data.fid = ch.fid)
             LEFT JOIN k3l_channel_points_bal as bal 
-                on (bal.channel_id=ch.channel_id and bal.fid=ch.fid)
-            WHERE
-                ch.channel_id = $1
-                AND
-                ch.strategy_name=$2
-                AND rank > $3 AND rank <= ($3 + $4)
-            ORDER BY rank ASC
+                on (bal.channel_id=$1 and bal.fid=ch.fid)
         ),
         mapped_records as (
             SELECT top_records.*,addresses.address
@@ -1041,10 +1340,17 @@ async def get_top_channel_profiles(
             any_value(bal_update_ts) as bal_update_ts
         FROM mapped_records
         GROUP BY fid
-        ORDER by rank ASC
+        ORDER by rank ASC, fid ASC
         """
     return await fetch_rows(
-        channel_id, strategy_name, offset, limit, sql_query=sql_query, pool=pool
+        channel_id,
+        strategy_name,
+        offset,
+        limit,
+        *(after or []),
+        sql_query=sql_query,
+        pool=pool,
+        coalesce=True,
     )
 
 
@@ -1475,6 +1781,39 @@ async def get_popular_neighbors_casts(
             cast_score
         """
 
+    if settings.CAST_ACTION_STORE_ENABLED and cast_action_store.covers(
+        timedelta(days=5)
+    ):
+        now = time.time()
+        actions = cast_action_store.actions_of(
+            (row['fid'] for row in trust_scores),
+            since=now - timedelta(days=5).total_seconds(),
+            until=now - timedelta(minutes=10).total_seconds(),
+        )
+        cast_hashes, cast_scores = score_neighbors_casts(
+            actions, trust_scores, now, agg, weights
+        )
+        sql_query = f"""
+            SELECT {resp_fields}
+            FROM k3l_recent_parent_casts as casts
+            INNER JOIN unnest($1::bytea[], $2::float8[])
+                AS scores(cast_hash, cast_score)
+                ON casts.hash = scores.cast_hash
+            WHERE deleted_at IS NULL
+            ORDER BY casts.timestamp DESC, scores.cast_score DESC
+            OFFSET $3
+            LIMIT $4
+        """
+        return await fetch_rows(
+            cast_hashes,
+            cast_scores,
+            offset,
+            limit,
+            sql_query=sql_query,
+            pool=pool,
+            query_class=QueryClass.HEAVY,
+        )
+
     sql_query = f"""
         with fid_cast_scores as (
             SELECT
@@ -1529,7 +1868,12 @@ async def get_popular_neighbors_casts(
     select {resp_fields} from cast_details
     """
     return await fetch_rows(
-        json.dumps(trust_scores), offset, limit, sql_query=sql_query, pool=pool
+        json.dumps(trust_scores),
+        offset,
+        limit,
+        sql_query=sql_query,
+        pool=pool,
+        query_class=QueryClass.HEAVY,
     )
 
 
@@ -1563,7 +1907,7 @@ async def get_recent_neighbors_casts(
                            CastsTimeDecay.HOUR,
                            base=(1 - 1 / (365 * 24)))}
             * trust.score as cast_score,
-        row_number() over(partition by date_trunc('hour', casts.timestamp) order by random()) as rn
+        row_number() over(partition by DATE_TRUNC('hour', casts.timestamp) order by random()) as rn
         FROM k3l_recent_parent_casts as casts
         INNER JOIN  json_to_recordset($1::json)
             AS trust(fid int, score numeric)
@@ -1609,22 +1953,89 @@ async def get_token_balances(
     return await fetch_rows(token_address, fids, sql_query=sql_query, pool=pool)
 
 
-TOKEN_FEED_CACHE_SIZE = 1000
-TOKEN_FEED_CACHE_TTL = timedelta(minutes=5)
-
-
-# TODO(ek) - move setup to somewhere more suitable
-cache.setup("disk://", directory="/tmp/farcaster-serve-diskcache")
-
-refresh_tasks: set[asyncio.Task] = set()
+async def get_token_holders(token_address: bytes, pool: Pool):
+    sql_query = """
+        SELECT fid, value
+        FROM k3l_token_holding_fids
+        WHERE token_address = $1::bytea AND value > 0
+    """
+    return await fetch_rows(
+        token_address, sql_query=sql_query, pool=pool, query_class=QueryClass.HEAVY
+    )
 
 
-async def schedule_refresh(aw: Awaitable):
-    try:
-        await asyncio.sleep(settings.TOKEN_FEED_CACHE_EARLY_TTL.total_seconds())
-        await aw
-    finally:
-        refresh_tasks.discard(asyncio.current_task())
+@feed_cache.early(
+    namespace="token_feed_base",
+    ttl=settings.TOKEN_FEED_CACHE_TTL,
+    early_ttl=settings.TOKEN_FEED_CACHE_EARLY_TTL,
+)
+async def get_token_holder_cast_actions(
+    token_address: bytes,
+    max_cast_age: timedelta,
+    pool: Pool,
+) -> CastActions:
+    """
+    Holders' actions on recent casts by holders of a token, unweighted.
+    Shared by every weighting, decay and sorting of the token holder feed.
+    """
+    now = datetime.now(UTC).replace(tzinfo=None)
+    min_timestamp = now - max_cast_age
+    sql_query = """
+                WITH c AS (
+                    SELECT
+                        hash,
+                        fid,
+                        timestamp,
+                        th.value AS balance_raw
+                    FROM k3l_recent_parent_casts c
+                    JOIN k3l_token_holding_fids th USING (fid)
+                    WHERE
+                        c.timestamp BETWEEN $2::timestamp AND $3::timestamp AND
+                        th.token_address = $1::bytea AND th.value > 0
+                ),
+                ca AS (
+                    SELECT
+                        ca.cast_hash AS hash,
+                        h.value::float8 AS value,
+                        ca.casted,
+                        ca.recasted,
+                        ca.replied,
+                        ca.liked,
+                        EXTRACT(EPOCH FROM $3 - ca.action_ts)::float8 AS age
+                    FROM k3l_cast_action_v1 AS ca
+                    JOIN k3l_token_holding_fids AS h USING (fid)
+                    WHERE
+                        action_ts BETWEEN $2::timestamp AND $3::timestamp AND
+                        token_address = $1::bytea AND
+                        value > 0 AND
+                        fid NOT IN (SELECT fid FROM k3l_action_discounted_fids)
+                )
+                SELECT
+                    '0x' || encode(c.hash, 'hex') AS cast_hash,
+                    c.fid,
+                    c.timestamp,
+                    c.balance_raw,
+                    array_agg(ca.value) AS action_values,
+                    array_agg(ca.casted) AS casted,
+                    array_agg(ca.recasted) AS recasted,
+                    array_agg(ca.replied) AS replied,
+                    array_agg(ca.liked) AS liked,
+                    array_agg(ca.age) AS action_ages
+                FROM c
+                JOIN ca USING (hash)
+                GROUP BY c.hash, c.fid, c.timestamp, c.balance_raw
+                """
+    # not coalesced, as no two calls share `now`; the feed cache shares
+    # ... one computation between concurrent callers instead
+    rows = await fetch_rows(
+        token_address,
+        min_timestamp,
+        now,
+        sql_query=sql_query,
+        pool=pool,
+        query_class=QueryClass.HEAVY,
+    )
+    return CastActions.from_rows(now, check_rows(rows, "token holder cast actions"))
 
 
 async def _get_token_holder_casts_all(
@@ -1640,129 +2051,69 @@ async def _get_token_holder_casts_all(
     limit_casts: int | None,
     pool: Pool,
 ) -> list[dict[str, Any]]:
-    decay_sql = sql_for_decay(
-        "$4 - ca.action_ts", time_decay_period, base=time_decay_base
+    actions = await get_token_holder_cast_actions(
+        token_address=token_address, max_cast_age=max_cast_age, pool=pool
     )
-    agg_sql = sql_for_agg(
-        agg,
-        f"""
-        h.value * (
-            {weights.cast}   * ca.casted +
-            {weights.recast} * ca.recasted +
-            {weights.reply}  * ca.replied +
-            {weights.like}   * ca.liked
-        ) * {decay_sql}
-    """,
+    return score_token_holder_casts(
+        actions,
+        agg=agg,
+        weights=weights,
+        score_threshold=score_threshold,
+        time_decay_base=time_decay_base,
+        time_decay_period=time_decay_period,
+        sorting_order=sorting_order,
+        time_bucket_length=time_bucket_length,
+        limit_casts=limit_casts,
     )
-    now = datetime.now(UTC).replace(tzinfo=None)
-    min_timestamp = now - max_cast_age
-    match sorting_order:
-        case SortingOrder.SCORE | SortingOrder.POPULAR:
-            order_by = f"ORDER BY score DESC"
-        case SortingOrder.RECENT:
-            order_by = f"ORDER BY timestamp DESC"
-        case SortingOrder.TIME_BUCKET:
-            order_by = f"ORDER BY time_bucket ASC, score DESC"
-        case SortingOrder.HOUR:
-            order_by = f"ORDER BY time_bucket ASC, score DESC"
-            time_bucket_length = timedelta(hours=1)
-        case SortingOrder.DAY:
-            order_by = f"ORDER BY time_bucket ASC, score DESC"
-            time_bucket_length = timedelta(days=1)
-        case SortingOrder.BALANCE:
-            order_by = f"ORDER BY time_bucket ASC, balance_raw DESC, score DESC"
-            if limit_casts is None:
-                limit_casts = 3
-        case _:
-            order_by = f"ORDER BY score DESC"
-    if limit_casts is None:
-        limit_casts_condition = ""
-    else:
-        limit_casts_condition = f"AND rn <= {limit_casts}"
-    sql_query = f"""
-                WITH cs AS (
-                    SELECT
-                        ca.cast_hash AS hash,
-                        {agg_sql} AS score
-                    FROM k3l_cast_action_v1 AS ca
-                    JOIN k3l_token_holding_fids AS h USING (fid)
-                    WHERE
-                        action_ts BETWEEN $3::timestamp AND $4::timestamp AND
-                        token_address = $1::bytea AND
-                        value > 0 AND
-                        fid NOT IN (SELECT fid FROM k3l_action_discounted_fids)
-                    GROUP BY ca.cast_hash
-                ),
-                c AS (
-                    SELECT
-                        hash,
-                        fid,
-                        timestamp,
-                        floor(extract(epoch from $4 - timestamp) / {time_bucket_length.total_seconds()}) AS time_bucket,
-                        row_number() OVER (PARTITION BY floor(extract(epoch from $4 - timestamp) / {time_bucket_length.total_seconds()}), fid ORDER BY score DESC) AS rn,
-                        value AS balance_raw,
-                        cs.score AS score
-                    FROM k3l_recent_parent_casts c
-                    JOIN cs USING (hash)
-                    JOIN k3l_token_holding_fids th USING (fid)
-                    WHERE
-                        c.timestamp BETWEEN $3::timestamp AND $4::timestamp AND
-                        th.token_address = $1::bytea AND th.value > 0
-                )
-                SELECT
-                    '0x' || encode(hash, 'hex') AS cast_hash,
-                    fid,
-                    timestamp,
-                    balance_raw,
-                    score AS cast_score
-                FROM c
-                WHERE
-                    score >= (SELECT percentile_cont($2) WITHIN GROUP (ORDER BY score DESC) FROM c)
-                    {limit_casts_condition}
-                {order_by}
-                """
 
-    return [
-        dict(r)
-        for r in await fetch_rows(
-            token_address,
-            score_threshold,
-            min_timestamp,
-            now,
-            sql_query=sql_query,
-            pool=pool,
-        )
-    ]
+
+# cursor for the cached token and new-user feeds: (position, cast_hash)
+CACHED_FEED_ORDER_BY: OrderBy = [("position", "ASC"), ("cast_hash", "ASC")]
+
+
+def _position_after(all_casts: list[dict[str, Any]], after: list | None) -> int:
+    """Index right after the cursor's cast in a cached feed list."""
+    if after is None:
+        return 0
+    position, cast_hash = after
+    # the cast is usually still where the cursor saw it,
+    # ... unless the cached list has been refreshed since
+    if position < len(all_casts) and all_casts[position]["cast_hash"] == cast_hash:
+        return position + 1
+    for idx, cast in enumerate(all_casts):
+        if cast["cast_hash"] == cast_hash:
+            return idx + 1
+    return position + 1
+
+
+def _page_cached_feed(
+    all_casts: list[dict[str, Any]], offset: int, limit: int, after: list | None
+) -> tuple[list[dict[str, Any]], list | None]:
+    """One page of a cached feed list and the keyset values of its last cast."""
+    start = _position_after(all_casts, after) + offset
+    rows = all_casts[start : (start + limit)]
+    if len(rows) < limit:
+        return rows, None
+    last = start + len(rows) - 1
+    return rows, [last, all_casts[last]["cast_hash"]]
 
 
 # TODO(ek) fix copy-pastism
-@cache.early(
-    ttl=settings.TOKEN_FEED_CACHE_TTL, early_ttl=settings.TOKEN_FEED_CACHE_EARLY_TTL
+@feed_cache.early(
+    namespace="token_feed",
+    ttl=settings.TOKEN_FEED_CACHE_TTL,
+    early_ttl=settings.TOKEN_FEED_CACHE_EARLY_TTL,
 )
 async def get_token_holder_casts_all(*poargs, **kwargs) -> list[dict[str, Any]]:
-    loop = asyncio.get_running_loop()
-    start_time = loop.time()
-    result = [dict(row) for row in await _get_token_holder_casts_all(*poargs, **kwargs)]
-    end_time = loop.time()
-    elapsed = end_time - start_time
-    if timedelta(seconds=elapsed) > settings.TOKEN_FEED_CACHE_REFRESH_THRESHOLD:
-        logger.debug(
-            f"slow token feed {kwargs=}, scheduling preemptive refresh in {settings.TOKEN_FEED_CACHE_EARLY_TTL}"
-        )
-        refresh_task = asyncio.create_task(
-            schedule_refresh(get_token_holder_casts_all(*poargs, **kwargs))
-        )
-        refresh_tasks.add(refresh_task)
-        refresh_task.add_done_callback(refresh_tasks.discard)
-    return result
+    return [dict(row) for row in await _get_token_holder_casts_all(*poargs, **kwargs)]
 
 
 # TODO(ek) fix copy-pastism
 async def get_token_holder_casts(
-    *poargs, offset: int, limit: int, **kwargs
-) -> list[dict[str, Any]]:
+    *poargs, offset: int, limit: int, after: list | None = None, **kwargs
+) -> tuple[list[dict[str, Any]], list | None]:
     all_casts = await get_token_holder_casts_all(*poargs, **kwargs)
-    return all_casts[offset : (offset + limit)]
+    return _page_cached_feed(all_casts, offset, limit, after)
 
 
 async def _get_new_user_casts_all(
@@ -1835,47 +2186,36 @@ async def _get_new_user_casts_all(
                 ORDER BY timestamp DESC
                 """
 
-    return [
-        dict(r)
-        for r in await fetch_rows(
-            channel_id,
-            min_timestamp,
-            now,
-            now - caster_age,
-            sql_query=sql_query,
-            pool=pool,
-        )
-    ]
+    rows = await fetch_rows(
+        channel_id,
+        min_timestamp,
+        now,
+        now - caster_age,
+        sql_query=sql_query,
+        pool=pool,
+        # not coalesced, as no two calls share `now`; the feed cache
+        # ... shares one computation between concurrent callers instead
+        query_class=QueryClass.HEAVY,
+    )
+    return check_dict_rows(rows, "new user casts")
 
 
 # TODO(ek) fix copy-pastism
-@cache.early(
-    ttl=settings.TOKEN_FEED_CACHE_TTL, early_ttl=settings.TOKEN_FEED_CACHE_EARLY_TTL
+@feed_cache.early(
+    namespace="new_user_feed",
+    ttl=settings.TOKEN_FEED_CACHE_TTL,
+    early_ttl=settings.TOKEN_FEED_CACHE_EARLY_TTL,
 )
 async def get_new_user_casts_all(*poargs, **kwargs) -> list[dict[str, Any]]:
-    loop = asyncio.get_running_loop()
-    start_time = loop.time()
-    result = [dict(row) for row in await _get_new_user_casts_all(*poargs, **kwargs)]
-    end_time = loop.time()
-    elapsed = end_time - start_time
-    if timedelta(seconds=elapsed) > settings.TOKEN_FEED_CACHE_REFRESH_THRESHOLD:
-        logger.debug(
-            f"slow new user feed {kwargs=}, scheduling preemptive refresh in {settings.TOKEN_FEED_CACHE_EARLY_TTL}"
-        )
-        refresh_task = asyncio.create_task(
-            schedule_refresh(get_new_user_casts_all(*poargs, **kwargs))
-        )
-        refresh_tasks.add(refresh_task)
-        refresh_task.add_done_callback(refresh_tasks.discard)
-    return result
+    return [dict(row) for row in await _get_new_user_casts_all(*poargs, **kwargs)]
 
 
 # TODO(ek) fix copy-pastism
 async def get_new_user_casts(
-    *poargs, offset: int, limit: int, **kwargs
-) -> list[dict[str, Any]]:
+    *poargs, offset: int, limit: int, after: list | None = None, **kwargs
+) -> tuple[list[dict[str, Any]], list | None]:
     all_casts = await get_new_user_casts_all(*poargs, **kwargs)
-    return all_casts[offset : (offset + limit)]
+    return _page_cached_feed(all_casts, offset, limit, after)
 
 
 async def get_popular_degen_casts(
@@ -1942,43 +2282,157 @@ async def get_popular_degen_casts(
         FROM cast_details
         WHERE row_num between $1 and $2;
     """
-    return await fetch_rows(offset, limit, sql_query=sql_query, pool=pool)
+    return await fetch_rows(
+        offset, limit, sql_query=sql_query, pool=pool, query_class=QueryClass.HEAVY
+    )
 
 
-async def get_channel_ids_for_fid(fid: int, limit: int, pool: Pool):
+async def get_channel_ids_for_fid(
+    fid: int, limit: int, strategy_name: str, pool: Pool
+):
+    """
+    The channels that the fid follows, those where it ranks best first;
+    callers that cut off the fan-out over them drop the least relevant ones.
+    """
     sql_query = """
         SELECT
-            channel_id
+            followers.channel_id
         FROM
-            warpcast_followers
+            warpcast_followers AS followers
+        LEFT JOIN k3l_channel_rank AS ranks
+            ON (ranks.channel_id = followers.channel_id
+                AND ranks.fid = followers.fid
+                AND ranks.strategy_name = $3)
         WHERE
-            fid=$1
-        ORDER BY RANDOM()
+            followers.fid=$1
+        ORDER BY ranks.rank ASC NULLS LAST, followers.channel_id
         LIMIT $2
     """
-    return await fetch_rows(fid, limit, sql_query=sql_query, pool=pool)
+    return await fetch_rows(fid, limit, strategy_name, sql_query=sql_query, pool=pool)
 
 
-async def get_channel_url_for_channel_id(channel_id: int, pool: Pool):
-    sql_query = """
-        SELECT
-            url
-        FROM
-            warpcast_channels_data
-        WHERE
-            id=$1
-    """
-    return await fetch_rows(channel_id, sql_query=sql_query, pool=pool)
+CHANNEL_METADATA_SQL = f"""
+    SELECT
+        id,
+        url,
+        name,
+        description,
+        imageurl,
+        headerimageurl,
+        leadfid,
+        moderatorfids,
+        followercount
+        {', pinnedcasthash' if settings.DB_VERSION == DBVersion.EIGEN2 else ''}
+    FROM
+        warpcast_channels_data
+"""
 
 
-@memoize(
-    configuration=MutableCacheConfiguration.initialized_with(
-        DefaultInMemoryCacheConfiguration()
-    ).set_key_extractor(
-        EncodedMethodNameAndArgsExcludedKeyExtractor(
-            skip_first_arg_as_self=False, skip_args=[13], skip_kwargs=["pool"]
+async def get_all_channels_metadata(pool: Pool):
+    return await fetch_rows(sql_query=CHANNEL_METADATA_SQL, pool=pool, coalesce=True)
+
+
+async def get_channel_metadata_for_channel_id(channel_id: str, pool: Pool):
+    sql_query = f"{CHANNEL_METADATA_SQL} WHERE id=$1"
+    return await fetch_rows(channel_id, sql_query=sql_query, pool=pool, coalesce=True)
+
+
+async def get_channel_metadata_for_url(url: str, pool: Pool):
+    sql_query = f"{CHANNEL_METADATA_SQL} WHERE url=$1"
+    return await fetch_rows(url, sql_query=sql_query, pool=pool, coalesce=True)
+
+
+@feed_cache.early(
+    namespace="channel_feed",
+    ttl=settings.CHANNEL_FEED_CACHE_TTL,
+    early_ttl=settings.CHANNEL_FEED_CACHE_EARLY_TTL,
+)
+async def get_channel_cast_actions(
+    channel_id: str,
+    channel_url: str,
+    strategy_name: str,
+    max_cast_age: str,
+    pool: Pool,
+) -> ChannelCastActions:
+    """
+    Actions of ranked, unbanned fids on a channel's casts within the lookback.
+    Shared by every weighting, aggregation and sorting of the popular and
+    trending channel feeds, so only their working set is fetched: actions
+    on casts made within the lookback (trending), and those of the most
+    recent CHANNEL_MAX_PAIRS (cast, fid) pairs (popular). The pair cap
+    is widened by the pairs made in the last CHANNEL_FEED_CACHE_TTL, which
+    pages anchored before this fetch leave out.
+    """
+    now = time.time()
+    sql_query = f"""
+        WITH actions AS (
+            SELECT
+                casts.hash AS cast_hash,
+                casts.timestamp AS cast_ts,
+                casts.timestamp > now() - interval '{max_cast_age}' AS in_window,
+                ci.fid,
+                coalesce(fids.score, 0) AS fid_score,
+                ci.casted,
+                ci.recasted,
+                ci.replied,
+                ci.liked,
+                ci.action_ts
+            FROM k3l_recent_parent_casts as casts
+            INNER JOIN k3l_cast_action as ci
+                ON (ci.cast_hash = casts.hash
+                    AND ci.action_ts > now() - interval '{max_cast_age}'
+                    AND casts.root_parent_url = $2)
+            INNER JOIN k3l_channel_rank as fids
+                ON (fids.channel_id=$1 AND fids.fid = ci.fid AND fids.strategy_name=$3)
+            LEFT JOIN automod_data as md ON (md.channel_id=$1 AND md.affected_userid=ci.fid AND md.action='ban')
+            LEFT JOIN cura_hidden_fids as hids ON (hids.hidden_fid=ci.fid AND hids.channel_id=$1)
+            WHERE md.affected_userid IS NULL AND hids.hidden_fid IS NULL
+        )
+        , pairs AS (
+            SELECT
+                cast_hash,
+                fid,
+                ROW_NUMBER() OVER (ORDER BY MIN(action_ts) DESC) AS recency,
+                COUNT(*) FILTER (WHERE MIN(action_ts) > now() - $5::interval) OVER () AS recent
+            FROM actions
+            GROUP BY cast_hash, fid
         )
+        SELECT
+            '0x' || encode(actions.cast_hash, 'hex') AS cast_hash,
+            actions.cast_ts,
+            EXTRACT(EPOCH FROM actions.cast_ts)::float8 AS cast_epoch,
+            actions.in_window,
+            array_agg(actions.fid) AS fids,
+            array_agg(actions.fid_score) AS fid_scores,
+            array_agg(actions.casted) AS casted,
+            array_agg(actions.recasted) AS recasted,
+            array_agg(actions.replied) AS replied,
+            array_agg(actions.liked) AS liked,
+            array_agg(EXTRACT(EPOCH FROM actions.action_ts)::float8) AS action_ts
+        FROM actions
+        LEFT JOIN pairs
+            ON (pairs.cast_hash = actions.cast_hash AND pairs.fid = actions.fid)
+        WHERE actions.in_window OR pairs.recency <= $4 + pairs.recent
+        GROUP BY actions.cast_hash, actions.cast_ts, actions.in_window
+    """
+    rows = await fetch_rows(
+        channel_id,
+        channel_url,
+        strategy_name,
+        CHANNEL_MAX_PAIRS,
+        settings.CHANNEL_FEED_CACHE_TTL,
+        sql_query=sql_query,
+        pool=pool,
+        coalesce=True,
+        query_class=QueryClass.HEAVY,
     )
+    return ChannelCastActions.from_rows(now, check_rows(rows, "channel cast actions"))
+
+
+@feed_cache.early(
+    namespace="channel_feed",
+    ttl=settings.CHANNEL_FEED_CACHE_TTL,
+    early_ttl=settings.CHANNEL_FEED_CACHE_EARLY_TTL,
 )
 async def get_popular_channel_casts_lite(
     channel_id: str,
@@ -1995,26 +2449,50 @@ async def get_popular_channel_casts_lite(
     limit: int,
     sorting_order: SortingOrder,
     pool: Pool,
+    after: list | None = None,
+    as_of: datetime | None = None,
+    fresh_actions: bool = False,
 ):
+    """
+    fresh_actions fetches the channel's actions afresh instead of from the
+    feed cache, for callers that bypass the cache to recompute the feed.
+    """
     logger.info("get_popular_channel_casts_lite")
 
+    order_by = channel_casts_order_by(sorting_order)
+    if settings.CHANNEL_FEED_SCORING_IN_PROCESS:
+        get_actions = get_channel_cast_actions
+        if fresh_actions:
+            get_actions = get_channel_cast_actions.__wrapped__
+        actions = await get_actions(
+            channel_id=channel_id,
+            channel_url=channel_url,
+            strategy_name=strategy_name,
+            max_cast_age=max_cast_age,
+            pool=pool,
+        )
+        return score_channel_casts(
+            actions,
+            agg=agg,
+            score_threshold=score_threshold,
+            reactions_threshold=reactions_threshold,
+            weights=weights,
+            time_decay=time_decay,
+            normalize=normalize,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            after=after,
+            as_of=as_of,
+        )
+
     agg_sql = sql_for_agg(agg, 'fid_cast_scores.cast_score')
 
-    match sorting_order:
-        case SortingOrder.SCORE | SortingOrder.POPULAR:
-            order_sql = 'cast_score DESC'
-        case SortingOrder.RECENT:
-            order_sql = 'cast_ts DESC'
-        case SortingOrder.HOUR:
-            order_sql = "age_hours ASC, cast_score DESC"
-        case SortingOrder.DAY:
-            order_sql = "age_days ASC, cast_score DESC"
-        case SortingOrder.REACTIONS:
-            order_sql = "reaction_count DESC, cast_score DESC"
-        case _:
-            order_sql = 'cast_score DESC'
+    order_sql = sql_for_order(order_by)
+    cursor_sql = sql_for_keyset(order_by, after, first_param=7)
 
-    decay_sql = sql_for_decay("CURRENT_TIMESTAMP - ci.action_ts", time_decay)
+    as_of_sql = sql_for_as_of(6)
+    decay_sql = sql_for_decay(f"{as_of_sql} - ci.action_ts", time_decay)
 
     if normalize:
         fidscore_sql = 'cbrt(fids.score)'
@@ -2039,7 +2517,8 @@ async def get_popular_channel_casts_lite(
             FROM k3l_recent_parent_casts as casts
             INNER JOIN k3l_cast_action as ci
                 ON (ci.cast_hash = casts.hash
-                    AND ci.action_ts > now() - interval '{max_cast_age}'
+                    AND ci.action_ts > {as_of_sql} - interval '{max_cast_age}'
+                    AND ci.action_ts <= {as_of_sql}
                     AND casts.root_parent_url = $2)
             INNER JOIN k3l_channel_rank as fids 
                 ON (fids.channel_id=$1 AND fids.fid = ci.fid AND fids.strategy_name=$3)
@@ -2059,29 +2538,47 @@ async def get_popular_channel_casts_lite(
             FROM fid_cast_scores
             GROUP BY cast_hash
         )
+        , feed AS (
+            SELECT
+                '0x' || encode(cast_hash, 'hex') as cast_hash,
+                FLOOR(EXTRACT(EPOCH FROM ({as_of_sql} - cast_ts))/3600) as age_hours,
+                FLOOR(EXTRACT(EPOCH FROM ({as_of_sql} - cast_ts))/(60 * 60 * 24)::numeric) AS age_days,
+                cast_ts,
+                cast_score,
+                reaction_count
+            FROM scores
+            WHERE
+                cast_score >= {score_threshold}
+                AND reaction_count >= {reactions_threshold}
+        )
     SELECT
-        '0x' || encode(cast_hash, 'hex') as cast_hash,
-        FLOOR(EXTRACT(EPOCH FROM (now() - cast_ts))/3600) as age_hours,
-        FLOOR(EXTRACT(EPOCH FROM (now() - cast_ts))/(60 * 60 * 24)::numeric) AS age_days,
-        cast_ts, 
-        cast_score
-    FROM scores
-    WHERE
-        cast_score >= {score_threshold}
-        AND reaction_count >= {reactions_threshold}
+        cast_hash,
+        age_hours,
+        age_days,
+        cast_ts,
+        cast_score,
+        reaction_count,
+        {as_of_sql} AS as_of
+    FROM feed
+    WHERE {cursor_sql}
     ORDER BY {order_sql}
     OFFSET $4
     LIMIT $5
     """
-    return await fetch_rows(
+    rows = await fetch_rows(
         channel_id,
         channel_url,
         strategy_name,
         offset,
         limit,
+        as_of,
+        *(after or []),
         sql_query=sql_query,
         pool=pool,
+        coalesce=True,
+        query_class=QueryClass.HEAVY,
     )
+    return check_dict_rows(rows, "popular channel casts")
 
 
 # TODO deprecate in favor of get_popular_channel_casts_lite
@@ -2100,25 +2597,18 @@ async def get_popular_channel_casts_heavy(
     limit: int,
     sorting_order: SortingOrder,
     pool: Pool,
+    after: list | None = None,
+    as_of: datetime | None = None,
 ):
     logger.info("get_popular_channel_casts_heavy")
     agg_sql = sql_for_agg(agg, 'fid_cast_scores.cast_score')
 
-    match sorting_order:
-        case SortingOrder.SCORE | SortingOrder.POPULAR:
-            order_sql = 'cast_score DESC'
-        case SortingOrder.RECENT:
-            order_sql = 'cast_ts DESC'
-        case SortingOrder.HOUR:
-            order_sql = "age_hours ASC, cast_score DESC"
-        case SortingOrder.DAY:
-            order_sql = "age_days ASC, cast_score DESC"
-        case SortingOrder.REACTIONS:
-            order_sql = "reaction_count DESC, cast_score DESC"
-        case _:
-            order_sql = 'cast_score DESC'
+    order_by = channel_casts_order_by(sorting_order)
+    order_sql = sql_for_order(order_by)
+    cursor_sql = sql_for_keyset(order_by, after, first_param=7)
 
-    decay_sql = sql_for_decay("CURRENT_TIMESTAMP - ci.action_ts", time_decay)
+    as_of_sql = sql_for_as_of(6)
+    decay_sql = sql_for_decay(f"{as_of_sql} - ci.action_ts", time_decay)
 
     if normalize:
         fidscore_sql = 'cbrt(fids.score)'
@@ -2143,7 +2633,8 @@ async def get_popular_channel_casts_heavy(
             FROM k3l_recent_parent_casts as casts
             INNER JOIN k3l_cast_action as ci
                 ON (ci.cast_hash = casts.hash
-                    AND ci.action_ts > now() - interval '{max_cast_age}'
+                    AND ci.action_ts > {as_of_sql} - interval '{max_cast_age}'
+                    AND ci.action_ts <= {as_of_sql}
                     AND casts.root_parent_url = $2)
             INNER JOIN k3l_channel_rank as fids 
                 ON (fids.channel_id=$1 AND fids.fid = ci.fid AND fids.strategy_name=$3)
@@ -2162,22 +2653,26 @@ async def get_popular_channel_casts_heavy(
             FROM fid_cast_scores
             GROUP BY cast_hash
         )
-    SELECT
-        '0x' || encode(casts.hash, 'hex') as cast_hash,
-        FLOOR(EXTRACT(EPOCH FROM (now() - casts.timestamp))/3600) as age_hours,
-        FLOOR(EXTRACT(EPOCH FROM (now() - casts.timestamp))/(60 * 60 * 24)::numeric) AS age_days,
-        casts.text,
-        casts.embeds,
-        casts.mentions,
-        casts.fid,
-        casts.timestamp as cast_ts,
-        cast_score,
-        reaction_count
-    FROM k3l_recent_parent_casts as casts
-    INNER JOIN scores on casts.hash = scores.cast_hash
-    WHERE
-        cast_score >= {score_threshold}
-        AND reaction_count >= {reactions_threshold}
+        , feed AS (
+            SELECT
+                '0x' || encode(casts.hash, 'hex') as cast_hash,
+                FLOOR(EXTRACT(EPOCH FROM ({as_of_sql} - casts.timestamp))/3600) as age_hours,
+                FLOOR(EXTRACT(EPOCH FROM ({as_of_sql} - casts.timestamp))/(60 * 60 * 24)::numeric) AS age_days,
+                casts.text,
+                casts.embeds,
+                casts.mentions,
+                casts.fid,
+                casts.timestamp as cast_ts,
+                cast_score,
+                reaction_count
+            FROM k3l_recent_parent_casts as casts
+            INNER JOIN scores on casts.hash = scores.cast_hash
+            WHERE
+                cast_score >= {score_threshold}
+                AND reaction_count >= {reactions_threshold}
+        )
+    SELECT *, {as_of_sql} AS as_of FROM feed
+    WHERE {cursor_sql}
     ORDER BY {order_sql}
     OFFSET $4
     LIMIT $5
@@ -2188,8 +2683,12 @@ async def get_popular_channel_casts_heavy(
         strategy_name,
         offset,
         limit,
+        as_of,
+        *(after or []),
         sql_query=sql_query,
         pool=pool,
+        coalesce=True,
+        query_class=QueryClass.HEAVY,
     )
 
 
@@ -2256,7 +2755,9 @@ async def get_trending_casts_lite(
     LIMIT $2)
     select cast_hash,cast_hour from cast_details order by rn
     """
-    return await fetch_rows(offset, limit, sql_query=sql_query, pool=pool)
+    return await fetch_rows(
+        offset, limit, sql_query=sql_query, pool=pool, query_class=QueryClass.HEAVY
+    )
 
 
 async def get_trending_casts_heavy(
@@ -2329,7 +2830,9 @@ async def get_trending_casts_heavy(
     )
     select cast_hash,cast_hour,text,embeds,mentions,fid,timestamp,cast_score from cast_details order by rn
     """
-    return await fetch_rows(offset, limit, sql_query=sql_query, pool=pool)
+    return await fetch_rows(
+        offset, limit, sql_query=sql_query, pool=pool, query_class=QueryClass.HEAVY
+    )
 
 
 async def get_top_casters(offset: int, limit: int, pool: Pool):
@@ -2737,35 +3240,28 @@ async def get_trending_channel_casts_heavy(
     limit: int,
     sorting_order: SortingOrder,
     pool: Pool,
+    after: list | None = None,
+    as_of: datetime | None = None,
 ):
     logger.info("get_trending_channel_casts_heavy")
     agg_sql = sql_for_agg(agg, 'fid_cast_scores.cast_score')
 
-    decay_sql = sql_for_decay("CURRENT_TIMESTAMP - ci.action_ts", time_decay)
+    as_of_sql = sql_for_as_of(6)
+    decay_sql = sql_for_decay(f"{as_of_sql} - ci.action_ts", time_decay)
 
     if normalize:
         fidscore_sql = 'cbrt(fids.score)'
     else:
         fidscore_sql = 'fids.score'
 
-    if shuffle:
-        shuffle_sql = 'random(),'
-    else:
-        shuffle_sql = ''
-
-    match sorting_order:
-        case SortingOrder.SCORE | SortingOrder.POPULAR:
-            order_sql = 'cast_score DESC'
-        case SortingOrder.RECENT:
-            order_sql = 'cast_ts DESC'
-        case SortingOrder.HOUR:
-            order_sql = f'age_hours ASC, {shuffle_sql} cast_score DESC'
-        case SortingOrder.DAY:
-            order_sql = f'age_days ASC, {shuffle_sql} cast_score DESC'
-        case SortingOrder.REACTIONS:
-            order_sql = f'reaction_count DESC, {shuffle_sql} cast_score DESC'
-        case _:
-            order_sql = 'cast_score DESC'
+    order_by = channel_casts_order_by(sorting_order)
+    order_sql = sql_for_order(
+        order_by,
+        shuffle=shuffle
+        and sorting_order
+        in (SortingOrder.HOUR, SortingOrder.DAY, SortingOrder.REACTIONS),
+    )
+    cursor_sql = sql_for_keyset(order_by, after, first_param=7)
 
     sql_query = f"""
     WITH
@@ -2787,13 +3283,14 @@ async def get_trending_channel_casts_heavy(
         FROM k3l_recent_parent_casts as casts
         INNER JOIN k3l_cast_action as ci
             ON (ci.cast_hash = casts.hash
-                AND ci.action_ts > now() - interval '{max_cast_age}'
+                AND ci.action_ts > {as_of_sql} - interval '{max_cast_age}'
+                AND ci.action_ts <= {as_of_sql}
                 AND casts.root_parent_url = $2)
         INNER JOIN k3l_channel_rank as fids ON (fids.channel_id=$1 AND fids.fid = ci.fid and fids.strategy_name = $3)
         LEFT JOIN automod_data as md ON (md.channel_id=$1 AND md.affected_userid=ci.fid AND md.action='ban')
         LEFT JOIN cura_hidden_fids as hids ON (hids.hidden_fid=ci.fid AND hids.channel_id=$1)
         WHERE md.affected_userid IS NULL AND hids.hidden_fid IS NULL
-        AND casts.timestamp > now() - interval '{max_cast_age}'
+        AND casts.timestamp > {as_of_sql} - interval '{max_cast_age}'
         GROUP BY casts.hash, ci.fid
         ORDER BY cast_ts DESC
     ), 
@@ -2809,8 +3306,8 @@ async def get_trending_channel_casts_heavy(
     cast_details AS (
         SELECT
             '0x' || encode(scores.cast_hash, 'hex') as cast_hash,
-            FLOOR(EXTRACT(EPOCH FROM (now() - ci.timestamp))/3600) as age_hours,
-            FLOOR(EXTRACT(EPOCH FROM (now() - ci.timestamp))/(60 * 60 * 24)::numeric) AS age_days,
+            FLOOR(EXTRACT(EPOCH FROM ({as_of_sql} - ci.timestamp))/3600) as age_hours,
+            FLOOR(EXTRACT(EPOCH FROM ({as_of_sql} - ci.timestamp))/(60 * 60 * 24)::numeric) AS age_days,
             ci.timestamp as cast_ts,
             scores.cast_score,
             scores.reaction_count as reaction_count,
@@ -2825,7 +3322,7 @@ async def get_trending_channel_casts_heavy(
         INNER JOIN k3l_rank ON (ci.fid = k3l_rank.profile_id and k3l_rank.strategy_id=9)
         INNER JOIN k3l_channel_rank AS fids ON (ci.fid = fids.fid AND fids.channel_id = $1 AND fids.strategy_name = $3)
         WHERE
-            ci.timestamp > now() - interval '{max_cast_age}'
+            ci.timestamp > {as_of_sql} - interval '{max_cast_age}'
             AND scores.cast_score >= {score_threshold}
             AND scores.reaction_count >= {reactions_threshold}
     ),
@@ -2853,8 +3350,8 @@ async def get_trending_channel_casts_heavy(
         LEFT JOIN user_data ON (cast_details.fid = user_data.fid)
         GROUP BY cast_details.cast_hash
     )
-    SELECT * FROM feed
-    WHERE ptile <= {cutoff_ptile}
+    SELECT *, {as_of_sql} AS as_of FROM feed
+    WHERE ptile <= {cutoff_ptile} AND {cursor_sql}
     ORDER BY {order_sql}
     OFFSET $4
     LIMIT $5
@@ -2866,19 +3363,19 @@ async def get_trending_channel_casts_heavy(
         channel_strategy,
         offset,
         limit,
+        as_of,
+        *(after or []),
         sql_query=sql_query,
         pool=pool,
+        coalesce=True,
+        query_class=QueryClass.HEAVY,
     )
 
 
-@memoize(
-    configuration=MutableCacheConfiguration.initialized_with(
-        DefaultInMemoryCacheConfiguration()
-    ).set_key_extractor(
-        EncodedMethodNameAndArgsExcludedKeyExtractor(
-            skip_first_arg_as_self=False, skip_args=[15], skip_kwargs=["pool"]
-        )
-    )
+@feed_cache.early(
+    namespace="channel_feed",
+    ttl=settings.CHANNEL_FEED_CACHE_TTL,
+    early_ttl=settings.CHANNEL_FEED_CACHE_EARLY_TTL,
 )
 async def get_trending_channel_casts_lite_memoized(
     channel_id: str,
@@ -2897,9 +3394,10 @@ async def get_trending_channel_casts_lite_memoized(
     limit: int,
     sorting_order: SortingOrder,
     pool: Pool,
+    after: list | None = None,
+    as_of: datetime | None = None,
 ):
-    # You can use 'extra_arg' here if needed
-    return await get_trending_channel_casts_lite(
+    rows = await get_trending_channel_casts_lite(
         channel_id=channel_id,
         channel_url=channel_url,
         channel_strategy=channel_strategy,
@@ -2916,7 +3414,10 @@ async def get_trending_channel_casts_lite_memoized(
         limit=limit,
         sorting_order=sorting_order,
         pool=pool,
+        after=after,
+        as_of=as_of,
     )
+    return check_dict_rows(rows, "trending channel casts")
 
 
 async def get_trending_channel_casts_lite(
@@ -2936,36 +3437,59 @@ async def get_trending_channel_casts_lite(
     limit: int,
     sorting_order: SortingOrder,
     pool: Pool,
+    after: list | None = None,
+    as_of: datetime | None = None,
+    fresh_actions: bool = False,
 ):
+    """
+    fresh_actions fetches the channel's actions afresh instead of from the
+    feed cache, for callers that bypass the cache to recompute the feed.
+    """
     logger.info("get_trending_channel_casts_lite")
 
+    order_by = channel_casts_order_by(sorting_order)
+    shuffle = shuffle and sorting_order in (SortingOrder.HOUR, SortingOrder.DAY)
+    if settings.CHANNEL_FEED_SCORING_IN_PROCESS:
+        get_actions = get_channel_cast_actions
+        if fresh_actions:
+            get_actions = get_channel_cast_actions.__wrapped__
+        actions = await get_actions(
+            channel_id=channel_id,
+            channel_url=channel_url,
+            strategy_name=channel_strategy,
+            max_cast_age=max_cast_age,
+            pool=pool,
+        )
+        return score_channel_casts(
+            actions,
+            agg=agg,
+            score_threshold=score_threshold,
+            reactions_threshold=reactions_threshold,
+            weights=weights,
+            time_decay=time_decay,
+            normalize=normalize,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            after=after,
+            as_of=as_of,
+            trending=True,
+            cutoff_ptile=cutoff_ptile,
+            shuffle=shuffle,
+        )
+
     agg_sql = sql_for_agg(agg, 'fid_cast_scores.cast_score')
 
-    decay_sql = sql_for_decay("CURRENT_TIMESTAMP - ci.action_ts", time_decay)
+    as_of_sql = sql_for_as_of(6)
+    decay_sql = sql_for_decay(f"{as_of_sql} - ci.action_ts", time_decay)
 
     if normalize:
         fidscore_sql = 'cbrt(fids.score)'
     else:
         fidscore_sql = 'fids.score'
 
-    if shuffle:
-        shuffle_sql = 'random(),'
-    else:
-        shuffle_sql = ''
-
-    match sorting_order:
-        case SortingOrder.SCORE | SortingOrder.POPULAR:
-            order_sql = 'cast_score DESC'
-        case SortingOrder.RECENT:
-            order_sql = 'cast_ts DESC'
-        case SortingOrder.HOUR:
-            order_sql = f'age_hours ASC, {shuffle_sql} cast_score DESC'
-        case SortingOrder.DAY:
-            order_sql = f'age_days ASC, {shuffle_sql} cast_score DESC'
-        case SortingOrder.REACTIONS:
-            order_sql = 'reaction_count DESC, cast_score DESC'
-        case _:
-            order_sql = 'cast_score DESC'
+    order_sql = sql_for_order(order_by, shuffle=shuffle)
+    cursor_sql = sql_for_keyset(order_by, after, first_param=7)
 
     sql_query = f"""
     WITH
@@ -2987,13 +3511,14 @@ async def get_trending_channel_casts_lite(
         FROM k3l_recent_parent_casts as casts
         INNER JOIN k3l_cast_action as ci
             ON (ci.cast_hash = casts.hash
-                AND ci.action_ts > now() - interval '{max_cast_age}'
+                AND ci.action_ts > {as_of_sql} - interval '{max_cast_age}'
+                AND ci.action_ts <= {as_of_sql}
                 AND casts.root_parent_url = $2)
         INNER JOIN k3l_channel_rank as fids ON (fids.channel_id=$1 AND fids.fid = ci.fid and fids.strategy_name = $3)
         LEFT JOIN automod_data as md ON (md.channel_id=$1 AND md.affected_userid=ci.fid AND md.action='ban')
         LEFT JOIN cura_hidden_fids as hids ON (hids.hidden_fid=ci.fid AND hids.channel_id=$1)
         WHERE md.affected_userid IS NULL AND hids.hidden_fid IS NULL
-        AND casts.timestamp > now() - interval '{max_cast_age}'
+        AND casts.timestamp > {as_of_sql} - interval '{max_cast_age}'
         GROUP BY casts.hash, ci.fid
         ORDER BY cast_ts DESC
     ), 
@@ -3009,10 +3534,11 @@ async def get_trending_channel_casts_lite(
     cast_scores AS (
         SELECT
             '0x' || encode(cast_hash, 'hex') as cast_hash,
-            FLOOR(EXTRACT(EPOCH FROM (now() - cast_ts))/3600) as age_hours,
-            FLOOR(EXTRACT(EPOCH FROM (now() - cast_ts))/(60 * 60 * 24)::numeric) AS age_days,
+            FLOOR(EXTRACT(EPOCH FROM ({as_of_sql} - cast_ts))/3600) as age_hours,
+            FLOOR(EXTRACT(EPOCH FROM ({as_of_sql} - cast_ts))/(60 * 60 * 24)::numeric) AS age_days,
             cast_ts,
             cast_score,
+            reaction_count,
             NTILE(100) OVER (ORDER BY cast_score DESC) as ptile
         FROM scores
         WHERE
@@ -3020,9 +3546,10 @@ async def get_trending_channel_casts_lite(
             AND reaction_count >= {reactions_threshold}
     )
     SELECT
-        *
+        *,
+        {as_of_sql} AS as_of
     FROM cast_scores
-    WHERE ptile <= {cutoff_ptile}
+    WHERE ptile <= {cutoff_ptile} AND {cursor_sql}
     ORDER BY {order_sql}
     OFFSET $4
     LIMIT $5
@@ -3034,11 +3561,210 @@ async def get_trending_channel_casts_lite(
         channel_strategy,
         offset,
         limit,
+        as_of,
+        *(after or []),
         sql_query=sql_query,
         pool=pool,
+        coalesce=True,
+        query_class=QueryClass.HEAVY,
     )
 
 
+async def _get_trending_channels_casts_lite(
+    channel_ids: tuple[str, ...],
+    channel_strategy: str,
+    max_cast_age: str,
+    agg: ScoreAgg,
+    score_threshold: float,
+    reactions_threshold: int,
+    cutoff_ptile: int,
+    weights: Weights,
+    shuffle: bool,
+    time_decay: CastsTimeDecay,
+    normalize: bool,
+    offset: int,
+    limit: int,
+    sorting_order: SortingOrder,
+    pool: Pool,
+) -> list[dict[str, Any]]:
+    """
+    Set-based get_trending_channel_casts_lite over several channels at once:
+    the same page of each channel's feed, tagged with its channel_id.
+    """
+    logger.info(f"get_trending_channels_casts_lite: {len(channel_ids)} channels")
+
+    agg_sql = sql_for_agg(agg, 'fid_cast_scores.cast_score')
+
+    decay_sql = sql_for_decay("CURRENT_TIMESTAMP - ci.action_ts", time_decay)
+
+    if normalize:
+        fidscore_sql = 'cbrt(fids.score)'
+    else:
+        fidscore_sql = 'fids.score'
+
+    order_sql = sql_for_order(
+        channel_casts_order_by(sorting_order),
+        shuffle=shuffle and sorting_order in (SortingOrder.HOUR, SortingOrder.DAY),
+    )
+
+    sql_query = f"""
+    WITH
+    channels AS (
+        SELECT id AS channel_id, url
+        FROM warpcast_channels_data
+        WHERE id = ANY($1::text[])
+    ),
+    fid_cast_scores as (
+        SELECT
+            ch.channel_id,
+            hash as cast_hash,
+            SUM(
+                (
+                    ({weights.cast} * {fidscore_sql} * ci.casted)
+                    + ({weights.reply} * {fidscore_sql} * ci.replied)
+                    + ({weights.recast} * {fidscore_sql} * ci.recasted)
+                    + ({weights.like} * {fidscore_sql} * ci.liked)
+                )
+                *
+                {decay_sql}
+            ) as cast_score,
+            ci.fid,
+            MIN(casts.timestamp) as cast_ts
+        FROM channels AS ch
+        INNER JOIN k3l_recent_parent_casts as casts
+            ON (casts.root_parent_url = ch.url)
+        INNER JOIN k3l_cast_action as ci
+            ON (ci.cast_hash = casts.hash
+                AND ci.action_ts > now() - interval '{max_cast_age}')
+        INNER JOIN k3l_channel_rank as fids ON (fids.channel_id=ch.channel_id AND fids.fid = ci.fid and fids.strategy_name = $2)
+        LEFT JOIN automod_data as md ON (md.channel_id=ch.channel_id AND md.affected_userid=ci.fid AND md.action='ban')
+        LEFT JOIN cura_hidden_fids as hids ON (hids.hidden_fid=ci.fid AND hids.channel_id=ch.channel_id)
+        WHERE md.affected_userid IS NULL AND hids.hidden_fid IS NULL
+        AND casts.timestamp > now() - interval '{max_cast_age}'
+        GROUP BY ch.channel_id, casts.hash, ci.fid
+    ),
+    scores AS (
+        SELECT
+            channel_id,
+            cast_hash,
+            {agg_sql} as cast_score,
+            MIN(cast_ts) as cast_ts,
+            COUNT (*) - 1 as reaction_count
+        FROM fid_cast_scores
+        GROUP BY channel_id, cast_hash
+    ),
+    cast_scores AS (
+        SELECT
+            channel_id,
+            '0x' || encode(cast_hash, 'hex') as cast_hash,
+            FLOOR(EXTRACT(EPOCH FROM (now() - cast_ts))/3600) as age_hours,
+            FLOOR(EXTRACT(EPOCH FROM (now() - cast_ts))/(60 * 60 * 24)::numeric) AS age_days,
+            cast_ts,
+            cast_score,
+            reaction_count,
+            NTILE(100) OVER (PARTITION BY channel_id ORDER BY cast_score DESC) as ptile
+        FROM scores
+        WHERE
+            cast_score >= {score_threshold}
+            AND reaction_count >= {reactions_threshold}
+    ),
+    feed AS (
+        SELECT
+            *,
+            ROW_NUMBER() OVER (PARTITION BY channel_id ORDER BY {order_sql}) as rn
+        FROM cast_scores
+        WHERE ptile <= {cutoff_ptile}
+    )
+    SELECT
+        channel_id,
+        cast_hash,
+        age_hours,
+        age_days,
+        cast_ts,
+        cast_score,
+        reaction_count,
+        ptile
+    FROM feed
+    WHERE rn > $3 AND rn <= ($3 + $4)
+    ORDER BY channel_id, rn
+    """
+
+    rows = await fetch_rows(
+        list(channel_ids),
+        channel_strategy,
+        offset,
+        limit,
+        sql_query=sql_query,
+        pool=pool,
+        coalesce=True,
+        query_class=QueryClass.HEAVY,
+    )
+    return check_dict_rows(rows, "trending channels casts")
+
+
+async def get_trending_channels_casts_lite(
+    channel_ids: Iterable[str], pool: Pool, **kwargs
+) -> list[dict[str, Any]]:
+    """
+    _get_trending_channels_casts_lite through the feed cache, with one entry
+    per channel so that every user of a channel shares it; the channels that
+    are not cached are fetched together by one query.
+    """
+    key_kwargs = sorted(kwargs.items())
+    keys = {
+        channel_id: repr(("trending_channels_casts_lite", channel_id, key_kwargs))
+        for channel_id in channel_ids
+    }
+
+    async def compute(missing: list[str]) -> dict[str, list[dict[str, Any]]]:
+        rows = await _get_trending_channels_casts_lite(
+            channel_ids=tuple(missing), pool=pool, **kwargs
+        )
+        feeds = {channel_id: [] for channel_id in missing}
+        for row in rows:
+            feeds[row["channel_id"]].append(row)
+        return feeds
+
+    feeds = await feed_cache.get_many_or_compute(
+        "channel_feed",
+        keys,
+        compute,
+        ttl=settings.CHANNEL_FEED_CACHE_TTL,
+        early_ttl=settings.CHANNEL_FEED_CACHE_EARLY_TTL,
+    )
+    return [row for channel_id in keys for row in feeds[channel_id]]
+
+
+async def get_channel_casts_actions(
+    cast_hashes: list[bytes], channel_id: str, pool: Pool
+) -> ChannelCastActions:
+    """
+    Actions of unbanned fids on the given casts, for scoring them with the
+    in-memory channel ranks: fid scores are left NaN for the caller to fill.
+    """
+    now = time.time()
+    sql_query = """
+        SELECT
+            '0x' || encode(ci.cast_hash, 'hex') AS cast_hash,
+            MIN(ci.action_ts) AS cast_ts,
+            EXTRACT(EPOCH FROM MIN(ci.action_ts))::float8 AS cast_epoch,
+            true AS in_window,
+            array_agg(ci.fid) AS fids,
+            array_agg(NULL::float8) AS fid_scores,
+            array_agg(ci.casted) AS casted,
+            array_agg(ci.recasted) AS recasted,
+            array_agg(ci.replied) AS replied,
+            array_agg(ci.liked) AS liked,
+            array_agg(EXTRACT(EPOCH FROM ci.action_ts)::float8) AS action_ts
+        FROM k3l_cast_action as ci
+        LEFT JOIN automod_data as md ON (md.channel_id=$1 AND md.affected_userid=ci.fid AND md.action='ban')
+        WHERE ci.cast_hash = ANY($2::bytea[]) AND md.channel_id IS NULL
+        GROUP BY ci.cast_hash
+    """
+    rows = await fetch_rows(channel_id, cast_hashes, sql_query=sql_query, pool=pool)
+    return ChannelCastActions.from_rows(now, check_rows(rows, "casts actions"))
+
+
 async def get_channel_casts_scores_lite(
     cast_hashes: list[bytes],
     channel_id: str,
@@ -3166,5 +3892,11 @@ async def get_trending_channels(
     """
 
     return await fetch_rows(
-        rank_threshold, offset, limit, sql_query=sql_query, pool=pool
+        rank_threshold,
+        offset,
+        limit,
+        sql_query=sql_query,
+        pool=pool,
+        coalesce=True,
+        query_class=QueryClass.HEAVY,
     )
@@ -0,0 +1,47 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from ..config import settings
+
+# monotonic time by which the current request needs its queries answered;
+# tasks created by the request inherit it
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar(
+    "query_deadline", default=None
+)
+
+
+@contextmanager
+def deadline(secs: float) -> Iterator[None]:
+    """Bounds the queries run within the block to `secs`; nesting only tightens."""
+    at = time.monotonic() + secs
+    current = _deadline.get()
+    if current is not None:
+        at = min(at, current)
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def query_timeout_secs() -> float:
+    """
+    Time the next query may take: POSTGRES_TIMEOUT_SECS, or less if the
+    request's deadline is closer. Zero or negative once it has passed.
+    """
+    at = _deadline.get()
+    if at is None:
+        return settings.POSTGRES_TIMEOUT_SECS
+    return min(settings.POSTGRES_TIMEOUT_SECS, at - time.monotonic())
+
+
+def shared_context() -> contextvars.Context:
+    """
+    Context for tasks shared by several requests (coalesced queries, cache
+    refreshes), which must not be cut short by whichever request started them.
+    """
+    context = contextvars.copy_context()
+    context.run(_deadline.set, None)
+    return context
@@ -0,0 +1,40 @@
+import hashlib
+
+from fastapi import HTTPException, Request, Response
+
+from .data_versions import data_versions
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def data_version_etag(*datasets: str):
+    """
+    Route dependency for GET responses that only change when the pipeline
+    publishes one of `datasets`. The ETag is derived from the dataset
+    versions plus the request path and query; a matching If-None-Match
+    is answered with 304 before the route does any DB work.
+    Routes may read from replicas, so this relies on `DataVersions` only
+    applying a version once the replicas in rotation have replayed it:
+    a response tagged with a version never carries older data.
+    """
+
+    async def dependency(request: Request, response: Response):
+        versions = [data_versions.get(dataset) for dataset in datasets]
+        if not all(versions):
+            # no published version seen yet, so nothing to validate against
+            return
+        query = sorted(request.query_params.multi_items())
+        digest = hashlib.sha256(
+            repr((request.url.path, query, versions)).encode()
+        ).hexdigest()
+        etag = f'"{digest[:32]}"'
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            raise HTTPException(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+
+    return dependency
@@ -0,0 +1,230 @@
+import asyncio
+import time
+from typing import NamedTuple
+
+from asyncpg.pool import Pool
+from loguru import logger
+
+from ..config import settings
+from ..models.channel_model import (
+    CHANNEL_RANKING_STRATEGY_NAMES,
+    ChannelRankingsTimeframe,
+)
+from ..models.feed_model import (
+    CASTS_AGE,
+    PARENT_CASTS_AGE,
+    ChannelTimeframe,
+    PopularFeed,
+    TrendingFeed,
+)
+from ..models.score_model import Weights
+from . import db_utils
+from .channel_metadata import channel_metadata
+from .trending_channels import trending_channels
+
+# request-only fields that do not change the ranked list
+_IGNORED_FIELDS = {"timeout_secs", "session_id", "channels"}
+_DEFAULT_FEEDS: dict[str, TrendingFeed | PopularFeed] = {
+    "trending": TrendingFeed.model_validate({"feedType": "trending"}),
+    "popular": PopularFeed.model_validate({"feedType": "popular"}),
+}
+_STRATEGY_NAME = CHANNEL_RANKING_STRATEGY_NAMES[ChannelRankingsTimeframe.SIXTY_DAYS]
+# the defaults of the trending channels API
+_SEED_LOOKBACK = ChannelTimeframe.WEEK
+_SEED_RANK_THRESHOLD = 10000
+
+
+def default_feed_type(metadata: TrendingFeed | PopularFeed) -> str | None:
+    """'trending' or 'popular' if `metadata` only carries default ranking params."""
+    for feed_type, default in _DEFAULT_FEEDS.items():
+        if type(metadata) is type(default) and metadata.model_dump(
+            exclude=_IGNORED_FIELDS
+        ) == default.model_dump(exclude=_IGNORED_FIELDS):
+            return feed_type
+    return None
+
+
+class MaterializedFeed(NamedTuple):
+    casts: list[dict]
+    refreshed_at: float
+
+
+class FeedMaterializer:
+    """
+    Precomputed default trending and popular feeds (60d channel ranks,
+    lite) of the channels requested recently, plus the
+    FEED_MATERIALIZE_SEED_CHANNELS most active ones. Each feed is computed
+    by the same function as the live channel feed, kept to a depth of
+    FEED_MATERIALIZE_DEPTH casts and recomputed every
+    FEED_MATERIALIZE_FREQ_SECS, so that default requests are a list slice.
+    Channels not requested for FEED_MATERIALIZE_IDLE_SECS are dropped
+    unless they are still among the most active.
+    """
+
+    def __init__(self) -> None:
+        self._feeds: dict[tuple[str, str], MaterializedFeed] = {}
+        # channel_id -> last time a default feed was requested for it
+        self._requested_at: dict[str, float] = {}
+
+    def get(
+        self,
+        feed_type: str,
+        channel_id: str,
+        offset: int,
+        limit: int,
+    ) -> list[dict] | None:
+        """A page of the materialized feed, or None to take the live path."""
+        if not settings.FEED_MATERIALIZE_ENABLED:
+            return None
+        now = time.time()
+        if channel_id not in self._requested_at:
+            if len(self._requested_at) >= settings.FEED_MATERIALIZE_MAX_CHANNELS:
+                return None
+        self._requested_at[channel_id] = now
+        if offset + limit > settings.FEED_MATERIALIZE_DEPTH:
+            return None
+        feed = self._feeds.get((feed_type, channel_id))
+        # a feed that missed several refreshes is worse than a live query
+        if (
+            feed is None
+            or now - feed.refreshed_at > 3 * settings.FEED_MATERIALIZE_FREQ_SECS
+        ):
+            return None
+        return feed.casts[offset : offset + limit]
+
+    async def _seed_channels(self, pool: Pool) -> list[str]:
+        # the most active channels, so that their first requests are
+        # ... served from materialized feeds too
+        limit = settings.FEED_MATERIALIZE_SEED_CHANNELS
+        if limit <= 0:
+            return []
+        try:
+            rows = await trending_channels.top(
+                _SEED_LOOKBACK, _SEED_RANK_THRESHOLD, 0, limit, pool=pool
+            )
+            if rows is None:
+                rows = db_utils.check_rows(
+                    await db_utils.get_trending_channels(
+                        max_cast_age=PARENT_CASTS_AGE[_SEED_LOOKBACK],
+                        rank_threshold=_SEED_RANK_THRESHOLD,
+                        offset=0,
+                        limit=limit,
+                        pool=pool,
+                    ),
+                    "trending channels",
+                )
+        except Exception as e:
+            logger.error(f"Failed to fetch the most active channels: {e}")
+            return []
+        return [row["id"] for row in rows]
+
+    async def _channels(self, pool: Pool) -> list[str]:
+        cutoff = time.time() - settings.FEED_MATERIALIZE_IDLE_SECS
+        for channel_id in [c for c, t in self._requested_at.items() if t < cutoff]:
+            del self._requested_at[channel_id]
+        seeded = await self._seed_channels(pool)
+        channel_ids = list(dict.fromkeys([*self._requested_at, *seeded]))
+        channel_ids = channel_ids[: settings.FEED_MATERIALIZE_MAX_CHANNELS]
+        keep = set(channel_ids)
+        for key in [key for key in self._feeds if key[1] not in keep]:
+            del self._feeds[key]
+        return channel_ids
+
+    async def refresh(self, pool: Pool):
+        channel_ids = await self._channels(pool)
+        if not channel_ids:
+            return
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(settings.FEED_MATERIALIZE_CONCURRENCY)
+
+        async def bounded(job):
+            async with semaphore:
+                try:
+                    await job
+                except Exception as e:
+                    logger.error(f"Failed to materialize channel feeds: {e}")
+
+        await asyncio.gather(
+            *(
+                bounded(self._refresh_trending(channel_id, pool))
+                for channel_id in channel_ids
+            ),
+            *(
+                bounded(self._refresh_popular(channel_id, pool))
+                for channel_id in channel_ids
+            ),
+        )
+        logger.info(
+            f"materialized feeds of {len(channel_ids)} channels"
+            f" in {time.perf_counter() - start:.2f} secs"
+        )
+
+    async def _refresh_trending(self, channel_id: str, pool: Pool):
+        metadata = _DEFAULT_FEEDS["trending"]
+        channel_url = await channel_metadata.url_for_id(channel_id, pool=pool)
+        if channel_url is None:
+            return
+        # the live channel feed's scorer, bypassing the feed cache (the
+        # ... memoized wrapper) and the cached cast actions
+        rows = await db_utils.get_trending_channel_casts_lite(
+            channel_id=channel_id,
+            channel_url=channel_url,
+            channel_strategy=_STRATEGY_NAME,
+            max_cast_age=CASTS_AGE[metadata.lookback],
+            agg=metadata.agg,
+            score_threshold=metadata.score_threshold,
+            reactions_threshold=metadata.reactions_threshold,
+            cutoff_ptile=metadata.cutoff_ptile,
+            weights=Weights.from_str(metadata.weights),
+            shuffle=metadata.shuffle,
+            time_decay=metadata.time_decay,
+            normalize=metadata.normalize,
+            offset=0,
+            limit=settings.FEED_MATERIALIZE_DEPTH,
+            sorting_order=metadata.sorting_order,
+            pool=pool,
+            fresh_actions=True,
+        )
+        self._feeds[("trending", channel_id)] = MaterializedFeed(
+            db_utils.check_dict_rows(rows, "channel feed"), time.time()
+        )
+
+    async def _refresh_popular(self, channel_id: str, pool: Pool):
+        metadata = _DEFAULT_FEEDS["popular"]
+        channel_url = await channel_metadata.url_for_id(channel_id, pool=pool)
+        if channel_url is None:
+            return
+        # bypass the feed cache, for the cast actions too
+        rows = await db_utils.get_popular_channel_casts_lite.__wrapped__(
+            channel_id=channel_id,
+            channel_url=channel_url,
+            strategy_name=_STRATEGY_NAME,
+            max_cast_age=CASTS_AGE[metadata.lookback],
+            agg=metadata.agg,
+            score_threshold=metadata.score_threshold,
+            reactions_threshold=metadata.reactions_threshold,
+            weights=Weights.from_str(metadata.weights),
+            time_decay=metadata.time_decay,
+            normalize=metadata.normalize,
+            offset=0,
+            limit=settings.FEED_MATERIALIZE_DEPTH,
+            sorting_order=metadata.sorting_order,
+            pool=pool,
+            fresh_actions=True,
+        )
+        self._feeds[("popular", channel_id)] = MaterializedFeed(
+            db_utils.check_dict_rows(rows, "channel feed"), time.time()
+        )
+
+
+async def materialize_channel_feeds(materializer: FeedMaterializer, pool: Pool):
+    logger.info("Starting channel feed materializer loop")
+    while True:
+        await asyncio.sleep(settings.FEED_MATERIALIZE_FREQ_SECS)
+        try:
+            await materializer.refresh(pool)
+        except Exception as e:
+            logger.error(f"Failed to materialize channel feeds: {e}")
+
+
+feed_materializer = FeedMaterializer()
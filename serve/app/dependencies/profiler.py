@@ -0,0 +1,166 @@
+import asyncio
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import UTC, datetime
+from pathlib import Path
+from types import FrameType
+
+from loguru import logger
+
+from ..config import settings
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    path = Path(code.co_filename)
+    # package/module.py is enough to tell frames apart and keeps lines short
+    return f"{code.co_qualname} ({path.parent.name}/{path.name}:{frame.f_lineno})"
+
+
+def _thread_stack(frame: FrameType | None) -> list[str]:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _task_stack(task: asyncio.Task) -> list[str]:
+    """
+    Frames of a task's coroutine chain, outermost first, ending with what it
+    is waiting on. Task.get_stack() only has the outermost frame of a
+    suspended task.
+    """
+    stack = []
+    awaitable = task.get_coro()
+    while True:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(
+            awaitable, "gi_frame", None
+        )
+        if frame is None:
+            # a future or another awaitable without frames of its own
+            stack.append(f"<waiting on {type(awaitable).__name__}>")
+            break
+        stack.append(_frame_label(frame))
+        if getattr(awaitable, "cr_running", False):
+            stack.append("<running>")
+            break
+        inner = getattr(awaitable, "cr_await", None) or getattr(
+            awaitable, "gi_yieldfrom", None
+        )
+        if inner is None:
+            # scheduled but not resumed yet
+            stack.append("<ready>")
+            break
+        awaitable = inner
+    return stack
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of all threads, and the coroutine stacks of
+    the event loop's tasks, from a background thread every `interval` secs.
+    Tasks are sampled whether they are running or waiting, which is what
+    shows requests queued on a pool or a lock. The counts are returned as
+    collapsed stacks, one `frame;frame;... count` line per stack, which
+    flamegraph.pl, speedscope and similar tools read.
+
+    The sampler needs the GIL, so it mostly catches a thread where it waits
+    on I/O: code that runs for less than the interpreter's switch interval
+    (5 ms) between waits is undercounted. Longer stalls of the event loop,
+    the ones that hold up every request, are sampled as they happen.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        interval: float,
+        tasks: bool = True,
+    ) -> None:
+        self.loop = loop
+        self.interval = interval
+        self.tasks = tasks
+        self.samples: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                # a stack changed under us; skip this sample
+                logger.debug(f"Failed to sample stacks: {e}")
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            root = f"thread {names.get(thread_id, thread_id)}"
+            self._add([root, *_thread_stack(frame)])
+        if not self.tasks:
+            return
+        for task in asyncio.all_tasks(self.loop):
+            self._add(["asyncio tasks", *_task_stack(task)])
+
+    def _add(self, stack: list[str]):
+        self.samples[";".join(s.replace(";", ":") for s in stack)] += 1
+
+
+async def profile(seconds: float, rate_hz: float, tasks: bool = True) -> str:
+    """Collapsed stacks sampled at `rate_hz` over the next `seconds`."""
+    sampler = StackSampler(asyncio.get_running_loop(), 1 / rate_hz, tasks)
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        collapsed = sampler.stop()
+    return collapsed
+
+
+def _write_profile(collapsed: str, profile_dir: Path, keep: int):
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    ts = datetime.now(UTC).strftime("%Y%m%dT%H%M%SZ")
+    # workers of one host share the directory
+    (profile_dir / f"profile-{ts}-{os.getpid()}.collapsed").write_text(collapsed)
+    profiles = sorted(profile_dir.glob("profile-*.collapsed"))
+    for old in profiles[: max(0, len(profiles) - keep)]:
+        old.unlink(missing_ok=True)
+
+
+async def record_profiles():
+    """Profiles continuously at a low rate, one file per window, for post-incident analysis."""
+    logger.info(f"Starting continuous profiler into {settings.PROFILER_DIR}")
+    loop = asyncio.get_running_loop()
+    while True:
+        collapsed = await profile(
+            settings.PROFILER_CONTINUOUS_WINDOW_SECS,
+            settings.PROFILER_CONTINUOUS_RATE_HZ,
+        )
+        try:
+            await loop.run_in_executor(
+                None,
+                _write_profile,
+                collapsed,
+                Path(settings.PROFILER_DIR),
+                settings.PROFILER_KEEP_FILES,
+            )
+        except Exception as e:
+            logger.error(f"Failed to write profile: {e}")
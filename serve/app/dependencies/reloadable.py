@@ -0,0 +1,24 @@
+import asyncio
+
+
+class Reloadable:
+    """
+    In-memory data kept fresh by a refresh loop, which waits between
+    reloads with `wait_for_reload` so that `request_reload` (e.g. on a new
+    data version) can cut the wait short.
+    """
+
+    def __init__(self) -> None:
+        self._reload = asyncio.Event()
+
+    def request_reload(self):
+        self._reload.set()
+
+    async def wait_for_reload(self, timeout_secs: float):
+        """Returns once a reload is requested or `timeout_secs` have passed."""
+        try:
+            async with asyncio.timeout(timeout_secs):
+                await self._reload.wait()
+        except TimeoutError:
+            pass
+        self._reload.clear()
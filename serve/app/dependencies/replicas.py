@@ -0,0 +1,116 @@
+import asyncio
+from enum import StrEnum
+
+from asyncpg.pool import Pool
+from loguru import logger
+
+from ..config import settings
+from ..telemetry import DB_REPLICA_IN_ROTATION, DB_REPLICA_LAG
+
+
+class QueryClass(StrEnum):
+    # small lookups on the request path
+    LATENCY = "latency"
+    # feed scans and aggregations
+    HEAVY = "heavy"
+
+
+class Replica:
+    def __init__(self, name: str, pool: Pool) -> None:
+        self.name = name
+        self.pool = pool
+        # out of rotation until the first lag check says otherwise
+        self.in_rotation = False
+
+
+class ReplicaRouter:
+    """
+    Picks a read replica for a query class, round-robin among the replicas
+    of that class that are within DB_REPLICA_MAX_LAG_SECS of the primary.
+    Falls back to the primary when no replica of the class is in rotation.
+    """
+
+    def __init__(self) -> None:
+        self._primary: Pool | None = None
+        self._replicas: dict[QueryClass, list[Replica]] = {c: [] for c in QueryClass}
+        self._next: dict[QueryClass, int] = {c: 0 for c in QueryClass}
+
+    def setup(self, primary: Pool, replicas: dict[QueryClass, dict[str, Pool]]):
+        self._primary = primary
+        for query_class in QueryClass:
+            self._replicas[query_class] = [
+                Replica(name, pool)
+                for name, pool in replicas.get(query_class, {}).items()
+            ]
+
+    def pools(self) -> list[Pool]:
+        return [r.pool for replicas in self._replicas.values() for r in replicas]
+
+    def pool_for(self, pool: Pool, query_class: QueryClass) -> Pool:
+        # only reads aimed at the primary are rerouted (not the cache db)
+        if pool is not self._primary:
+            return pool
+        candidates = [r for r in self._replicas[query_class] if r.in_rotation]
+        if not candidates:
+            return pool
+        self._next[query_class] += 1
+        return candidates[self._next[query_class] % len(candidates)].pool
+
+    async def check_lag(self):
+        for replicas in self._replicas.values():
+            for replica in replicas:
+                await self._check_replica(replica)
+
+    async def _check_replica(self, replica: Replica):
+        sql_query = """
+            WITH receiver AS (
+                -- status is only visible to pg_read_all_stats; without it,
+                -- ... a running receiver is taken to be streaming
+                SELECT coalesce(bool_or(status IS NULL OR status = 'streaming'), false)
+                    AS streaming
+                FROM pg_stat_wal_receiver
+            )
+            SELECT CASE
+                WHEN NOT pg_is_in_recovery() THEN 0
+                -- an idle primary has nothing to replay; that is not lag, but
+                -- ... a replica cut off from its primary has received nothing
+                WHEN streaming
+                    AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE coalesce(
+                    EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()),
+                    'Infinity'
+                )
+            END AS lag_secs
+            FROM receiver
+        """
+        try:
+            async with replica.pool.acquire() as connection:
+                lag_secs = await connection.fetchval(
+                    sql_query, timeout=settings.DB_REPLICA_LAG_CHECK_SECS
+                )
+            lag_secs = float(lag_secs or 0)
+        except Exception as e:
+            logger.error(f"Failed to check replication lag of {replica.name}: {e}")
+            lag_secs = None
+        in_rotation = (
+            lag_secs is not None and lag_secs <= settings.DB_REPLICA_MAX_LAG_SECS
+        )
+        if in_rotation != replica.in_rotation:
+            logger.warning(
+                f"replica {replica.name} {'in' if in_rotation else 'out of'} rotation"
+                f" (lag {lag_secs} secs)"
+            )
+        replica.in_rotation = in_rotation
+        if lag_secs is not None:
+            DB_REPLICA_LAG.labels(pool=replica.name).set(lag_secs)
+        DB_REPLICA_IN_ROTATION.labels(pool=replica.name).set(int(in_rotation))
+
+
+async def check_replicas_lag(router: ReplicaRouter):
+    logger.info("Starting replica lag check loop")
+    while True:
+        await asyncio.sleep(settings.DB_REPLICA_LAG_CHECK_SECS)
+        await router.check_lag()
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,111 @@
+import asyncio
+import contextvars
+import json
+from collections import deque
+from datetime import UTC, datetime
+from typing import Any
+
+from asgi_correlation_id.context import correlation_id
+from asyncpg.pool import Pool
+from loguru import logger
+
+from ..config import settings
+from ..telemetry import DB_POOL_NAMES, acquire_timed
+from .deadlines import shared_context
+
+# method, path and query string of the request being served
+current_request: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+
+def _param(value: Any) -> Any:
+    """A bound parameter as JSON, in a form that can be pasted back into psql."""
+    if isinstance(value, bytes):
+        value = "\\x" + value.hex()
+    elif not isinstance(value, (str, int, float, bool, type(None))):
+        value = repr(value)
+    limit = settings.SLOW_QUERY_MAX_PARAM_CHARS
+    if isinstance(value, str) and len(value) > limit:
+        value = f"{value[:limit]}... ({len(value)} chars)"
+    return value
+
+
+class SlowQueryLog:
+    """
+    The latest queries that ran longer than SLOW_QUERY_THRESHOLD_SECS, with
+    their parameters and the request that ran them, so that a slow feed can
+    be reproduced. With SLOW_QUERY_EXPLAIN their plans are fetched in the
+    background, one at a time so that a burst of slow queries does not
+    double the load on the DB.
+    """
+
+    def __init__(self, size: int) -> None:
+        self._entries: deque[dict] = deque(maxlen=size)
+        self._explain_task: asyncio.Task | None = None
+
+    def record(
+        self,
+        pool: Pool,
+        query_name: str,
+        sql_query: str,
+        args: tuple,
+        duration_secs: float,
+        pool_wait_secs: float,
+        rows: int | None,
+        error: str | None = None,
+    ):
+        threshold = settings.SLOW_QUERY_THRESHOLD_SECS
+        if threshold <= 0 or duration_secs < threshold:
+            return
+        entry = {
+            "at": datetime.now(UTC).isoformat(),
+            "query_name": query_name,
+            "pool": DB_POOL_NAMES.get(pool, "unknown"),
+            "request": current_request.get(),
+            "correlation_id": correlation_id.get(),
+            "duration_secs": duration_secs,
+            "pool_wait_secs": pool_wait_secs,
+            "rows": rows,
+            "error": error,
+            "params": [_param(arg) for arg in args],
+            "sql": sql_query,
+        }
+        self._entries.append(entry)
+        logger.warning(
+            f"Slow query {query_name} took {duration_secs:.3f} secs"
+            f" for {current_request.get()}"
+        )
+        if settings.SLOW_QUERY_EXPLAIN and (
+            self._explain_task is None or self._explain_task.done()
+        ):
+            # not part of the request, which may be about to time out
+            self._explain_task = asyncio.create_task(
+                self._explain(entry, pool, sql_query, args),
+                context=shared_context(),
+            )
+
+    def entries(self, query_name: str | None = None) -> list[dict]:
+        """Newest first."""
+        return [
+            entry
+            for entry in reversed(self._entries)
+            if query_name is None or entry["query_name"] == query_name
+        ]
+
+    async def _explain(self, entry: dict, pool: Pool, sql_query: str, args: tuple):
+        # no ANALYZE, which would run the slow query again
+        try:
+            async with acquire_timed(pool, "explain_slow_query") as connection:
+                plan = await connection.fetchval(
+                    f"EXPLAIN (FORMAT JSON) {sql_query}",
+                    *args,
+                    timeout=settings.POSTGRES_TIMEOUT_SECS,
+                )
+            entry["plan"] = json.loads(plan)
+        except Exception as e:
+            logger.error(f"Failed to explain slow query {entry['query_name']}: {e}")
+            entry["plan_error"] = str(e)
+
+
+slow_queries = SlowQueryLog(settings.SLOW_QUERY_BUFFER_SIZE)
@@ -0,0 +1,329 @@
+import asyncio
+import hashlib
+import inspect
+import pickle
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Collection, Mapping
+from datetime import UTC, datetime, timedelta
+from functools import partial, wraps
+from typing import Any, NamedTuple
+
+from asyncpg.pool import Pool
+from loguru import logger
+
+from ..config import settings
+from ..telemetry import FEED_CACHE_REFRESHES, FEED_CACHE_REQUESTS
+from . import cache_db_utils
+from .deadlines import shared_context
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    # epoch seconds; fresh before stale_at, servable (but stale) before expires_at
+    stale_at: float
+    expires_at: float
+
+
+class TieredCache:
+    """
+    Two-tier cache for feed results.
+
+    L1 is a bounded in-process LRU. L2 is the shared cache database
+    so that a cold replica can reuse results already computed by its peers.
+    Entries are fresh for `early_ttl`; after that they are still served
+    while a background task recomputes them, until `ttl` hard-expires them.
+    Concurrent misses for the same key share a single computation.
+
+    Keys are prefixed with the version of their namespace, so that
+    `set_version` invalidates a namespace on every replica at once
+    without touching the entries already in the cache DB.
+    """
+
+    def __init__(self, l1_size: int) -> None:
+        self._l1: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._l1_size = l1_size
+        self._cache_pool: Pool | None = None
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._versions: dict[str, str] = {}
+
+    def setup(self, cache_pool: Pool | None):
+        self._cache_pool = cache_pool
+
+    def set_version(self, namespace: str, version: str):
+        """Start a new generation of `namespace`; older entries are never served again."""
+        if self._versions.get(namespace) == version:
+            return
+        self._versions[namespace] = version
+        # unreachable now; free them instead of waiting for LRU eviction
+        prefix = f"{namespace}:"
+        for cache_key in [k for k in self._l1 if k.startswith(prefix)]:
+            del self._l1[cache_key]
+        logger.info(f"feed cache namespace {namespace} now at version {version}")
+
+    async def get_or_compute(
+        self,
+        namespace: str,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: timedelta,
+        early_ttl: timedelta,
+    ) -> Any:
+        key = self._versioned(namespace, key)
+        entry, tier = await self._lookup(namespace, key)
+
+        now = time.time()
+        if entry is None or entry.expires_at <= now:
+            FEED_CACHE_REQUESTS.labels(
+                namespace=namespace, tier="none", result="miss"
+            ).inc()
+            # shield the shared computation so that one cancelled caller
+            # ... does not abort it for everyone else waiting on it
+            return await asyncio.shield(
+                self._run(namespace, key, compute, ttl, early_ttl)
+            )
+
+        if entry.stale_at <= now:
+            FEED_CACHE_REQUESTS.labels(
+                namespace=namespace, tier=tier, result="stale"
+            ).inc()
+            self._run(namespace, key, compute, ttl, early_ttl)
+        else:
+            FEED_CACHE_REQUESTS.labels(
+                namespace=namespace, tier=tier, result="hit"
+            ).inc()
+        return entry.value
+
+    async def get_many_or_compute(
+        self,
+        namespace: str,
+        keys: dict[Any, str],
+        compute: Callable[[list], Awaitable[dict[Any, Any]]],
+        ttl: timedelta,
+        early_ttl: timedelta,
+    ) -> dict[Any, Any]:
+        """
+        get_or_compute for items that are cheaper to compute together,
+        like the feeds of several channels in one query. `keys` maps each
+        item to its cache key; the items that are missing or stale and not
+        already being computed are computed by a single call of `compute`,
+        which returns their values by item.
+        """
+        values = {}
+        pending = {}
+        to_compute = []
+        keys = {item: self._versioned(namespace, key) for item, key in keys.items()}
+        entries = await self._lookup_many(namespace, list(keys.values()))
+        now = time.time()
+        for item, key in keys.items():
+            entry, tier = entries[key]
+            if entry is not None and entry.expires_at > now:
+                result = "stale" if entry.stale_at <= now else "hit"
+                values[item] = entry.value
+            else:
+                tier, result = "none", "miss"
+            FEED_CACHE_REQUESTS.labels(
+                namespace=namespace, tier=tier, result=result
+            ).inc()
+            if result == "hit":
+                continue
+            task = self._inflight.get(f"{namespace}:{key}")
+            if task is None:
+                to_compute.append((item, key))
+            elif result == "miss":
+                pending[item] = task
+
+        if to_compute:
+            batch = asyncio.create_task(
+                compute([item for item, _ in to_compute]), context=shared_context()
+            )
+
+            async def pick(item):
+                return (await batch)[item]
+
+            for item, key in to_compute:
+                task = self._run(
+                    namespace, key, partial(pick, item), ttl=ttl, early_ttl=early_ttl
+                )
+                if item not in values:
+                    pending[item] = task
+        for item, task in pending.items():
+            values[item] = await asyncio.shield(task)
+        return values
+
+    def early(
+        self,
+        namespace: str,
+        ttl: timedelta,
+        early_ttl: timedelta,
+        skip_kwargs: Collection[str] = ("pool",),
+    ):
+        """
+        Decorator that caches the result of an async function.
+        The cache key is built from the function name and its bound
+        arguments, with defaults applied and `skip_kwargs` left out by
+        parameter name, however they are passed.
+        """
+
+        def decorator(func: Callable[..., Awaitable[Any]]):
+            signature = inspect.signature(func)
+
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                key_args = [
+                    (name, value)
+                    for name, value in bound.arguments.items()
+                    if name not in skip_kwargs
+                ]
+                key = repr((func.__name__, key_args))
+                return await self.get_or_compute(
+                    namespace,
+                    key,
+                    lambda: func(*args, **kwargs),
+                    ttl=ttl,
+                    early_ttl=early_ttl,
+                )
+
+            return wrapper
+
+        return decorator
+
+    def _versioned(self, namespace: str, key: str) -> str:
+        return f"v{self._versions.get(namespace, '')}:{key}"
+
+    async def _lookup(self, namespace: str, key: str) -> tuple[CacheEntry | None, str]:
+        """The entry of a versioned key, and the tier it was found in."""
+        cache_key = f"{namespace}:{key}"
+        entry = self._l1_get(cache_key)
+        if entry is not None or self._cache_pool is None:
+            return entry, "l1"
+        entry = await self._l2_get(namespace, key)
+        if entry is not None:
+            self._l1_put(cache_key, entry)
+        return entry, "l2"
+
+    async def _lookup_many(
+        self, namespace: str, keys: list[str]
+    ) -> dict[str, tuple[CacheEntry | None, str]]:
+        """_lookup for several keys, with one L2 query for all the L1 misses."""
+        found = {key: (self._l1_get(f"{namespace}:{key}"), "l1") for key in keys}
+        missing = [key for key, (entry, _) in found.items() if entry is None]
+        if not missing or self._cache_pool is None:
+            return found
+        rows = await cache_db_utils.get_cache_entries(
+            namespace,
+            [self._l2_key(key) for key in missing],
+            cache_pool=self._cache_pool,
+        )
+        for key in missing:
+            row = rows.get(self._l2_key(key))
+            entry = None if row is None else self._decode(namespace, key, row)
+            if entry is not None:
+                self._l1_put(f"{namespace}:{key}", entry)
+            found[key] = entry, "l2"
+        return found
+
+    def _run(
+        self,
+        namespace: str,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: timedelta,
+        early_ttl: timedelta,
+    ) -> asyncio.Task:
+        cache_key = f"{namespace}:{key}"
+        task = self._inflight.get(cache_key)
+        if task is None:
+            # shared by every caller of this key, so not bound to the deadline
+            # ... of the request that happened to start it
+            task = asyncio.create_task(
+                self._compute_and_store(namespace, key, compute, ttl, early_ttl),
+                context=shared_context(),
+            )
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda t: self._on_done(cache_key, t))
+        return task
+
+    def _on_done(self, cache_key: str, task: asyncio.Task):
+        if self._inflight.get(cache_key) is task:
+            del self._inflight[cache_key]
+        # background refreshes have nobody awaiting them; log their failures here
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Failed to compute {cache_key}: {task.exception()}")
+
+    async def _compute_and_store(
+        self,
+        namespace: str,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: timedelta,
+        early_ttl: timedelta,
+    ) -> Any:
+        try:
+            value = await compute()
+        except Exception:
+            FEED_CACHE_REFRESHES.labels(namespace=namespace, outcome="error").inc()
+            raise
+        FEED_CACHE_REFRESHES.labels(namespace=namespace, outcome="ok").inc()
+        now = time.time()
+        entry = CacheEntry(
+            value=value,
+            stale_at=now + early_ttl.total_seconds(),
+            expires_at=now + ttl.total_seconds(),
+        )
+        self._l1_put(f"{namespace}:{key}", entry)
+        if self._cache_pool is not None:
+            await self._l2_put(namespace, key, entry)
+        return value
+
+    def _l1_get(self, cache_key: str) -> CacheEntry | None:
+        entry = self._l1.get(cache_key)
+        if entry is not None:
+            self._l1.move_to_end(cache_key)
+        return entry
+
+    def _l1_put(self, cache_key: str, entry: CacheEntry):
+        self._l1[cache_key] = entry
+        self._l1.move_to_end(cache_key)
+        while len(self._l1) > self._l1_size:
+            self._l1.popitem(last=False)
+
+    @staticmethod
+    def _l2_key(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    async def _l2_get(self, namespace: str, key: str) -> CacheEntry | None:
+        row = await cache_db_utils.get_cache_entry(
+            namespace, self._l2_key(key), cache_pool=self._cache_pool
+        )
+        if row is None:
+            return None
+        return self._decode(namespace, key, row)
+
+    @staticmethod
+    def _decode(namespace: str, key: str, row: Mapping[str, Any]) -> CacheEntry | None:
+        try:
+            value = pickle.loads(row["value"])
+        except Exception as e:
+            logger.error(f"Ignoring undecodable cache entry {namespace}:{key}: {e}")
+            return None
+        return CacheEntry(
+            value=value,
+            stale_at=float(row["stale_at"]),
+            expires_at=float(row["expires_at"]),
+        )
+
+    async def _l2_put(self, namespace: str, key: str, entry: CacheEntry):
+        await cache_db_utils.set_cache_entry(
+            namespace,
+            self._l2_key(key),
+            pickle.dumps(entry.value),
+            stale_at=datetime.fromtimestamp(entry.stale_at, UTC),
+            expires_at=datetime.fromtimestamp(entry.expires_at, UTC),
+            cache_pool=self._cache_pool,
+        )
+
+
+feed_cache = TieredCache(l1_size=settings.FEED_CACHE_L1_SIZE)
@@ -0,0 +1,193 @@
+import time
+from collections.abc import Iterable
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from asyncpg.pool import Pool
+from loguru import logger
+
+from ..config import settings
+from . import db_utils
+from .reloadable import Reloadable
+
+# update_ts is the writer's transaction start, so rows can commit
+# with an update_ts slightly behind the last one we have seen
+_WATERMARK_OVERLAP = timedelta(minutes=5)
+
+
+def _daily_earnings(row: dict, now: datetime) -> int:
+    # same as the CASE in db_utils.get_top_channel_earnings
+    if row["update_ts"] is None:
+        return row["latest_earnings"]
+    if row["update_ts"] < now - timedelta(days=1):
+        return 0
+    if row["insert_ts"] == row["update_ts"]:  # airdrop
+        return 0
+    return row["latest_earnings"]
+
+
+class ChannelTokenBalances:
+    """
+    k3l_channel_tokens_bal held in memory as fid -> balance per channel.
+    The table is only ever upserted with a fresh update_ts, so after the
+    initial load only rows updated since the last refresh are fetched.
+    """
+
+    def __init__(self) -> None:
+        self._channels: dict[str, dict[int, dict]] | None = None
+        # channel -> fids sorted by balance, highest first; built on demand
+        self._by_balance: dict[str, np.ndarray] = {}
+        self._watermark: datetime | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._channels is not None
+
+    async def refresh(self, pool: Pool):
+        since = None
+        if self._channels is not None and self._watermark is not None:
+            since = self._watermark - _WATERMARK_OVERLAP
+        rows = db_utils.check_dict_rows(
+            await db_utils.get_channel_token_balances(since, pool=pool),
+            "token balances",
+        )
+        channels = {} if since is None else self._channels
+        for row in rows:
+            channels.setdefault(row["channel_id"], {})[row["fid"]] = row
+            self._by_balance.pop(row["channel_id"], None)
+        if since is None:
+            self._by_balance = {}
+            logger.info(f"Loaded token balances of {len(channels)} channels")
+        self._channels = channels
+        latest = max(
+            (row["update_ts"] for row in rows if row["update_ts"]), default=None
+        )
+        if latest and (self._watermark is None or latest > self._watermark):
+            self._watermark = latest
+
+    def get(self, channel_id: str, fid: int) -> dict | None:
+        """Same fields as `db_utils.get_fid_channel_token_balance`."""
+        row = self._channels.get(channel_id, {}).get(fid)
+        if row is None:
+            return None
+        return {
+            "fid": row["fid"],
+            "channel_id": row["channel_id"],
+            "balance": row["balance"],
+            "earnings_today": _daily_earnings(row, datetime.now(UTC)),
+            "last_earnings": row["latest_earnings"],
+            "last_earnings_ts": row["update_ts"],
+        }
+
+    def _fids_by_balance(self, channel_id: str) -> np.ndarray:
+        fids = self._by_balance.get(channel_id)
+        if fids is None:
+            rows = self._channels.get(channel_id, {})
+            fids = np.fromiter(rows.keys(), dtype=np.int64, count=len(rows))
+            balances = np.fromiter(
+                (row["balance"] for row in rows.values()),
+                dtype=np.int64,
+                count=len(rows),
+            )
+            fids = fids[np.argsort(-balances, kind="stable")]
+            self._by_balance[channel_id] = fids
+        return fids
+
+    def top(self, channel_id: str, offset: int, limit: int) -> list[dict]:
+        """
+        Lite rows of `db_utils.get_top_channel_earnings` ordered by
+        balance, then daily earnings.
+        """
+        rows = self._channels.get(channel_id, {})
+        fids = self._fids_by_balance(channel_id)
+        end = offset + limit
+        if end < len(fids):
+            # daily earnings only break ties, so the page is within the
+            # top `end` balances plus whatever ties the last one of them
+            last_balance = rows[int(fids[end - 1])]["balance"]
+            while end < len(fids) and rows[int(fids[end])]["balance"] == last_balance:
+                end += 1
+        now = datetime.now(UTC)
+        page = [
+            {
+                "fid": row["fid"],
+                "balance": row["balance"],
+                "daily_earnings": _daily_earnings(row, now),
+                "latest_earnings": row["latest_earnings"],
+                "bal_update_ts": row["update_ts"],
+            }
+            for row in (rows[int(fid)] for fid in fids[:end])
+        ]
+        page.sort(key=lambda row: (row["balance"], row["daily_earnings"]), reverse=True)
+        return page[offset : offset + limit]
+
+
+class TokenHolders(Reloadable):
+    """
+    ERC20 holder balances (k3l_token_holding_fids) of recently requested
+    tokens as fid -> balance. The materialized view has no update
+    timestamps, so each token is reloaded in full every
+    TOKEN_HOLDERS_REFRESH_SECS; tokens not requested for
+    TOKEN_HOLDERS_IDLE_SECS are dropped.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._tokens: dict[bytes, tuple[dict[int, Decimal], float]] = {}
+        self._requested_at: dict[bytes, float] = {}
+
+    def balances(
+        self, token_address: bytes, fids: Iterable[int]
+    ) -> dict[int, Decimal] | None:
+        """Balances of the holders among `fids`, or None to ask the DB."""
+        if token_address not in self._requested_at:
+            if len(self._requested_at) >= settings.TOKEN_HOLDERS_MAX_TOKENS:
+                return None
+            # first request for this token; load it in the background
+            self.request_reload()
+        self._requested_at[token_address] = time.time()
+        holders = self._tokens.get(token_address)
+        if holders is None:
+            return None
+        return {fid: holders[0][fid] for fid in fids if fid in holders[0]}
+
+    async def refresh(self, pool: Pool):
+        now = time.time()
+        cutoff = now - settings.TOKEN_HOLDERS_IDLE_SECS
+        for token_address in [t for t, ts in self._requested_at.items() if ts < cutoff]:
+            del self._requested_at[token_address]
+            self._tokens.pop(token_address, None)
+        for token_address in list(self._requested_at):
+            holders = self._tokens.get(token_address)
+            if holders and now - holders[1] < settings.TOKEN_HOLDERS_REFRESH_SECS:
+                continue
+            rows = db_utils.check_dict_rows(
+                await db_utils.get_token_holders(token_address, pool=pool),
+                "token holders",
+            )
+            self._tokens[token_address] = (
+                {row["fid"]: row["value"] for row in rows},
+                time.time(),
+            )
+            logger.info(f"Loaded {len(rows)} holders of 0x{token_address.hex()}")
+
+
+async def refresh_token_balances(
+    balances: ChannelTokenBalances, holders: TokenHolders, pool: Pool
+):
+    logger.info("Starting token balances refresh loop")
+    while True:
+        try:
+            await balances.refresh(pool)
+        except Exception as e:
+            logger.error(f"Failed to refresh channel token balances: {e}")
+        try:
+            await holders.refresh(pool)
+        except Exception as e:
+            logger.error(f"Failed to refresh token holders: {e}")
+        await holders.wait_for_reload(settings.TOKEN_BALANCES_REFRESH_SECS)
+
+
+channel_token_balances = ChannelTokenBalances()
+token_holders = TokenHolders()
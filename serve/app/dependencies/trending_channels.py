@@ -0,0 +1,245 @@
+import asyncio
+import io
+import time
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+import pandas
+from asyncpg.pool import Pool
+from loguru import logger
+
+from ..config import DBVersion, settings
+from ..models.feed_model import ChannelTimeframe
+from ..telemetry import acquire_timed, query_timer
+from .channel_metadata import channel_metadata
+from .data_versions import data_versions
+from .replicas import QueryClass, replica_router
+
+# highest rankThreshold that /channels/trending accepts
+MAX_RANK_THRESHOLD = 100000
+# same windows as PARENT_CASTS_AGE
+LOOKBACKS = {
+    ChannelTimeframe.DAY: timedelta(days=1),
+    ChannelTimeframe.WEEK: timedelta(days=7),
+    ChannelTimeframe.MONTH: timedelta(days=30),
+}
+_RETENTION = max(LOOKBACKS.values()) + timedelta(hours=1)
+_SECS_PER_HOUR = 3600
+
+# same fids as db_utils.get_trending_channels
+RANKS_SQL = """
+    SELECT profile_id, rank
+    FROM k3l_rank
+    WHERE strategy_id = 9 AND rank <= $1
+"""
+# k3l_recent_parent_casts has no channel_id; like db_utils.get_trending_channels,
+# ... channels are the warpcast_channels_data rows of the root parent urls
+ACTIVITY_SQL = """
+    WITH buckets AS (
+        SELECT
+            floor(extract(epoch FROM timestamp) / 3600)::bigint AS hour,
+            root_parent_url AS url,
+            fid,
+            count(*) AS casts
+        FROM k3l_recent_parent_casts
+        WHERE timestamp >= $1 AND root_parent_url IS NOT NULL
+        GROUP BY 1, 2, 3
+    )
+    SELECT buckets.hour, ch.id, buckets.fid, buckets.casts
+    FROM buckets
+    INNER JOIN warpcast_channels_data AS ch ON (ch.url = buckets.url)
+"""
+
+
+def _parse_activity(data: bytes) -> pandas.DataFrame:
+    return pandas.read_csv(
+        io.BytesIO(data),
+        names=["hour", "channel_id", "fid", "casts"],
+        dtype={"hour": np.int64, "channel_id": str, "fid": np.int64, "casts": np.int64},
+        # channel ids like "nan" are not missing values
+        keep_default_na=False,
+    )
+
+
+async def _copy(pool: Pool, query_name: str, sql_query: str, *args) -> bytes:
+    buf = io.BytesIO()
+    pool = replica_router.pool_for(pool, QueryClass.HEAVY)
+    async with acquire_timed(pool, query_name) as connection:
+        with query_timer(pool, query_name):
+            await connection.copy_from_query(
+                sql_query,
+                *args,
+                output=buf,
+                format="csv",
+                timeout=settings.POSTGRES_TIMEOUT_SECS,
+            )
+    return buf.getvalue()
+
+
+class TrendingChannels:
+    """
+    /channels/trending from hourly activity buckets kept in memory:
+    root casts per (hour, channel, fid) over the last 30 days, plus the
+    global ranks of the top fids. Every TRENDING_CHANNELS_REFRESH_SECS
+    only the last TRENDING_CHANNELS_OVERLAP_HOURS of buckets are refetched;
+    everything is reloaded every TRENDING_CHANNELS_FULL_REFRESH_SECS.
+    A ranking is the sum of a channel's buckets within the lookback whose
+    fid ranks within the threshold, memoized until the next refresh.
+    Windows start at an hour boundary, i.e. up to an hour before
+    `now() - lookback`.
+    """
+
+    def __init__(self) -> None:
+        # bucket columns, aligned
+        self._hours: np.ndarray | None = None
+        self._channels: np.ndarray = np.empty(0, dtype=np.int64)
+        self._fids: np.ndarray = np.empty(0, dtype=np.int64)
+        self._casts: np.ndarray = np.empty(0, dtype=np.int64)
+        # rank of each bucket's fid; MAX_RANK_THRESHOLD + 1 if unranked
+        self._fid_ranks: np.ndarray = np.empty(0, dtype=np.int64)
+        self._channel_ids: list[str] = []
+        self._channel_idx: dict[str, int] = {}
+        # dense fid -> rank; 0 if unranked
+        self._ranks: np.ndarray | None = None
+        self._ranks_stale = True
+        self._loaded_at = 0.0
+        self._rankings: dict[tuple[ChannelTimeframe, int], list[tuple[str, int]]] = {}
+
+    def request_ranks_reload(self):
+        self._ranks_stale = True
+
+    def ranking(
+        self, lookback: ChannelTimeframe, rank_threshold: int
+    ) -> list[tuple[str, int]] | None:
+        """(channel id, score) by descending score, or None to ask the DB."""
+        if (
+            self._hours is None
+            or self._ranks is None
+            or rank_threshold > MAX_RANK_THRESHOLD
+        ):
+            return None
+        key = (lookback, rank_threshold)
+        ranking = self._rankings.get(key)
+        if ranking is None:
+            now = datetime.now(UTC).timestamp()
+            start_hour = (now - LOOKBACKS[lookback].total_seconds()) // _SECS_PER_HOUR
+            mask = (self._hours >= start_hour) & (self._fid_ranks <= rank_threshold)
+            scores = np.bincount(
+                self._channels[mask],
+                weights=self._casts[mask],
+                minlength=len(self._channel_ids),
+            ).astype(np.int64)
+            order = np.argsort(-scores, kind="stable")
+            order = order[scores[order] > 0]
+            ranking = [(self._channel_ids[i], int(scores[i])) for i in order]
+            self._rankings[key] = ranking
+        return ranking
+
+    async def top(
+        self,
+        lookback: ChannelTimeframe,
+        rank_threshold: int,
+        offset: int,
+        limit: int,
+        pool: Pool,
+    ) -> list[dict] | None:
+        """Same rows as `db_utils.get_trending_channels`, or None to ask the DB."""
+        ranking = self.ranking(lookback, rank_threshold)
+        if ranking is None:
+            return None
+        rows = [
+            {"id": channel_id, "score": score}
+            for channel_id, score in ranking[offset : offset + limit]
+        ]
+        if settings.DB_VERSION == DBVersion.EIGEN2:
+            for row in rows:
+                metadata = await channel_metadata.get(row["id"], pool=pool) or {}
+                row["pinnedcasthash"] = metadata.get("pinnedcasthash")
+        return rows
+
+    def _channel_codes(self, channel_ids: np.ndarray) -> np.ndarray:
+        for channel_id in pandas.unique(channel_ids):
+            if channel_id not in self._channel_idx:
+                self._channel_idx[channel_id] = len(self._channel_ids)
+                self._channel_ids.append(channel_id)
+        return pandas.Index(self._channel_ids).get_indexer(channel_ids)
+
+    def _rank_of(self, fids: np.ndarray) -> np.ndarray:
+        ranks = np.full(len(fids), MAX_RANK_THRESHOLD + 1, dtype=np.int64)
+        known = fids < len(self._ranks)
+        ranked = self._ranks[fids[known]]
+        ranks[known] = np.where(ranked > 0, ranked, MAX_RANK_THRESHOLD + 1)
+        return ranks
+
+    async def load_ranks(self, pool: Pool):
+        data = await _copy(pool, "load_trending_ranks", RANKS_SQL, MAX_RANK_THRESHOLD)
+        loop = asyncio.get_running_loop()
+        df = await loop.run_in_executor(
+            None,
+            lambda: pandas.read_csv(
+                io.BytesIO(data), names=["fid", "rank"], dtype=np.int64
+            ),
+        )
+        fids = df["fid"].to_numpy()
+        ranks = np.zeros(int(fids.max(initial=0)) + 1, dtype=np.int64)
+        ranks[fids] = df["rank"].to_numpy()
+        self._ranks = ranks
+        self._ranks_stale = False
+        if self._hours is not None:
+            self._fid_ranks = self._rank_of(self._fids)
+        self._rankings = {}
+        logger.info(f"Loaded ranks of {len(fids)} fids for trending channels")
+
+    async def refresh(self, pool: Pool):
+        full = (
+            self._hours is None
+            or time.time() - self._loaded_at
+            > settings.TRENDING_CHANNELS_FULL_REFRESH_SECS
+        )
+        if self._ranks is None or self._ranks_stale or full:
+            await self.load_ranks(pool)
+        now = datetime.now(UTC).replace(tzinfo=None)
+        if full:
+            since = now - _RETENTION
+        else:
+            since = now - timedelta(hours=settings.TRENDING_CHANNELS_OVERLAP_HOURS)
+        # refetch whole hours so that each bucket is either kept or replaced
+        since = since.replace(minute=0, second=0, microsecond=0)
+        data = await _copy(pool, "load_trending_activity", ACTIVITY_SQL, since)
+        loop = asyncio.get_running_loop()
+        df = await loop.run_in_executor(None, _parse_activity, data)
+        hours = df["hour"].to_numpy()
+        channels = self._channel_codes(df["channel_id"].to_numpy())
+        fids = df["fid"].to_numpy()
+        casts = df["casts"].to_numpy()
+        if not full:
+            since_hour = since.replace(tzinfo=UTC).timestamp() // _SECS_PER_HOUR
+            retention_hour = (
+                now.replace(tzinfo=UTC) - _RETENTION
+            ).timestamp() // _SECS_PER_HOUR
+            keep = (self._hours < since_hour) & (self._hours >= retention_hour)
+            hours = np.concatenate([self._hours[keep], hours])
+            channels = np.concatenate([self._channels[keep], channels])
+            fids = np.concatenate([self._fids[keep], fids])
+            casts = np.concatenate([self._casts[keep], casts])
+        self._channels, self._fids, self._casts = channels, fids, casts
+        self._fid_ranks = self._rank_of(fids)
+        self._hours = hours
+        self._rankings = {}
+        if full:
+            self._loaded_at = time.time()
+            logger.info(f"Loaded {len(hours)} trending channel activity buckets")
+
+
+async def refresh_trending_channels(trending: TrendingChannels, pool: Pool):
+    logger.info("Starting trending channels refresh loop")
+    while True:
+        try:
+            await trending.refresh(pool)
+        except Exception as e:
+            logger.error(f"Failed to refresh trending channels: {e}")
+        await asyncio.sleep(settings.TRENDING_CHANNELS_REFRESH_SECS)
+
+
+trending_channels = TrendingChannels()
+data_versions.subscribe("k3l_rank", trending_channels.request_ranks_reload)
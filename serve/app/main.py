@@ -16,9 +16,29 @@ from fastapi.openapi.utils import get_openapi
 from fastapi.staticfiles import StaticFiles
 from loguru import logger
 
+from .admission import AdmissionControlMiddleware
 from .config import settings
-from .dependencies import logging
+from .dependencies import cache_db_utils, logging
+from .dependencies.cast_action_store import cast_action_store, tail_cast_actions
+from .dependencies.channel_metadata import channel_metadata, refresh_channel_metadata
+from .dependencies.channel_ranks import channel_ranks, refresh_channel_ranks
+from .dependencies.data_versions import data_versions, listen_data_versions
+from .dependencies.feed_materializer import feed_materializer, materialize_channel_feeds
+from .dependencies.profiler import record_profiles
+from .dependencies.replicas import QueryClass, check_replicas_lag, replica_router
+from .dependencies.slow_queries import current_request
+from .dependencies.tiered_cache import feed_cache
+from .dependencies.token_balances import (
+    channel_token_balances,
+    refresh_token_balances,
+    token_holders,
+)
+from .dependencies.trending_channels import (
+    refresh_trending_channels,
+    trending_channels,
+)
 from .graph_loader import GraphLoader
+from .routers.admin_router import router as admin_router
 from .routers.cast_router import router as cast_router
 from .routers.channel_router import router as channel_router
 from .routers.direct_router import router as direct_router
@@ -29,7 +49,7 @@ from .routers.localtrust_router import router as lt_router
 from .routers.metadata_router import router as metadata_router
 from .routers.token_router import router as token_router
 from .routers.user_router import router as user_router
-from .telemetry import PrometheusMiddleware, metrics
+from .telemetry import PrometheusMiddleware, metrics, register_db_pool
 
 logger.remove()
 level_per_module = {
@@ -101,6 +121,19 @@ async def _check_and_reload_models(loader: GraphLoader):
         await loop.run_in_executor(executor=None, func=loader.reload_if_required)
 
 
+async def _purge_cache_db(cache_pool: asyncpg.Pool):
+    logger.info("Starting cache DB purge loop")
+    while True:
+        await asyncio.sleep(settings.FEED_CACHE_PURGE_FREQ_SECS)
+        try:
+            await cache_db_utils.purge_expired_cache_entries(cache_pool)
+        except Exception as e:
+            logger.error(f"Failed to purge cache DB: {e}")
+
+
+STATEMENT_TIMEOUT = {"statement_timeout": str(settings.POSTGRES_TIMEOUT_SECS * 1000)}
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Automatically called by FastAPI when server is started"""
@@ -112,9 +145,42 @@ async def lifespan(app: FastAPI):
         settings.POSTGRES_URI.get_secret_value(),
         min_size=1,
         max_size=settings.POSTGRES_POOL_SIZE,
+        # stops statements on the server even if the client is gone
+        server_settings=STATEMENT_TIMEOUT,
     )
+    register_db_pool("primary", app_state['db_pool'])
     logger.info("DB pool created")
 
+    replica_pools = {}
+    for query_class, hosts in (
+        (QueryClass.LATENCY, settings.DB_LATENCY_REPLICA_HOSTS),
+        (QueryClass.HEAVY, settings.DB_HEAVY_REPLICA_HOSTS),
+    ):
+        replica_pools[query_class] = {}
+        for idx, host in enumerate(hosts):
+            logger.info(f"Creating {query_class} replica pool for {host}")
+            name = f"{query_class}-replica-{idx}"
+            try:
+                pool = await asyncpg.create_pool(
+                    settings.replica_postgres_uri(host).get_secret_value(),
+                    min_size=1,
+                    max_size=settings.DB_REPLICA_POOL_SIZE,
+                    server_settings=STATEMENT_TIMEOUT,
+                )
+            except Exception as e:
+                # replicas only add capacity; serve from the primary without them
+                logger.error(f"Failed to create replica pool for {host}: {e}")
+                continue
+            register_db_pool(name, pool)
+            replica_pools[query_class][name] = pool
+    replica_router.setup(app_state['db_pool'], replica_pools)
+    if replica_router.pools():
+        # put replicas that are in sync into rotation before serving requests
+        await replica_router.check_lag()
+        app_state['replica_lag_task'] = asyncio.create_task(
+            check_replicas_lag(replica_router)
+        )
+
     if settings.CACHE_DB_ENABLED:
         logger.info("Creating Cache DB pool")
         app_state['cache_db_pool'] = await asyncpg.create_pool(
@@ -122,9 +188,59 @@ async def lifespan(app: FastAPI):
             min_size=1,
             max_size=settings.CACHE_POSTGRES_POOL_SIZE,
         )
+        register_db_pool("cache", app_state['cache_db_pool'])
         logger.info("Cache DB pool created")
+        app_state['cache_purge_task'] = asyncio.create_task(
+            _purge_cache_db(app_state['cache_db_pool'])
+        )
     else:
         app_state['cache_db_pool'] = None
+    # feed cache falls back to in-process only if there is no cache DB
+    feed_cache.setup(app_state['cache_db_pool'])
+    # NOTIFY is not forwarded to replicas; listen on the primary
+    app_state['data_version_task'] = asyncio.create_task(
+        listen_data_versions(data_versions, settings.POSTGRES_URI.get_secret_value())
+    )
+
+    if settings.CHANNEL_METADATA_IN_MEMORY:
+        logger.info("Loading channel metadata")
+        try:
+            await channel_metadata.load(app_state['db_pool'])
+        except Exception as e:
+            # lookups fall back to the DB until the next refresh succeeds
+            logger.error(f"Failed to load channel metadata: {e}")
+        app_state['channel_metadata_task'] = asyncio.create_task(
+            refresh_channel_metadata(channel_metadata, app_state['db_pool'])
+        )
+
+    if settings.CHANNEL_RANKS_IN_MEMORY:
+        # lookups use the DB until the first load completes
+        app_state['channel_ranks_task'] = asyncio.create_task(
+            refresh_channel_ranks(channel_ranks, app_state['db_pool'])
+        )
+    if settings.FEED_MATERIALIZE_ENABLED:
+        app_state['feed_materializer_task'] = asyncio.create_task(
+            materialize_channel_feeds(feed_materializer, app_state['db_pool'])
+        )
+    if settings.TOKEN_BALANCES_IN_MEMORY:
+        # lookups use the DB until the first load completes
+        app_state['token_balances_task'] = asyncio.create_task(
+            refresh_token_balances(
+                channel_token_balances, token_holders, app_state['db_pool']
+            )
+        )
+    if settings.TRENDING_CHANNELS_IN_MEMORY:
+        # /channels/trending uses the DB until the first load completes
+        app_state['trending_channels_task'] = asyncio.create_task(
+            refresh_trending_channels(trending_channels, app_state['db_pool'])
+        )
+    if settings.CAST_ACTION_STORE_ENABLED:
+        # the popular neighbors feed uses the DB until the first load completes
+        app_state['cast_action_store_task'] = asyncio.create_task(
+            tail_cast_actions(cast_action_store, app_state['db_pool'])
+        )
+    if settings.PROFILER_CONTINUOUS_ENABLED:
+        app_state['profiler_task'] = asyncio.create_task(record_profiles())
 
     logger.info("Loading graphs")
     # Create a singleton instance of GraphLoader
@@ -141,16 +257,26 @@ async def lifespan(app: FastAPI):
 
     yield
     """Execute when server is shutdown"""
+    # stop the background loops before closing the pools they query,
+    # ... so that none of them holds up or fails on a closing pool
+    logger.info("Stopping background tasks")
+    tasks = [task for key, task in app_state.items() if key.endswith('_task')]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
     logger.info("Closing DB pool")
     await app_state['db_pool'].close()
 
+    if 'replica_lag_task' in app_state:
+        logger.info("Closing replica DB pools")
+        for pool in replica_router.pools():
+            await pool.close()
+
     if settings.CACHE_DB_ENABLED:
         logger.info("Closing Cache DB pool")
         await app_state['cache_db_pool'].close()
 
-    logger.info("Closing graph loader")
-    app_state['graph_loader_task'].cancel()
-
 
 # TODO: change this to os env var once blue-green deployment is set up
 APP_NAME = "farcaster-graph-a"  # os.environ.get("APP_NAME", "farcaster-graph-a")
@@ -183,10 +309,13 @@ app.include_router(cast_router, prefix='/casts')
 app.include_router(channel_router, prefix='/channels')
 app.include_router(user_router, prefix='/users')
 app.include_router(token_router, prefix='/tokens')
+app.include_router(admin_router, prefix='/_admin')
 
 app.openapi = custom_openapi
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# inside the metrics middleware so that shed requests show up as 503s
+app.add_middleware(AdmissionControlMiddleware)
 # Setting metrics middleware
 app.add_middleware(PrometheusMiddleware, app_name=APP_NAME)
 app.add_route("/metrics", metrics)
@@ -201,6 +330,9 @@ async def session_middleware(request: Request, call_next):
     request.state.graphs = app_state['graph_loader'].get_graphs()
     request.state.db_pool = app_state['db_pool']
     request.state.cache_db_pool = app_state['cache_db_pool']
+    # for the slow query log; tasks started by the request inherit it
+    query = f"?{request.url.query}" if request.url.query else ""
+    current_request.set(f"{request.method} {request.url.path}{query}")
     # call_next is a built-in FastAPI function that calls the actual API
     response = await call_next(request)
     elapsed_time = time.perf_counter() - start_time
@@ -0,0 +1,71 @@
+from collections.abc import Iterator
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import batched
+from typing import Any
+
+import asyncpg
+import orjson
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NDJSON_ROWS_PER_CHUNK = 100
+
+
+def _default(obj: Any) -> Any:
+    # jsonable_encoder's conversions for what our queries return, except bytes
+    if isinstance(obj, asyncpg.Record):
+        return dict(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, bytes):
+        # binary columns (hashes, addresses) are not text; hex like the
+        # ... queries that encode them in SQL
+        return "0x" + obj.hex()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def json_dumps(content: Any) -> bytes:
+    return orjson.dumps(
+        content,
+        default=_default,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+    )
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Encodes asyncpg Records and query result types directly,
+    skipping fastapi's per-value jsonable_encoder traversal.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return json_dumps(content)
+
+
+def _ndjson_lines(content: dict, rows_key: str) -> Iterator[bytes]:
+    for rows in batched(content[rows_key], NDJSON_ROWS_PER_CHUNK):
+        yield b"".join(json_dumps(row) + b"\n" for row in rows)
+    trailer = {k: v for k, v in content.items() if k != rows_key}
+    if trailer:
+        yield json_dumps(trailer) + b"\n"
+
+
+def records_response(
+    request: Request, content: dict, rows_key: str = "result"
+) -> Response:
+    """
+    Response for a `{"result": rows, ...}` payload. Clients that accept
+    NDJSON get one row per line, followed by a line with the other fields
+    of the payload (e.g. `next_cursor`) if there are any.
+    """
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return StreamingResponse(
+            _ndjson_lines(content, rows_key), media_type=NDJSON_MEDIA_TYPE
+        )
+    return FastJSONResponse(content)
@@ -0,0 +1,54 @@
+import asyncio
+from datetime import UTC, datetime
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from loguru import logger
+
+from ..dependencies import profiler
+from ..dependencies.admin import require_admin_key
+from ..dependencies.slow_queries import slow_queries
+
+router = APIRouter(dependencies=[Depends(require_admin_key)], include_in_schema=False)
+
+# one on-demand profile at a time, so that profiling cannot pile up overhead
+_profiling = asyncio.Lock()
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def get_profile(
+    seconds: Annotated[float, Query(gt=0, le=300)] = 10,
+    rate_hz: Annotated[float, Query(gt=0, le=1000)] = 100,
+    tasks: Annotated[bool, Query()] = True,
+):
+    """
+    Samples the stacks of this process for `seconds` at `rate_hz`, plus the
+    coroutine stacks of asyncio tasks unless `tasks` is false, and returns
+    them as collapsed stacks for flamegraph.pl or speedscope. \n
+    Example: curl -H "X-Admin-Key: $KEY" "$HOST/_admin/profile?seconds=30" > out.collapsed
+    """
+    if _profiling.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with _profiling:
+        logger.info(f"Profiling for {seconds} secs at {rate_hz} Hz")
+        collapsed = await profiler.profile(seconds, rate_hz, tasks)
+    filename = f"profile-{datetime.now(UTC):%Y%m%dT%H%M%SZ}.collapsed"
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/slow_queries")
+async def get_slow_queries(
+    query_name: Annotated[str | None, Query()] = None,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 50,
+):
+    """
+    The latest queries slower than SLOW_QUERY_THRESHOLD_SECS, newest first,
+    with their SQL, bound parameters, the request that ran them, duration,
+    rows, pool wait and, with SLOW_QUERY_EXPLAIN, their plan. \n
+    Example: curl -H "X-Admin-Key: $KEY" "$HOST/_admin/slow_queries?query_name=get_popular_channel_casts_lite"
+    """
+    return {"result": slow_queries.entries(query_name)[:limit]}
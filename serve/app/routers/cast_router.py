@@ -1,20 +1,36 @@
 import asyncio
 import urllib.parse
 from asyncio import TimeoutError
+from collections.abc import Awaitable, Callable
+from itertools import batched
 from typing import Annotated, Any, List
 
 import niquests
 from asyncpg.pool import Pool
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from loguru import logger
 from pydantic_core import ValidationError
 
 from ..config import settings
-from ..dependencies import db_pool, db_utils, graph
-from ..models.channel_model import ChannelRankingsTimeframe
-from ..models.feed_model import FeedMetadata, NewUsersFeed, TokenFeed
+from ..dependencies import cache_db_utils, db_pool, db_utils, graph
+from ..dependencies.cursor import decode_cursor, encode_cursor
+from ..dependencies.deadlines import deadline
+from ..dependencies.feed_materializer import default_feed_type, feed_materializer
+from ..models.channel_model import (
+    CHANNEL_RANKING_STRATEGY_NAMES,
+    ChannelRankingsTimeframe,
+)
+from ..models.feed_model import (
+    CASTS_AGE,
+    FarconFeed,
+    FeedMetadata,
+    NewUsersFeed,
+    TokenFeed,
+    TrendingFeed,
+)
 from ..models.graph_model import Graph, GraphTimeframe
 from ..models.score_model import ScoreAgg, Weights
+from ..responses import records_response
 from . import channel_router
 
 router = APIRouter(tags=["Casts"])
@@ -35,16 +51,62 @@ async def get_user_pinned_channels(fid: int) -> list[str]:
         return []
 
 
-async def task_with_timeout(task_id, task_coroutine, task_timeout):
+async def gather_bounded(
+    jobs: dict[Any, Callable[[], Awaitable[list[dict]]]],
+    concurrency: int,
+    budget_secs: float,
+    enough: int | None = None,
+    count: Callable[[list[dict]], int] = len,
+) -> dict[Any, list[dict] | Exception]:
+    """
+    Run jobs at most `concurrency` at a time within `budget_secs`, in order.
+    Stops early once the successful jobs have produced `enough` rows, as
+    counted by `count`.
+    Jobs that did not finish in time are cancelled and absent from the result.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+    num_rows = 0
+    enough_event = asyncio.Event()
+
+    async def run(job_id, job):
+        nonlocal num_rows
+        async with semaphore:
+            if enough_event.is_set():
+                return
+            try:
+                rows = await job()
+            except Exception as e:
+                results[job_id] = e
+                return
+            results[job_id] = rows
+            num_rows += count(rows)
+            if enough is not None and num_rows >= enough:
+                enough_event.set()
+
+    # queries of the jobs give up on the server once the budget is spent
+    with deadline(budget_secs):
+        tasks = [asyncio.create_task(run(job_id, job)) for job_id, job in jobs.items()]
+    all_done = asyncio.create_task(asyncio.wait(tasks))
+    enough_waiter = asyncio.create_task(enough_event.wait())
     try:
-        result = await asyncio.wait_for(task_coroutine, timeout=task_timeout)
-        return (task_id, result)
-    except TimeoutError:
-        return (task_id, None)
+        await asyncio.wait(
+            [all_done, enough_waiter],
+            timeout=budget_secs,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+    finally:
+        all_done.cancel()
+        enough_waiter.cancel()
+        # whatever is still running or waiting on the semaphore
+        for task in tasks:
+            task.cancel()
+    return results
 
 
 @router.get("/personalized/popular/{fid}", tags=["For You Feed", "Neynar For You Feed"])
 async def get_popular_casts_for_fid(
+    request: Request,
     fid: int,
     agg: Annotated[
         ScoreAgg | None,
@@ -60,7 +122,9 @@ async def get_popular_casts_for_fid(
     lite: Annotated[bool, Query()] = True,
     timeframe: GraphTimeframe = Query(GraphTimeframe.ninetydays),
     provider_metadata: Annotated[str | None, Query()] = None,
+    cursor: Annotated[str | None, Query()] = None,
     pool: Pool = Depends(db_pool.get_db),
+    cache_pool: Pool | None = Depends(db_pool.get_cache_db),
     ninetyday_model: Graph = Depends(graph.get_ninetydays_graph),
 ):
     """
@@ -80,7 +144,17 @@ async def get_popular_casts_for_fid(
     Parameter 'graph_limit' is used to constrain the graph neighborhood. \n
     By default, agg=sumsquare, weights='L1C10R5Y1', k=1, offset=0,
       limit=25, graph_limit=100 and lite=true
-      i.e., returns recent 25 popular casts.
+      i.e., returns recent 25 popular casts. \n
+    With provider_metadata, each page is `limit` casts of the ranking
+      merged across the channels. \n
+    If provider_metadata carries a sessionId, the ranked candidate list
+      is computed on the first page (offset=0) and later pages are served
+      from it, so pagination stays stable for the session;
+      a later page of an expired session gets a 410. \n
+    For token and newUsers feeds, parameter 'cursor' is the `next_cursor`
+      of a previous response and resumes right after it. \n
+    With `Accept: application/x-ndjson` the casts are streamed one per line,
+      followed by a line with `next_cursor` if there is one.
     """
     if provider_metadata:
         logger.info(f"Ignoring parameters and using metadata {provider_metadata}")
@@ -98,79 +172,145 @@ async def get_popular_casts_for_fid(
             )
 
         if isinstance(metadata, TokenFeed):
-            rows = await _get_token_feed(metadata, offset, limit, pool)
-            return {"result": rows}
+            rows, next_cursor = await _get_token_feed(
+                metadata, offset, limit, cursor, pool
+            )
+            return records_response(
+                request, {"result": rows, "next_cursor": next_cursor}
+            )
 
         if isinstance(metadata, NewUsersFeed):
-            rows = await _get_new_users_feed(metadata, offset, limit, pool)
-            return {"result": rows}
+            rows, next_cursor = await _get_new_users_feed(
+                metadata, offset, limit, cursor, pool
+            )
+            return records_response(
+                request, {"result": rows, "next_cursor": next_cursor}
+            )
+
+        if cursor:
+            raise HTTPException(
+                status_code=400,
+                detail="cursor is only supported for token and newUsers feeds",
+            )
+
+        # pin pagination to the session only if we have somewhere to keep it
+        session_id = metadata.session_id if cache_pool is not None else None
+        if session_id and offset > 0:
+            sorted_casts = await cache_db_utils.get_homefeed_for_fid(
+                fid, session_id, cache_pool
+            )
+            if sorted_casts is None:
+                # ranking afresh would shift the casts of the pages already served
+                logger.info(f"No cached homefeed for fid {fid} session {session_id}")
+                raise HTTPException(
+                    status_code=410,
+                    detail="Feed session expired; restart from offset 0",
+                )
+            return records_response(
+                request, {"result": sorted_casts[offset : offset + limit]}
+            )
+        # pages are slices of the merged ranking, so every channel contributes
+        # ... candidates for this page and the ones before it, or for the
+        # ... whole session if later pages are served from the cache db
+        channel_offset = 0
+        if session_id:
+            channel_limit = settings.HOMEFEED_CANDIDATES_PER_CHANNEL
+        else:
+            channel_limit = offset + limit
 
         if metadata.channels is not None:
             # TODO(ek): validate channel IDs?
-            channel_ids = set(metadata.channels)
+            channel_ids = list(dict.fromkeys(metadata.channels))
             pinned_channels = set()
         else:
             rows = await db_utils.get_channel_ids_for_fid(
-                fid=fid, limit=settings.MAX_CHANNELS_PER_USER, pool=pool
+                fid=fid,
+                limit=settings.MAX_CHANNELS_PER_USER,
+                strategy_name=CHANNEL_RANKING_STRATEGY_NAMES[
+                    ChannelRankingsTimeframe.SIXTY_DAYS
+                ],
+                pool=pool,
             )
-            channel_ids = {row["channel_id"] for row in rows}
-            pinned_channels = set(await get_user_pinned_channels(fid))
-            logger.info(f"Pinned channel_ids for fid {fid}: {pinned_channels}")
-            channel_ids |= pinned_channels
+            pinned = await get_user_pinned_channels(fid)
+            logger.info(f"Pinned channel_ids for fid {fid}: {pinned}")
+            # pinned channels first, then those where the fid ranks best,
+            # ... so that a cutoff or timeout drops the least relevant ones
+            channel_ids = list(
+                dict.fromkeys([*pinned, *(row["channel_id"] for row in rows)])
+            )
+            pinned_channels = set(pinned)
         logger.info(f"channel_ids for fid {fid}: {channel_ids}")
         if len(channel_ids) == 0:
             logger.info(f"No channels found for fid: {fid}")
-            return {"result": []}
-
-        channel_tasks = []
+            return records_response(request, {"result": []})
 
-        for channel_id in channel_ids:
-            channel_tasks.append(
-                task_with_timeout(
-                    task_id=channel_id,
-                    task_coroutine=channel_router.get_popular_channel_casts(
-                        channel=channel_id,
-                        rank_timeframe=ChannelRankingsTimeframe.SIXTY_DAYS,
-                        offset=offset,
-                        limit=limit,
-                        lite=True,
-                        provider_metadata=provider_metadata,
-                        pool=pool,
-                    ),
-                    task_timeout=metadata.timeout_secs,
-                )
+        # pages of the popular feed are the top scores of their channel
+        count_candidates = len
+        if type(metadata) in (TrendingFeed, FarconFeed):
+            jobs = _trending_channels_jobs(
+                channel_ids, metadata, channel_offset, channel_limit, pool
             )
-        result_list = await asyncio.gather(*channel_tasks, return_exceptions=True)
+            count_candidates = _count_high_scoring
+        else:
+            jobs = {
+                channel_id: _popular_channel_job(
+                    channel_id,
+                    channel_offset,
+                    channel_limit,
+                    provider_metadata,
+                    pool,
+                )
+                for channel_id in channel_ids
+            }
+        results = await gather_bounded(
+            jobs,
+            # leave room in the pool for everyone else
+            concurrency=max(
+                1,
+                min(settings.FOR_YOU_CHANNEL_CONCURRENCY, pool.get_max_size() // 2),
+            ),
+            budget_secs=metadata.timeout_secs,
+            # without a session, each page is ranked afresh: stopping once
+            # ... there are enough candidates would make the contributing
+            # ... channels, and so the pages, depend on timing
+            enough=settings.FOR_YOU_CANDIDATES_TARGET if session_id else None,
+            count=count_candidates,
+        )
 
-        timedout_channel_ids = []
-        error_channel_ids = []
-        success_channel_ids = []
+        timedout_jobs = [job_id for job_id in jobs if job_id not in results]
+        error_jobs = []
         casts = []
-        for task_id, result in result_list:
-            extra = {"channel_id": task_id}
-            if result is None:
-                timedout_channel_ids.append(task_id)
-            elif isinstance(result, Exception):
-                error_channel_ids.append(task_id)
+        for job_id, result in results.items():
+            if isinstance(result, Exception):
+                logger.error(f"error fetching casts for {job_id}: {result}")
+                error_jobs.append(job_id)
             else:
-                success_channel_ids.append(task_id)
-                casts.extend(dict(cast) | extra for cast in result["result"])
-        if len(timedout_channel_ids) > 0:
-            logger.error(f"timedout_channel_ids: {timedout_channel_ids}")
-        if len(error_channel_ids) > 0:
-            logger.error(f"error_channel_ids: {error_channel_ids}")
-        if len(success_channel_ids) == 0:
+                casts.extend(result)
+        if len(timedout_jobs) > 0:
+            logger.error(f"timedout or skipped channels: {timedout_jobs}")
+        if len(error_jobs) > 0:
+            logger.error(f"error channels: {error_jobs}")
+        if len(error_jobs) == len(results):
             raise HTTPException(
                 status_code=500, detail="Errors and or timeoutswhile fetching casts"
             )
 
+        # each channel contributes its top casts by score, so merging by
+        # ... score makes every page a slice of one ranking
         def cast_key(d):
-            return (0 if d["channel_id"] in pinned_channels else 1, d["age_hours"])
+            pinned = d["channel_id"] in pinned_channels
+            return (0 if pinned else 1, -d["cast_score"], d["cast_hash"])
 
         sorted_casts = sorted(casts, key=cast_key)
         for cast in sorted_casts:
             del cast['channel_id']
-        return {"result": sorted_casts}
+        if session_id:
+            await cache_db_utils.set_homefeed_for_fid(
+                fid, session_id, sorted_casts, cache_pool
+            )
+        return records_response(
+            request, {"result": sorted_casts[offset : offset + limit]}
+        )
     else:
         try:
             weights = Weights.from_str(weights)
@@ -194,15 +334,125 @@ async def get_popular_casts_for_fid(
             lite=lite,
             pool=pool,
         )
-        return {"result": casts}
+        return records_response(request, {"result": casts})
+
+
+def _decode_cached_feed_cursor(cursor: str | None) -> list | None:
+    if not cursor:
+        return None
+    return decode_cursor(cursor, db_utils.CACHED_FEED_ORDER_BY)
+
+
+def _encode_cached_feed_cursor(last: list | None) -> str | None:
+    if last is None:
+        return None
+    return encode_cursor(db_utils.CACHED_FEED_ORDER_BY, last)
+
+
+def _popular_channel_job(
+    channel_id: str,
+    offset: int,
+    limit: int,
+    provider_metadata: str,
+    pool: Pool,
+) -> Callable[[], Awaitable[list[dict]]]:
+    async def job():
+        result = await channel_router.fetch_popular_channel_casts(
+            channel=channel_id,
+            rank_timeframe=ChannelRankingsTimeframe.SIXTY_DAYS,
+            offset=offset,
+            limit=limit,
+            lite=True,
+            provider_metadata=provider_metadata,
+            cursor=None,
+            pool=pool,
+        )
+        return [dict(cast) | {"channel_id": channel_id} for cast in result["result"]]
+
+    return job
+
+
+def _count_high_scoring(rows: list[dict]) -> int:
+    """Rows in the top FOR_YOU_CANDIDATES_PTILE percent of their channel."""
+    return sum(row["ptile"] <= settings.FOR_YOU_CANDIDATES_PTILE for row in rows)
+
+
+def _trending_channels_jobs(
+    channel_ids: list[str],
+    metadata: TrendingFeed | FarconFeed,
+    offset: int,
+    limit: int,
+    pool: Pool,
+) -> dict[tuple[str, ...], Callable[[], Awaitable[list[dict]]]]:
+    """
+    One job per batch of channels, each fetching the channels of its batch
+    that are not in the feed cache with one set-based query. Channels with
+    a materialized default feed get a job that reads it instead.
+    """
+    try:
+        weights = Weights.from_str(metadata.weights)
+    except Exception as e:
+        raise HTTPException(
+            status_code=400, detail="Weights should be of the form 'LxxCxxRxx'"
+        ) from e
+
+    def materialized_job(channel_id: str, casts: list[dict]):
+        async def job():
+            # as_of is only for the cursors of the channel feed
+            return [
+                {key: value for key, value in cast.items() if key != "as_of"}
+                | {"channel_id": channel_id}
+                for cast in casts
+            ]
+
+        return job
+
+    jobs = {}
+    if default_feed_type(metadata) == "trending":
+        for channel_id in channel_ids:
+            casts = feed_materializer.get("trending", channel_id, offset, limit)
+            if casts is not None:
+                jobs[(channel_id,)] = materialized_job(channel_id, casts)
+        channel_ids = [c for c in channel_ids if (c,) not in jobs]
+
+    def make_job(batch: tuple[str, ...]):
+        async def job():
+            rows = await db_utils.get_trending_channels_casts_lite(
+                channel_ids=batch,
+                channel_strategy=CHANNEL_RANKING_STRATEGY_NAMES[
+                    ChannelRankingsTimeframe.SIXTY_DAYS
+                ],
+                max_cast_age=CASTS_AGE[metadata.lookback],
+                agg=metadata.agg,
+                score_threshold=metadata.score_threshold,
+                reactions_threshold=metadata.reactions_threshold,
+                cutoff_ptile=metadata.cutoff_ptile,
+                weights=weights,
+                shuffle=metadata.shuffle,
+                time_decay=metadata.time_decay,
+                normalize=metadata.normalize,
+                offset=offset,
+                limit=limit,
+                sorting_order=metadata.sorting_order,
+                pool=pool,
+            )
+            # copies, since the result list is shared through the feed cache
+            return [dict(row) for row in rows]
+
+        return job
+
+    for batch in batched(channel_ids, settings.FOR_YOU_CHANNELS_PER_QUERY):
+        jobs[batch] = make_job(batch)
+    return jobs
 
 
 async def _get_token_feed(
     metadata: TokenFeed,
     offset: int | None,
     limit: int | None,
+    cursor: str | None,
     pool: Pool,
-) -> list[dict[str, Any]]:
+) -> tuple[list[dict[str, Any]], str | None]:
     try:
         token_address = bytes.fromhex(metadata.token_address.lower().removeprefix("0x"))
     except ValueError as e:
@@ -211,7 +461,7 @@ async def _get_token_feed(
         weights = Weights.from_str(metadata.weights)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid weights") from e
-    rows = await db_utils.get_token_holder_casts(
+    rows, last = await db_utils.get_token_holder_casts(
         agg=metadata.agg,
         weights=weights,
         token_address=token_address,
@@ -225,25 +475,27 @@ async def _get_token_feed(
         offset=offset,
         limit=limit,
         pool=pool,
+        after=_decode_cached_feed_cursor(cursor),
     )
     rows = [
         {k: str(v) if k in ["balance_raw", "value_raw"] else v for k, v in row.items()}
         for row in rows
     ]
-    return rows
+    return rows, _encode_cached_feed_cursor(last)
 
 
 async def _get_new_users_feed(
     metadata: NewUsersFeed,
     offset: int | None,
     limit: int | None,
+    cursor: str | None,
     pool: Pool,
-) -> list[dict[str, Any]]:
+) -> tuple[list[dict[str, Any]], str | None]:
     try:
         weights = Weights.from_str(metadata.weights)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid weights") from e
-    rows = await db_utils.get_new_user_casts(
+    rows, last = await db_utils.get_new_user_casts(
         channel_id=metadata.channel_id,
         caster_age=metadata.caster_age,
         agg=metadata.agg,
@@ -258,12 +510,13 @@ async def _get_new_users_feed(
         offset=offset,
         limit=limit,
         pool=pool,
+        after=_decode_cached_feed_cursor(cursor),
     )
     rows = [
         {k: str(v) if k in ["balance_raw", "value_raw"] else v for k, v in row.items()}
         for row in rows
     ]
-    return rows
+    return rows, _encode_cached_feed_cursor(last)
 
 
 @router.get("/personalized/recent/{fid}")
@@ -4,13 +4,22 @@ from itertools import batched
 from typing import Annotated
 
 from asyncpg.pool import Pool
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from loguru import logger
 from pydantic_core import ValidationError
 
 from .. import utils
 from ..config import DBVersion, settings
 from ..dependencies import db_pool, db_utils
+from ..dependencies.cast_scoring import score_given_channel_casts
+from ..dependencies.channel_metadata import channel_metadata
+from ..dependencies.channel_ranks import channel_ranks
+from ..dependencies.cursor import cursor_as_of, decode_cursor, next_cursor
+from ..dependencies.deadlines import deadline
+from ..dependencies.etag import data_version_etag
+from ..dependencies.feed_materializer import default_feed_type, feed_materializer
+from ..dependencies.token_balances import channel_token_balances
+from ..dependencies.trending_channels import trending_channels
 from ..models.channel_model import (
     CHANNEL_RANKING_STRATEGY_NAMES,
     ChannelEarningsOrderBy,
@@ -35,12 +44,16 @@ from ..models.feed_model import (
     TrendingFeed,
 )
 from ..models.score_model import ScoreAgg, Weights
-from ..utils import fetch_channel
+from ..responses import records_response
 
 router = APIRouter()
 
 
-@router.get("/openrank/{channel}", tags=["Experimental"])
+@router.get(
+    "/openrank/{channel}",
+    tags=["Experimental"],
+    dependencies=[Depends(data_version_etag("k3l_channel_openrank_results"))],
+)
 async def get_top_openrank_channel_profiles(
     channel: str,
     category: OpenrankCategory = Query(OpenrankCategory.PROD),
@@ -87,6 +100,12 @@ async def get_top_token_balances(
     orderby: ChannelEarningsOrderBy = Query(ChannelEarningsOrderBy.TOTAL),
     pool: Pool = Depends(db_pool.get_db),
 ):
+    if (
+        lite
+        and orderby == ChannelEarningsOrderBy.TOTAL
+        and channel_token_balances.loaded
+    ):
+        return {"result": channel_token_balances.top(channel, offset, limit)}
     balances = await db_utils.get_top_channel_earnings(
         channel_id=channel,
         offset=offset,
@@ -102,9 +121,14 @@ async def get_top_token_balances(
 @router.get("/tokens/{channel}/claim", tags=["Tokens"])
 async def get_token_claim(channel: str, fid: int, pool: Pool = Depends(db_pool.get_db)):
     # check local pg database first before calling smart contract manager
-    balance = await db_utils.get_fid_channel_token_balance(
-        channel_id=channel, fid=fid, pool=pool
-    )
+    balance = None
+    if channel_token_balances.loaded:
+        balance = channel_token_balances.get(channel, fid)
+    if not balance:
+        # the balance may have been written since the last refresh
+        balance = await db_utils.get_fid_channel_token_balance(
+            channel_id=channel, fid=fid, pool=pool
+        )
     if not balance:
         logger.error(f"No entry in token balance table for {channel} {fid}")
         raise HTTPException(status_code=404, detail="No tokens to claim.")
@@ -198,7 +222,21 @@ async def get_tokens_distrib_details(
     return {"result": details}
 
 
-@router.get("/rankings/{channel}", tags=["Deprecated"])
+_ranks_etag = data_version_etag("k3l_channel_rank")
+
+
+async def _lite_ranks_etag(request: Request, response: Response, lite: bool = True):
+    # the full rankings also carry balances from k3l_channel_points_bal,
+    # ... which does not publish data versions
+    if lite:
+        await _ranks_etag(request, response)
+
+
+@router.get(
+    "/rankings/{channel}",
+    tags=["Deprecated"],
+    dependencies=[Depends(_lite_ranks_etag)],
+)
 async def get_top_channel_profiles(
     channel: str,
     rank_timeframe: ChannelRankingsTimeframe = Query(
@@ -207,6 +245,7 @@ async def get_top_channel_profiles(
     offset: Annotated[int | None, Query()] = 0,
     limit: Annotated[int | None, Query(le=1000)] = 100,
     lite: bool = True,
+    cursor: Annotated[str | None, Query()] = None,
     pool: Pool = Depends(db_pool.get_db),
 ):
     """
@@ -220,8 +259,11 @@ async def get_top_channel_profiles(
     Parameter 'limit' is used to specify the number of results to return. \n
     Parameter 'lite' is used to indicate if additional details like
       fnames and percentile should be returned or not. \n
+    Parameter 'cursor' is the `next_cursor` of a previous response
+      and resumes right after it; 'offset' then counts from the cursor. \n
     By default, limit is 100, offset is 0 and lite is True i.e., returns top 100 fids.
     """
+    order_by = db_utils.CHANNEL_PROFILES_ORDER_BY
     ranks = await db_utils.get_top_channel_profiles(
         channel_id=channel,
         strategy_name=CHANNEL_RANKING_STRATEGY_NAMES[rank_timeframe],
@@ -229,8 +271,10 @@ async def get_top_channel_profiles(
         limit=limit,
         lite=lite,
         pool=pool,
+        after=decode_cursor(cursor, order_by) if cursor else None,
     )
-    return {"result": ranks}
+    ranks = db_utils.check_rows(ranks, "channel rankings")
+    return {"result": ranks, "next_cursor": next_cursor(order_by, ranks, limit)}
 
 
 @router.get("/rankings/{channel}/stats", tags=["Leaderboard", "Metrics"])
@@ -354,13 +398,16 @@ async def get_channel_rank_for_fids(
         raise HTTPException(
             status_code=400, detail="Input should have between 1 and 100 entries"
         )
-    ranks = await db_utils.get_channel_profile_ranks(
-        channel_id=channel,
-        strategy_name=CHANNEL_RANKING_STRATEGY_NAMES[rank_timeframe],
-        fids=fids,
-        lite=lite,
-        pool=pool,
-    )
+    strategy_name = CHANNEL_RANKING_STRATEGY_NAMES[rank_timeframe]
+    ranks = channel_ranks.lookup(channel, strategy_name, fids) if lite else None
+    if ranks is None:
+        ranks = await db_utils.get_channel_profile_ranks(
+            channel_id=channel,
+            strategy_name=strategy_name,
+            fids=fids,
+            lite=lite,
+            pool=pool,
+        )
     return {"result": ranks}
 
 
@@ -402,6 +449,7 @@ async def get_channel_rank_for_handles(
 
 @router.get("/casts/popular/{channel}", tags=["Channel Feed", "Neynar Trending Feed"])
 async def get_popular_channel_casts(
+    request: Request,
     channel: str,
     rank_timeframe: ChannelRankingsTimeframe = Query(
         ChannelRankingsTimeframe.SIXTY_DAYS
@@ -410,6 +458,7 @@ async def get_popular_channel_casts(
     limit: Annotated[int | None, Query(le=100)] = 25,
     lite: Annotated[bool, Query()] = True,
     provider_metadata: Annotated[str | None, Query()] = None,
+    cursor: Annotated[str | None, Query()] = None,
     pool: Pool = Depends(db_pool.get_db),
 ):
     """
@@ -419,6 +468,9 @@ async def get_popular_channel_casts(
     Parameter 'lite' is used to constrain the result to just cast hashes. \n
     Parameter 'offset' is used to specify how many results to skip
       and can be useful for paginating through results. \n
+    Parameter 'cursor' is the `next_cursor` of a previous response
+      and resumes right after it; 'offset' then counts from the cursor.
+      Cursors are not available when `shuffle` is true. \n
     provider_metadata is a **URI encoded JSON string**
     that contains the following for **Trending Feed**: \n
       { \n
@@ -453,8 +505,45 @@ async def get_popular_channel_casts(
       } \n
     Parameter 'limit' is used to specify the number of results to return. \n
     By default, offset=0, limit=25, and lite=true
-      i.e., returns recent 25 **Trending** casts.
+      i.e., returns recent 25 **Trending** casts. \n
+    With `Accept: application/x-ndjson` the casts are streamed one per line,
+      followed by a line with `next_cursor`.
     """
+    return records_response(
+        request,
+        await fetch_popular_channel_casts(
+            channel=channel,
+            rank_timeframe=rank_timeframe,
+            offset=offset,
+            limit=limit,
+            lite=lite,
+            provider_metadata=provider_metadata,
+            cursor=cursor,
+            pool=pool,
+        ),
+    )
+
+
+def _without_cursor_columns(casts: list, columns: set[str]) -> list[dict]:
+    # columns that feeds only select for the next cursor: as_of, and the
+    # ... lite popular feed's reaction_count for the reactions ordering;
+    # ... copies, as the rows may be cached
+    return [
+        {key: value for key, value in cast.items() if key not in columns}
+        for cast in casts
+    ]
+
+
+async def fetch_popular_channel_casts(
+    channel: str,
+    rank_timeframe: ChannelRankingsTimeframe,
+    offset: int,
+    limit: int,
+    lite: bool,
+    provider_metadata: str | None,
+    cursor: str | None,
+    pool: Pool,
+) -> dict:
     logger.info(f"get_popular_channel_casts: channel={channel}")
     metadata = None
     if provider_metadata:
@@ -484,74 +573,79 @@ async def get_popular_channel_casts(
 
     logger.info(f"Feed params: {metadata}")
 
-    channel_urls = await db_utils.get_channel_url_for_channel_id(
-        channel_id=channel, pool=pool
-    )
-    if len(channel_urls) == 0:
-        raise HTTPException(status_code=404, detail="Channel not found")
+    # shuffled orderings are not repeatable, so there is nothing to resume
+    shuffled = getattr(metadata, "shuffle", False)
+    if cursor and shuffled:
+        raise HTTPException(
+            status_code=400, detail="cursor is not supported with shuffle"
+        )
+    order_by = db_utils.channel_casts_order_by(metadata.sorting_order)
+    after = decode_cursor(cursor, order_by) if cursor else None
+    as_of = cursor_as_of(cursor)
 
-    # channel_url = fetch_channel(channel_id=channel)
-    channel_url = channel_urls[0]['url']
+    channel_url = await channel_metadata.url_for_id(channel, pool=pool)
+    if channel_url is None:
+        raise HTTPException(status_code=404, detail="Channel not found")
 
-    if metadata and type(metadata) is PopularFeed:
-        if lite:
-            casts = await db_utils.get_popular_channel_casts_lite(
-                channel_id=channel,
-                channel_url=channel_url,
-                strategy_name=CHANNEL_RANKING_STRATEGY_NAMES[rank_timeframe],
-                max_cast_age=CASTS_AGE[metadata.lookback],
-                agg=metadata.agg,
-                score_threshold=metadata.score_threshold,
-                reactions_threshold=metadata.reactions_threshold,
-                weights=parsed_weights,
-                time_decay=metadata.time_decay,
-                normalize=metadata.normalize,
-                offset=offset,
-                limit=limit,
-                sorting_order=metadata.sorting_order,
-                pool=pool,
-            )
-        else:
-            # TODO get rid of the heavy version if all clients are going to come through Neynar
-            casts = await db_utils.get_popular_channel_casts_heavy(
-                channel_id=channel,
-                channel_url=channel_url,
-                strategy_name=CHANNEL_RANKING_STRATEGY_NAMES[rank_timeframe],
-                max_cast_age=CASTS_AGE[metadata.lookback],
-                agg=metadata.agg,
-                score_threshold=metadata.score_threshold,
-                reactions_threshold=metadata.reactions_threshold,
-                weights=parsed_weights,
-                time_decay=metadata.time_decay,
-                normalize=metadata.normalize,
-                offset=offset,
-                limit=limit,
-                sorting_order=metadata.sorting_order,
-                pool=pool,
+    feed_type = default_feed_type(metadata)
+    if (
+        feed_type
+        and lite
+        and after is None
+        and rank_timeframe == ChannelRankingsTimeframe.SIXTY_DAYS
+    ):
+        casts = feed_materializer.get(feed_type, channel, offset, limit)
+        if casts is not None:
+            cursor = next_cursor(order_by, casts, limit)
+            columns = (
+                {"as_of", "reaction_count"} if feed_type == "popular" else {"as_of"}
             )
-    elif metadata and type(metadata) is FarconFeed:
-        casts = await db_utils.get_trending_channel_casts_lite(
-            channel_id=channel,
-            channel_url=channel_url,
-            channel_strategy=CHANNEL_RANKING_STRATEGY_NAMES[rank_timeframe],
-            max_cast_age=CASTS_AGE[metadata.lookback],
-            agg=metadata.agg,
-            score_threshold=metadata.score_threshold,
-            reactions_threshold=metadata.reactions_threshold,
-            cutoff_ptile=metadata.cutoff_ptile,
-            weights=parsed_weights,
-            shuffle=metadata.shuffle,
-            time_decay=metadata.time_decay,
-            normalize=metadata.normalize,
-            offset=offset,
-            limit=limit,
-            sorting_order=metadata.sorting_order,
-            pool=pool,
-        )
-    else:
-        # defaults to Trending because Neynar calls this API for Trending Feed
-        if lite:
-            casts = await db_utils.get_trending_channel_casts_lite_memoized(
+            casts = _without_cursor_columns(casts, columns)
+            return {"result": casts, "next_cursor": cursor}
+
+    with deadline(metadata.timeout_secs):
+        if metadata and type(metadata) is PopularFeed:
+            if lite:
+                casts = await db_utils.get_popular_channel_casts_lite(
+                    channel_id=channel,
+                    channel_url=channel_url,
+                    strategy_name=CHANNEL_RANKING_STRATEGY_NAMES[rank_timeframe],
+                    max_cast_age=CASTS_AGE[metadata.lookback],
+                    agg=metadata.agg,
+                    score_threshold=metadata.score_threshold,
+                    reactions_threshold=metadata.reactions_threshold,
+                    weights=parsed_weights,
+                    time_decay=metadata.time_decay,
+                    normalize=metadata.normalize,
+                    offset=offset,
+                    limit=limit,
+                    sorting_order=metadata.sorting_order,
+                    pool=pool,
+                    after=after,
+                    as_of=as_of,
+                )
+            else:
+                # TODO get rid of the heavy version if all clients are going to come through Neynar
+                casts = await db_utils.get_popular_channel_casts_heavy(
+                    channel_id=channel,
+                    channel_url=channel_url,
+                    strategy_name=CHANNEL_RANKING_STRATEGY_NAMES[rank_timeframe],
+                    max_cast_age=CASTS_AGE[metadata.lookback],
+                    agg=metadata.agg,
+                    score_threshold=metadata.score_threshold,
+                    reactions_threshold=metadata.reactions_threshold,
+                    weights=parsed_weights,
+                    time_decay=metadata.time_decay,
+                    normalize=metadata.normalize,
+                    offset=offset,
+                    limit=limit,
+                    sorting_order=metadata.sorting_order,
+                    pool=pool,
+                    after=after,
+                    as_of=as_of,
+                )
+        elif metadata and type(metadata) is FarconFeed:
+            casts = await db_utils.get_trending_channel_casts_lite(
                 channel_id=channel,
                 channel_url=channel_url,
                 channel_strategy=CHANNEL_RANKING_STRATEGY_NAMES[rank_timeframe],
@@ -568,29 +662,62 @@ async def get_popular_channel_casts(
                 limit=limit,
                 sorting_order=metadata.sorting_order,
                 pool=pool,
+                after=after,
+                as_of=as_of,
             )
         else:
-            # TODO get rid of the heavy version if all clients are going to come through Neynar
-            casts = await db_utils.get_trending_channel_casts_heavy(
-                channel_id=channel,
-                channel_url=channel_url,
-                channel_strategy=CHANNEL_RANKING_STRATEGY_NAMES[rank_timeframe],
-                max_cast_age=CASTS_AGE[metadata.lookback],
-                agg=metadata.agg,
-                score_threshold=metadata.score_threshold,
-                reactions_threshold=metadata.reactions_threshold,
-                cutoff_ptile=metadata.cutoff_ptile,
-                weights=parsed_weights,
-                shuffle=metadata.shuffle,
-                time_decay=metadata.time_decay,
-                normalize=metadata.normalize,
-                offset=offset,
-                limit=limit,
-                sorting_order=metadata.sorting_order,
-                pool=pool,
-            )
-
-    return {"result": casts}
+            # defaults to Trending because Neynar calls this API for Trending Feed
+            if lite:
+                casts = await db_utils.get_trending_channel_casts_lite_memoized(
+                    channel_id=channel,
+                    channel_url=channel_url,
+                    channel_strategy=CHANNEL_RANKING_STRATEGY_NAMES[rank_timeframe],
+                    max_cast_age=CASTS_AGE[metadata.lookback],
+                    agg=metadata.agg,
+                    score_threshold=metadata.score_threshold,
+                    reactions_threshold=metadata.reactions_threshold,
+                    cutoff_ptile=metadata.cutoff_ptile,
+                    weights=parsed_weights,
+                    shuffle=metadata.shuffle,
+                    time_decay=metadata.time_decay,
+                    normalize=metadata.normalize,
+                    offset=offset,
+                    limit=limit,
+                    sorting_order=metadata.sorting_order,
+                    pool=pool,
+                    after=after,
+                    as_of=as_of,
+                )
+            else:
+                # TODO get rid of the heavy version if all clients are going to come through Neynar
+                casts = await db_utils.get_trending_channel_casts_heavy(
+                    channel_id=channel,
+                    channel_url=channel_url,
+                    channel_strategy=CHANNEL_RANKING_STRATEGY_NAMES[rank_timeframe],
+                    max_cast_age=CASTS_AGE[metadata.lookback],
+                    agg=metadata.agg,
+                    score_threshold=metadata.score_threshold,
+                    reactions_threshold=metadata.reactions_threshold,
+                    cutoff_ptile=metadata.cutoff_ptile,
+                    weights=parsed_weights,
+                    shuffle=metadata.shuffle,
+                    time_decay=metadata.time_decay,
+                    normalize=metadata.normalize,
+                    offset=offset,
+                    limit=limit,
+                    sorting_order=metadata.sorting_order,
+                    pool=pool,
+                    after=after,
+                    as_of=as_of,
+                )
+
+    casts = db_utils.check_rows(casts, "channel casts")
+    cursor = None if shuffled else next_cursor(order_by, casts, limit)
+    columns = {"as_of"}
+    if lite and type(metadata) is PopularFeed:
+        columns.add("reaction_count")
+    casts = _without_cursor_columns(casts, columns)
+    return {"result": casts, "next_cursor": cursor}
 
 
 @router.post("/casts/scores/{channel}", tags=["Channel Feed"])
@@ -653,13 +780,29 @@ async def get_channel_casts_scores(
 
     logger.info(f"Feed params: {metadata}")
     cast_hashes = [bytes.fromhex(cast_hash[2:]) for cast_hash in cast_hashes]
+    strategy_name = CHANNEL_RANKING_STRATEGY_NAMES[ChannelRankingsTimeframe.SIXTY_DAYS]
+
+    if channel_ranks.covers(strategy_name):
+        # the in-memory ranks stand in for the join on k3l_channel_rank
+        actions = await db_utils.get_channel_casts_actions(
+            cast_hashes, channel_id=channel, pool=pool
+        )
+        fid_scores = channel_ranks.fid_scores(channel, strategy_name, actions.fids)
+        casts = score_given_channel_casts(
+            actions.with_fid_scores(fid_scores),
+            agg=metadata.agg,
+            score_threshold=metadata.score_threshold,
+            weights=Weights.from_str(metadata.weights),
+            time_decay=metadata.time_decay,
+            normalize=metadata.normalize,
+            order_by=db_utils.channel_casts_order_by(metadata.sorting_order),
+        )
+        return {"result": casts}
 
     casts = await db_utils.get_channel_casts_scores_lite(
         cast_hashes=cast_hashes,
         channel_id=channel,
-        channel_strategy=CHANNEL_RANKING_STRATEGY_NAMES[
-            ChannelRankingsTimeframe.SIXTY_DAYS
-        ],
+        channel_strategy=strategy_name,
         agg=metadata.agg,
         score_threshold=metadata.score_threshold,
         weights=Weights.from_str(metadata.weights),
@@ -702,9 +845,12 @@ async def get_trending_casts(
         raise HTTPException(
             status_code=400, detail="Weights should be of the form 'LxxCxxRxx'"
         )
+    channel_url = await channel_metadata.url_for_id(channel, pool=pool)
+    if channel_url is None:
+        raise HTTPException(status_code=404, detail="Channel not found")
     casts = await db_utils.get_trending_channel_casts_heavy(
         channel_id=channel,
-        channel_url=fetch_channel(channel_id=channel),
+        channel_url=channel_url,
         channel_strategy=CHANNEL_RANKING_STRATEGY_NAMES[channel_strategy],
         max_cast_age=f"{max_cast_age} days",
         agg=agg,
@@ -930,6 +1076,11 @@ async def get_trending_channels(
       i.e., returns recent 25 popular casts.
     """
 
+    channels = await trending_channels.top(
+        lookback, rank_threshold, offset, limit, pool=pool
+    )
+    if channels is not None:
+        return {"result": channels}
     channels = await db_utils.get_trending_channels(
         max_cast_age=PARENT_CASTS_AGE[lookback],
         rank_threshold=rank_threshold,
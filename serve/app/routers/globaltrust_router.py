@@ -1,17 +1,31 @@
 from typing import Annotated
 
 from asyncpg.pool import Pool
-from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
 from loguru import logger
 
 from ..dependencies import db_pool, db_utils
+from ..dependencies.etag import data_version_etag
 from ..models.graph_model import GraphType
 from ..models.score_model import EngagementType, QueryType, engagement_ids
 
 router = APIRouter(tags=["Global OpenRank Scores"])
 
+_rank_etag = data_version_etag("k3l_rank")
 
-@router.get("/following/rankings")
+
+async def _superlite_rank_etag(
+    request: Request,
+    response: Response,
+    query_type: Annotated[QueryType, Query()] = QueryType.LITE,
+):
+    # the other query types join user_data and fnames, which do not publish
+    # ... data versions
+    if query_type == QueryType.SUPERLITE:
+        await _rank_etag(request, response)
+
+
+@router.get("/following/rankings", dependencies=[Depends(_superlite_rank_etag)])
 async def get_top_following_profiles(
     offset: Annotated[int | None, Query()] = 0,
     limit: Annotated[int | None, Query(le=1000)] = 100,
@@ -38,7 +52,7 @@ async def get_top_following_profiles(
     return {"result": ranks}
 
 
-@router.get("/engagement/rankings")
+@router.get("/engagement/rankings", dependencies=[Depends(_superlite_rank_etag)])
 async def get_top_engagement_profiles(
     engagement_type: Annotated[EngagementType, Query()] = EngagementType.V1,
     offset: Annotated[int | None, Query()] = 0,
@@ -7,8 +7,10 @@ from eth_utils import to_bytes, to_checksum_address
 from fastapi import APIRouter, Depends, HTTPException, Path, Query
 from pydantic import BaseModel, ValidationError, field_validator
 
+from ..config import settings
 from ..dependencies import db_pool
 from ..dependencies.db_utils import get_token_balances
+from ..dependencies.token_balances import token_holders
 
 router = APIRouter(prefix="/{token}", tags=["Token"])
 
@@ -47,8 +49,14 @@ async def get_balances(
     fids: Sequence[int] = Query(..., alias='fid', min_items=1),
     pool: Pool = Depends(db_pool.get_db),
 ):
-    rows = await get_token_balances(to_bytes(hexstr=token.address), fids, pool)
-    balances = {fid: value for fid, value in rows}
+    token_address = to_bytes(hexstr=token.address)
+    balances = None
+    # without the refresh loop, nothing would load the requested tokens
+    if settings.TOKEN_BALANCES_IN_MEMORY:
+        balances = token_holders.balances(token_address, fids)
+    if balances is None:
+        rows = await get_token_balances(token_address, fids, pool)
+        balances = {fid: value for fid, value in rows}
     return {
         "balances": [
             {"fid": fid, "value": str(int(balances.get(fid, 0)))} for fid in fids
@@ -1,6 +1,9 @@
 import time
-from typing import Tuple
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
+from asyncpg import Connection
+from asyncpg.pool import Pool
 from opentelemetry import trace
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
@@ -13,12 +16,11 @@ from prometheus_client.openmetrics.exposition import (
     CONTENT_TYPE_LATEST,
     generate_latest,
 )
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from starlette.requests import Request
 from starlette.responses import Response
-from starlette.routing import Match
+from starlette.routing import BaseRoute, Match
 from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 INFO = Gauge("fastapi_app_info", "FastAPI application information.", ["app_name"])
 REQUESTS = Counter(
@@ -46,22 +48,140 @@ REQUESTS_IN_PROGRESS = Gauge(
     "Gauge of requests by method and path currently being processed",
     ["method", "path", "app_name"],
 )
+FEED_CACHE_REQUESTS = Counter(
+    "feed_cache_requests_total",
+    "Total count of feed cache lookups by namespace, tier and result.",
+    ["namespace", "tier", "result"],
+)
+FEED_CACHE_REFRESHES = Counter(
+    "feed_cache_refreshes_total",
+    "Total count of feed cache recomputations by namespace and outcome.",
+    ["namespace", "outcome"],
+)
+DB_POOL_ACQUIRE_TIME = Histogram(
+    "db_pool_acquire_duration_seconds",
+    "Histogram of time spent waiting for a pooled connection by pool and query.",
+    ["pool", "query_name"],
+)
+DB_QUERY_TIME = Histogram(
+    "db_query_duration_seconds",
+    "Histogram of query execution time by pool and query.",
+    ["pool", "query_name"],
+)
+DB_QUERIES_ABORTED = Counter(
+    "db_queries_aborted_total",
+    "Total count of queries cut short by pool, query and reason"
+    " (timeout, cancelled, deadline).",
+    ["pool", "query_name", "reason"],
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections of a pool by state (in_use, idle, max).",
+    ["pool", "state"],
+)
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds",
+    "Replication lag of a read replica as of its last check.",
+    ["pool"],
+)
+DB_REPLICA_IN_ROTATION = Gauge(
+    "db_replica_in_rotation",
+    "Whether a read replica is currently receiving queries (1) or not (0).",
+    ["pool"],
+)
+ADMISSION_SHED = Counter(
+    "admission_shed_total",
+    "Total count of requests rejected by admission control by group and reason.",
+    ["group", "reason"],
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight",
+    "Requests of a route group currently admitted.",
+    ["group"],
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queued",
+    "Requests of a route group currently waiting for admission.",
+    ["group"],
+)
+DATA_VERSION = Gauge(
+    "data_version",
+    "Latest version of a pipeline dataset seen by this process.",
+    ["dataset"],
+)
+
+# pool -> name used as the `pool` metric label
+DB_POOL_NAMES: dict[Pool, str] = {}
+
 
+def register_db_pool(name: str, pool: Pool) -> None:
+    DB_POOL_NAMES[pool] = name
+    DB_POOL_CONNECTIONS.labels(pool=name, state="in_use").set_function(
+        lambda: pool.get_size() - pool.get_idle_size()
+    )
+    DB_POOL_CONNECTIONS.labels(pool=name, state="idle").set_function(pool.get_idle_size)
+    DB_POOL_CONNECTIONS.labels(pool=name, state="max").set_function(pool.get_max_size)
+
+
+@asynccontextmanager
+async def acquire_timed(
+    pool: Pool, query_name: str, timeout: float | None = None
+) -> AsyncIterator[Connection]:
+    """pool.acquire() that records how long the caller waited for it."""
+    pool_name = DB_POOL_NAMES.get(pool, "unknown")
+    start_time = time.perf_counter()
+    async with pool.acquire(timeout=timeout) as connection:
+        DB_POOL_ACQUIRE_TIME.labels(pool=pool_name, query_name=query_name).observe(
+            time.perf_counter() - start_time
+        )
+        yield connection
+
+
+def count_aborted_query(pool: Pool, query_name: str, reason: str) -> None:
+    pool_name = DB_POOL_NAMES.get(pool, "unknown")
+    DB_QUERIES_ABORTED.labels(
+        pool=pool_name, query_name=query_name, reason=reason
+    ).inc()
+
+
+def query_timer(pool: Pool, query_name: str):
+    pool_name = DB_POOL_NAMES.get(pool, "unknown")
+    return DB_QUERY_TIME.labels(pool=pool_name, query_name=query_name).time()
+
+
+class PrometheusMiddleware:
+    """
+    Pure ASGI, so that no extra task or body stream is set up per request.
+    The route template is resolved before the app runs, as requests shed
+    by the admission control are never routed. Only the routes whose
+    literal prefix the path starts with are matched, and the prefixes are
+    computed once per route rather than cached per path, which would not
+    bound the paths with parameters.
+    """
 
-class PrometheusMiddleware(BaseHTTPMiddleware):
     def __init__(self, app: ASGIApp, app_name: str = "fastapi-app") -> None:
-        super().__init__(app)
+        self.app = app
         self.app_name = app_name
+        self._routes: list[tuple[str, BaseRoute]] | None = None
         INFO.labels(app_name=self.app_name).inc()
 
-    async def dispatch(
-        self, request: Request, call_next: RequestResponseEndpoint
-    ) -> Response:
-        method = request.method
-        path, is_handled_path = self.get_path(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        path, is_handled_path = self.get_path(scope)
 
         if not is_handled_path:
-            return await call_next(request)
+            return await self.app(scope, receive, send)
+
+        status_code = HTTP_500_INTERNAL_SERVER_ERROR
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
 
         REQUESTS_IN_PROGRESS.labels(
             method=method, path=path, app_name=self.app_name
@@ -69,7 +189,7 @@ class PrometheusMiddleware(BaseHTTPMiddleware):
         REQUESTS.labels(method=method, path=path, app_name=self.app_name).inc()
         before_time = time.perf_counter()
         try:
-            response = await call_next(request)
+            await self.app(scope, receive, send_wrapper)
         except BaseException as e:
             status_code = HTTP_500_INTERNAL_SERVER_ERROR
             EXCEPTIONS.labels(
@@ -80,7 +200,6 @@ class PrometheusMiddleware(BaseHTTPMiddleware):
             ).inc()
             raise e from None
         else:
-            status_code = response.status_code
             after_time = time.perf_counter()
             # retrieve trace id for exemplar
             span = trace.get_current_span()
@@ -100,16 +219,19 @@ class PrometheusMiddleware(BaseHTTPMiddleware):
                 method=method, path=path, app_name=self.app_name
             ).dec()
 
-        return response
-
-    @staticmethod
-    def get_path(request: Request) -> Tuple[str, bool]:
-        for route in request.app.routes:
-            match, child_scope = route.matches(request.scope)
-            if match == Match.FULL:
+    def get_path(self, scope: Scope) -> tuple[str, bool]:
+        if self._routes is None:
+            # the part of each route's path before its first parameter
+            self._routes = [
+                (route.path.split("{", 1)[0], route)
+                for route in scope["app"].routes
+                if hasattr(route, "path")
+            ]
+        path = scope["path"]
+        for prefix, route in self._routes:
+            if path.startswith(prefix) and route.matches(scope)[0] == Match.FULL:
                 return route.path, True
-
-        return request.url.path, False
+        return path, False
 
 
 def metrics(request: Request) -> Response:
@@ -0,0 +1,78 @@
+"""
+Local stand-in for go-eigentrust's `/basic/v1/compute`, for load tests.
+Runs EigenTrust by power iteration over the inline local trust and
+pretrust that `app.dependencies.graph.go_eigentrust` sends, so response
+sizes and CPU cost scale with the request like the real service's.
+"""
+
+import argparse
+
+import numpy as np
+import uvicorn
+from fastapi import Body, FastAPI
+
+app = FastAPI()
+
+
+def eigentrust(
+    size: int,
+    pretrust: list[dict],
+    localtrust: list[dict],
+    alpha: float,
+    epsilon: float = 1e-6,
+    max_iter: int = 50,
+) -> np.ndarray:
+    p = np.zeros(size)
+    for entry in pretrust:
+        p[entry["i"]] += entry["v"]
+    p /= p.sum() or 1
+    i = np.fromiter((e["i"] for e in localtrust), dtype=np.int64, count=len(localtrust))
+    j = np.fromiter((e["j"] for e in localtrust), dtype=np.int64, count=len(localtrust))
+    v = np.fromiter((e["v"] for e in localtrust), dtype=float, count=len(localtrust))
+    # row-normalize; peers that trust nobody defer to the pretrust
+    row_sums = np.bincount(i, weights=v, minlength=size)
+    v = v / row_sums[i]
+    dangling = row_sums == 0
+    t = p
+    for _ in range(max_iter):
+        spread = np.bincount(j, weights=v * t[i], minlength=size)
+        spread += t[dangling].sum() * p
+        t_next = (1 - alpha) * spread + alpha * p
+        if np.abs(t_next - t).sum() < epsilon:
+            return t_next
+        t = t_next
+    return t
+
+
+@app.post("/basic/v1/compute")
+def compute(req: dict = Body()):
+    scores = eigentrust(
+        size=req["localTrust"]["size"],
+        pretrust=req["pretrust"]["entries"],
+        localtrust=req["localTrust"]["entries"],
+        alpha=req.get("alpha", 0.5),
+    )
+    return {
+        "entries": [
+            {"i": int(i), "v": float(scores[i])} for i in np.flatnonzero(scores)
+        ]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    uvicorn.run(
+        "eigentrust_stub:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
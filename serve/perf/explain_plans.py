@@ -0,0 +1,676 @@
+"""
+Plan regression check for the queries in app/dependencies/db_utils.py.
+
+Calls each query function with representative parameters against a seeded
+database (see run.sh), captures the statements it runs and EXPLAINs them
+with ANALYZE and BUFFERS. With --update, the plan shapes, estimated costs
+and buffer counts are written to the baseline file. Otherwise they are
+compared with it, and the exit status is 1 if any statement regressed:
+a table is now read by a sequential scan where the baseline used an index,
+or the estimated cost or the buffers touched grew past their thresholds.
+Other plan changes are printed but do not fail the check.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import sys
+from pathlib import Path
+
+import asyncpg
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# required settings that the queries do not use
+os.environ.setdefault("SWAGGER_BASE_URL", "http://127.0.0.1:8000")
+os.environ.setdefault("CURA_API_KEY", "perf")
+os.environ.setdefault("USE_PANDAS_PERF", "false")
+# score the channel feeds in SQL, which is what the feed cases check, and
+# ... keep nothing in the feed cache, so that every case runs its statements
+# ... even when an earlier case cached the same key, or a nested one
+os.environ["CHANNEL_FEED_SCORING_IN_PROCESS"] = "false"
+os.environ["FEED_CACHE_L1_SIZE"] = "0"
+
+from app.dependencies import db_utils  # noqa: E402
+from app.models.channel_model import (  # noqa: E402
+    CHANNEL_RANKING_STRATEGY_NAMES,
+    ChannelEarningsOrderBy,
+    ChannelEarningsScope,
+    ChannelEarningsType,
+    ChannelFidType,
+    ChannelPointsOrderBy,
+    ChannelRankingsTimeframe,
+    OpenrankCategory,
+)
+from app.models.feed_model import (  # noqa: E402
+    CASTS_AGE,
+    PARENT_CASTS_AGE,
+    ChannelTimeframe,
+    NewUsersFeed,
+    PopularFeed,
+    SortingOrder,
+    TokenFeed,
+    TrendingFeed,
+)
+from app.models.graph_model import GraphType  # noqa: E402
+from app.models.score_model import (  # noqa: E402
+    EngagementType,
+    ScoreAgg,
+    Voting,
+    Weights,
+    engagement_ids,
+)
+
+# statements run by the query function of the current case
+_captured: contextvars.ContextVar[list | None] = contextvars.ContextVar(
+    "captured_statements", default=None
+)
+
+
+class CapturingConnection(asyncpg.Connection):
+    async def fetch(self, query, *args, **kwargs):
+        statements = _captured.get()
+        if statements is not None:
+            statements.append((query, args))
+        return await super().fetch(query, *args, **kwargs)
+
+
+async def fixtures(conn: asyncpg.Connection) -> dict:
+    """Representative parameters: the top fids, the largest channel and so on."""
+    fids = [
+        row["profile_id"]
+        for row in await conn.fetch(
+            "SELECT profile_id FROM k3l_rank WHERE strategy_id = $1"
+            " ORDER BY rank LIMIT 100",
+            engagement_ids[EngagementType.V3],
+        )
+    ]
+    channel = await conn.fetchrow(
+        "SELECT id, url FROM warpcast_channels_data"
+        " ORDER BY followercount DESC LIMIT 1"
+    )
+    token_channel = await conn.fetchval(
+        "SELECT channel_id FROM k3l_channel_rewards_config"
+        " WHERE is_tokens ORDER BY channel_id LIMIT 1"
+    )
+    token = await conn.fetchval(
+        "SELECT token_address FROM k3l_token_holding_fids"
+        " GROUP BY token_address ORDER BY count(*) DESC LIMIT 1"
+    )
+    addresses = [
+        row["address"]
+        for row in await conn.fetch(
+            "SELECT claim->>'address' AS address FROM verifications"
+            " WHERE fid = ANY($1::bigint[]) LIMIT 20",
+            fids,
+        )
+    ]
+    handles = [
+        row["fname"]
+        for row in await conn.fetch(
+            "SELECT fname FROM fnames WHERE fid = ANY($1::bigint[]) LIMIT 20", fids
+        )
+    ]
+    cast_hashes = [
+        row["hash"]
+        for row in await conn.fetch(
+            "SELECT hash FROM k3l_recent_parent_casts WHERE root_parent_url = $1"
+            " ORDER BY timestamp DESC LIMIT 50",
+            channel["url"],
+        )
+    ]
+    return {
+        "fid": fids[0],
+        "fids": fids,
+        "channel": channel["id"],
+        "channel_url": channel["url"],
+        "token_channel": token_channel or channel["id"],
+        "token": token,
+        "addresses": addresses,
+        "handles": handles,
+        "cast_hashes": cast_hashes,
+        "trust_scores": [
+            {"fid": fid, "score": 1 / rank} for rank, fid in enumerate(fids, start=1)
+        ],
+    }
+
+
+def cases(f: dict) -> dict[str, tuple]:
+    """
+    Query functions and the arguments they are called with, by case name.
+    Every query function of db_utils.py has a case, except those that run
+    the statements of another case: the cached wrappers
+    get_trending_channel_casts_lite_memoized, get_trending_channels_casts_lite,
+    get_token_holder_casts_all and get_new_user_casts_all,
+    get_token_holder_casts and get_new_user_casts, which page them, and
+    get_token_holder_cast_actions, which token_holder_casts runs.
+    """
+    strategy = CHANNEL_RANKING_STRATEGY_NAMES[ChannelRankingsTimeframe.SIXTY_DAYS]
+    popular = PopularFeed(feedType="popular")
+    trending = TrendingFeed(feedType="trending")
+    token_feed = TokenFeed(feedType="token", tokenAddress="0x" + f["token"].hex())
+    new_users = NewUsersFeed(feedType="newUsers", channel_id=f["channel"])
+    channel_feed = dict(
+        channel_id=f["channel"],
+        channel_url=f["channel_url"],
+        max_cast_age=CASTS_AGE[popular.lookback],
+        agg=popular.agg,
+        score_threshold=popular.score_threshold,
+        reactions_threshold=popular.reactions_threshold,
+        weights=Weights.from_str(popular.weights),
+        time_decay=popular.time_decay,
+        normalize=popular.normalize,
+        offset=0,
+        limit=25,
+        sorting_order=popular.sorting_order,
+    )
+    trending_feed = dict(
+        max_cast_age=CASTS_AGE[trending.lookback],
+        agg=trending.agg,
+        score_threshold=trending.score_threshold,
+        reactions_threshold=trending.reactions_threshold,
+        cutoff_ptile=trending.cutoff_ptile,
+        weights=Weights.from_str(trending.weights),
+        shuffle=trending.shuffle,
+        time_decay=trending.time_decay,
+        normalize=trending.normalize,
+        offset=0,
+        limit=25,
+        sorting_order=trending.sorting_order,
+        channel_strategy=strategy,
+    )
+    cast_feed = dict(
+        agg=ScoreAgg.SUMSQUARE,
+        weights=Weights.from_str("L1C10R5Y1"),
+        offset=0,
+        limit=25,
+    )
+    frames = dict(
+        agg=ScoreAgg.SUMSQUARE,
+        weights=Weights.from_str("L1C10R5"),
+        limit=100,
+        recent=True,
+    )
+    holder_feed = dict(
+        agg=token_feed.agg,
+        weights=Weights.from_str(token_feed.weights),
+        score_threshold=token_feed.score_threshold,
+        max_cast_age=token_feed.lookback,
+        time_decay_base=token_feed.time_decay_base,
+        time_decay_period=token_feed.time_decay_period,
+        sorting_order=token_feed.sorting_order,
+        time_bucket_length=token_feed.time_bucket_length,
+        limit_casts=token_feed.limit_casts,
+    )
+    return {
+        "handle_fid_for_addresses": (
+            db_utils.get_handle_fid_for_addresses,
+            dict(addresses=f["addresses"]),
+        ),
+        "all_fid_addresses_for_handles": (
+            db_utils.get_all_fid_addresses_for_handles,
+            dict(handles=f["handles"]),
+        ),
+        "unique_fid_metadata_for_handles": (
+            db_utils.get_unique_fid_metadata_for_handles,
+            dict(handles=f["handles"]),
+        ),
+        "verified_addresses_for_fids": (
+            db_utils.get_verified_addresses_for_fids,
+            dict(fids=f["fids"][:20]),
+        ),
+        "all_handle_addresses_for_fids": (
+            db_utils.get_all_handle_addresses_for_fids,
+            dict(fids=f["fids"][:20]),
+        ),
+        "unique_handle_metadata_for_fids": (
+            db_utils.get_unique_handle_metadata_for_fids,
+            dict(fids=f["fids"][:20]),
+        ),
+        "top_profiles": (
+            db_utils.get_top_profiles,
+            dict(
+                strategy_id=GraphType.following.value,
+                offset=0,
+                limit=100,
+                query_type="lite",
+            ),
+        ),
+        "profile_ranks": (
+            db_utils.get_profile_ranks,
+            dict(strategy_id=GraphType.following.value, fids=f["fids"], lite=False),
+        ),
+        "channel_stats": (
+            db_utils.get_channel_stats,
+            dict(channel_id=f["channel"], strategy_name=strategy),
+        ),
+        "channel_cast_metrics": (
+            db_utils.get_channel_cast_metrics,
+            dict(channel_id=f["channel"]),
+        ),
+        "channel_fid_metrics": (
+            db_utils.get_channel_fid_metrics,
+            dict(channel_id=f["channel"], fid_type=ChannelFidType.FOLLOWER),
+        ),
+        "top_openrank_channel_profiles": (
+            db_utils.get_top_openrank_channel_profiles,
+            dict(
+                channel_id=f["channel"],
+                category=OpenrankCategory.PROD.value,
+                offset=0,
+                limit=100,
+            ),
+        ),
+        "top_channel_balances": (
+            db_utils.get_top_channel_balances,
+            dict(
+                channel_id=f["token_channel"],
+                offset=0,
+                limit=100,
+                lite=False,
+                orderby=ChannelPointsOrderBy.TOTAL_POINTS,
+            ),
+        ),
+        "top_channel_profiles": (
+            db_utils.get_top_channel_profiles,
+            dict(
+                channel_id=f["channel"],
+                strategy_name=strategy,
+                offset=0,
+                limit=100,
+                lite=False,
+            ),
+        ),
+        "channel_profile_ranks": (
+            db_utils.get_channel_profile_ranks,
+            dict(
+                channel_id=f["channel"],
+                strategy_name=strategy,
+                fids=f["fids"][:25],
+                lite=False,
+            ),
+        ),
+        "filter_channel_fids": (
+            db_utils.filter_channel_fids,
+            dict(
+                channel_id=f["channel"],
+                fids=f["fids"],
+                filter=ChannelFidType.MEMBER,
+            ),
+        ),
+        "top_channel_earnings": (
+            db_utils.get_top_channel_earnings,
+            dict(
+                channel_id=f["token_channel"],
+                offset=0,
+                limit=100,
+                lite=False,
+                earnings_type=ChannelEarningsType.TOKENS,
+                orderby=ChannelEarningsOrderBy.TOTAL,
+            ),
+        ),
+        "tokens_distrib_preview": (
+            db_utils.get_tokens_distrib_preview,
+            dict(
+                channel_id=f["token_channel"],
+                offset=0,
+                limit=100,
+                scope=ChannelEarningsScope.DAILY,
+            ),
+        ),
+        "points_distrib_preview": (
+            db_utils.get_points_distrib_preview,
+            dict(channel_id=f["token_channel"], offset=0, limit=100),
+        ),
+        "tokens_distrib_overview": (
+            db_utils.get_tokens_distrib_overview,
+            dict(channel_id=f["token_channel"], offset=0, limit=100),
+        ),
+        "tokens_distrib_details": (
+            db_utils.get_tokens_distrib_details,
+            dict(
+                channel_id=f["token_channel"],
+                dist_id=None,
+                batch_id=1,
+                offset=0,
+                limit=100,
+            ),
+        ),
+        "channel_token_balances": (
+            db_utils.get_channel_token_balances,
+            dict(updated_since=None),
+        ),
+        "fid_channel_token_balance": (
+            db_utils.get_fid_channel_token_balance,
+            dict(channel_id=f["token_channel"], fid=f["fid"]),
+        ),
+        "top_channel_followers": (
+            db_utils.get_top_channel_followers,
+            dict(channel_id=f["channel"], strategy_name=strategy, offset=0, limit=100),
+        ),
+        "top_channel_holders": (
+            db_utils.get_top_channel_holders,
+            dict(
+                channel_id=f["token_channel"],
+                strategy_name=strategy,
+                orderby=ChannelEarningsOrderBy.TOTAL,
+                offset=0,
+                limit=100,
+            ),
+        ),
+        "top_channel_repliers": (
+            db_utils.get_top_channel_repliers,
+            dict(channel_id=f["channel"], strategy_name=strategy, offset=0, limit=100),
+        ),
+        "channel_ids_for_fid": (
+            db_utils.get_channel_ids_for_fid,
+            dict(fid=f["fid"], limit=100),
+        ),
+        "channel_metadata_for_url": (
+            db_utils.get_channel_metadata_for_url,
+            dict(url=f["channel_url"]),
+        ),
+        "channel_metadata_for_channel_id": (
+            db_utils.get_channel_metadata_for_channel_id,
+            dict(channel_id=f["channel"]),
+        ),
+        "all_channels_metadata": (db_utils.get_all_channels_metadata, dict()),
+        "top_frames": (
+            db_utils.get_top_frames,
+            dict(**frames, offset=0, decay=False),
+        ),
+        "top_frames_with_cast_details": (
+            db_utils.get_top_frames_with_cast_details,
+            dict(**frames, offset=0, decay=False),
+        ),
+        "neighbors_frames": (
+            db_utils.get_neighbors_frames,
+            dict(**frames, voting=Voting.SINGLE, trust_scores=f["trust_scores"]),
+        ),
+        "popular_neighbors_casts": (
+            db_utils.get_popular_neighbors_casts,
+            dict(**cast_feed, trust_scores=f["trust_scores"], lite=True),
+        ),
+        "recent_neighbors_casts": (
+            db_utils.get_recent_neighbors_casts,
+            dict(trust_scores=f["trust_scores"], offset=0, limit=25, lite=True),
+        ),
+        "recent_casts_by_fids": (
+            db_utils.get_recent_casts_by_fids,
+            dict(fids=f["fids"][:10], offset=0, limit=25),
+        ),
+        "trending_casts_lite": (
+            db_utils.get_trending_casts_lite,
+            dict(**cast_feed, score_threshold_multiplier=10**5),
+        ),
+        "trending_casts_heavy": (
+            db_utils.get_trending_casts_heavy,
+            dict(**cast_feed, score_threshold_multiplier=10**5),
+        ),
+        "popular_degen_casts": (
+            db_utils.get_popular_degen_casts,
+            dict(**cast_feed, sorting_order=SortingOrder.SCORE),
+        ),
+        "top_casters": (db_utils.get_top_casters, dict(offset=0, limit=100)),
+        "top_spammers": (db_utils.get_top_spammers, dict(offset=0, limit=100)),
+        "channel_cast_actions": (
+            db_utils.get_channel_cast_actions,
+            dict(
+                channel_id=f["channel"],
+                channel_url=f["channel_url"],
+                strategy_name=strategy,
+                max_cast_age=CASTS_AGE[popular.lookback],
+            ),
+        ),
+        "popular_channel_casts_lite": (
+            db_utils.get_popular_channel_casts_lite,
+            dict(**channel_feed, strategy_name=strategy),
+        ),
+        "popular_channel_casts_heavy": (
+            db_utils.get_popular_channel_casts_heavy,
+            dict(**channel_feed, strategy_name=strategy),
+        ),
+        "trending_channel_casts_lite": (
+            db_utils.get_trending_channel_casts_lite,
+            dict(
+                **trending_feed,
+                channel_id=f["channel"],
+                channel_url=f["channel_url"],
+            ),
+        ),
+        "trending_channel_casts_heavy": (
+            db_utils.get_trending_channel_casts_heavy,
+            dict(
+                **trending_feed,
+                channel_id=f["channel"],
+                channel_url=f["channel_url"],
+            ),
+        ),
+        "trending_channels_casts_lite": (
+            db_utils._get_trending_channels_casts_lite,
+            dict(**trending_feed, channel_ids=(f["channel"], f["token_channel"])),
+        ),
+        "channel_casts_scores_lite": (
+            db_utils.get_channel_casts_scores_lite,
+            dict(
+                cast_hashes=f["cast_hashes"],
+                channel_id=f["channel"],
+                channel_strategy=strategy,
+                agg=popular.agg,
+                score_threshold=popular.score_threshold,
+                weights=Weights.from_str(popular.weights),
+                time_decay=popular.time_decay,
+                normalize=popular.normalize,
+                sorting_order=popular.sorting_order,
+            ),
+        ),
+        "trending_channels": (
+            db_utils.get_trending_channels,
+            dict(
+                max_cast_age=PARENT_CASTS_AGE[ChannelTimeframe.WEEK],
+                rank_threshold=10000,
+                offset=0,
+                limit=25,
+            ),
+        ),
+        "token_balances": (
+            db_utils.get_token_balances,
+            dict(token_address=f["token"], fids=f["fids"][:20]),
+        ),
+        "token_holders": (
+            db_utils.get_token_holders,
+            dict(token_address=f["token"]),
+        ),
+        "token_holder_casts": (
+            db_utils._get_token_holder_casts_all,
+            dict(**holder_feed, token_address=f["token"]),
+        ),
+        "new_user_casts": (
+            db_utils._get_new_user_casts_all,
+            dict(
+                channel_id=new_users.channel_id,
+                caster_age=new_users.caster_age,
+                agg=new_users.agg,
+                weights=Weights.from_str(new_users.weights),
+                score_threshold=new_users.score_threshold,
+                max_cast_age=new_users.lookback,
+                time_decay_base=new_users.time_decay_base,
+                time_decay_period=new_users.time_decay_period,
+                sorting_order=new_users.sorting_order,
+                time_bucket_length=new_users.time_bucket_length,
+                limit_casts=new_users.limit_casts,
+            ),
+        ),
+    }
+
+
+def walk(node: dict, depth: int = 0):
+    yield depth, node
+    for child in node.get("Plans", []):
+        yield from walk(child, depth + 1)
+
+
+def summarize(plan: dict) -> dict:
+    root = plan["Plan"]
+    shape = []
+    seq_scans = set()
+    index_scans = set()
+    for depth, node in walk(root):
+        line = node["Node Type"]
+        if "Index Name" in node:
+            line += f" using {node['Index Name']}"
+        if "Relation Name" in node:
+            line += f" on {node['Relation Name']}"
+            if node["Node Type"] == "Seq Scan":
+                seq_scans.add(node["Relation Name"])
+            else:
+                index_scans.add(node["Relation Name"])
+        shape.append("  " * depth + line)
+    return {
+        "shape": shape,
+        "seq_scans": sorted(seq_scans),
+        "index_scans": sorted(index_scans),
+        "cost": root["Total Cost"],
+        "rows": root["Actual Rows"],
+        "buffers": root["Shared Hit Blocks"] + root["Shared Read Blocks"],
+        "ms": plan["Execution Time"],
+    }
+
+
+def compare(
+    name: str, base: dict, plan: dict, args: argparse.Namespace
+) -> tuple[list[str], list[str]]:
+    """Regressions and other changes of a statement's plan."""
+    regressions, changes = [], []
+    for relation in sorted(set(plan["seq_scans"]) - set(base["seq_scans"])):
+        if relation in base["index_scans"]:
+            regressions.append(f"{name}: {relation} is now read by a sequential scan")
+    if plan["cost"] > base["cost"] * args.cost_ratio:
+        regressions.append(
+            f"{name}: estimated cost {base['cost']:.0f} -> {plan['cost']:.0f}"
+        )
+    if (
+        plan["buffers"] > args.min_buffers
+        and plan["buffers"] > base["buffers"] * args.buffers_ratio
+    ):
+        regressions.append(f"{name}: buffers {base['buffers']} -> {plan['buffers']}")
+    if plan["shape"] != base["shape"]:
+        changes.append(
+            f"{name}: plan changed\n  was:\n    "
+            + "\n    ".join(base["shape"])
+            + "\n  now:\n    "
+            + "\n    ".join(plan["shape"])
+        )
+    return regressions, changes
+
+
+async def explain_all(args: argparse.Namespace) -> tuple[dict[str, dict], list[str]]:
+    """Plans by statement, and the cases that failed."""
+    pool = await asyncpg.create_pool(
+        args.dsn, min_size=1, max_size=2, connection_class=CapturingConnection
+    )
+    plans, failed = {}, []
+    try:
+        async with pool.acquire() as conn:
+            all_cases = cases(await fixtures(conn))
+        selected = {
+            name: case
+            for name, case in all_cases.items()
+            if not args.cases or name in args.cases
+        }
+        for name, (func, kwargs) in selected.items():
+            statements = []
+            token = _captured.set(statements)
+            try:
+                # fetch_rows logs and swallows query errors; EXPLAIN raises them
+                await getattr(func, "__wrapped__", func)(**kwargs, pool=pool)
+                if not statements:
+                    raise RuntimeError("ran no statements")
+                async with pool.acquire() as conn:
+                    for k, (query, query_args) in enumerate(statements):
+                        explained = await conn.fetchval(
+                            f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}",
+                            *query_args,
+                        )
+                        plans[f"{name}[{k}]"] = summarize(json.loads(explained)[0])
+            except Exception as e:
+                print(f"FAILED {name}: {e}")
+                failed.append(name)
+            finally:
+                _captured.reset(token)
+    finally:
+        await pool.close()
+    return plans, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dsn", required=True)
+    parser.add_argument(
+        "--baseline", type=Path, default=Path(__file__).with_name("plans.json")
+    )
+    parser.add_argument(
+        "--update", action="store_true", help="write the baseline instead of checking"
+    )
+    parser.add_argument(
+        "--cost-ratio",
+        type=float,
+        default=1.5,
+        help="fail when the estimated cost grows by more than this factor",
+    )
+    parser.add_argument(
+        "--buffers-ratio",
+        type=float,
+        default=2.0,
+        help="fail when the buffers touched grow by more than this factor",
+    )
+    parser.add_argument(
+        "--min-buffers",
+        type=int,
+        default=1000,
+        help="ignore buffer growth of statements touching fewer buffers",
+    )
+    parser.add_argument("cases", nargs="*", help="only these cases (default: all)")
+    args = parser.parse_args()
+    if not args.update and not args.baseline.exists():
+        sys.exit(
+            f"{args.baseline} does not exist; run with --update first"
+            " to record the baseline"
+        )
+
+    plans, failed = asyncio.run(explain_all(args))
+    if args.update:
+        baseline = {}
+        if args.cases and args.baseline.exists():
+            baseline = json.loads(args.baseline.read_text())
+        baseline.update(plans)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"wrote {len(plans)} plans to {args.baseline}")
+        sys.exit(1 if failed else 0)
+
+    baseline = json.loads(args.baseline.read_text())
+    regressions, changes = [], []
+    for name, plan in plans.items():
+        if name not in baseline:
+            changes.append(f"{name}: not in the baseline")
+            continue
+        r, c = compare(name, baseline[name], plan, args)
+        regressions.extend(r)
+        changes.extend(c)
+    for name in baseline.keys() - plans.keys():
+        if not args.cases or name.split("[")[0] in args.cases:
+            changes.append(f"{name}: no longer run")
+    for line in changes:
+        print(line)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print(
+        f"{len(plans)} statements, {len(regressions)} regressions,"
+        f" {len(changes)} other changes, {len(failed)} failed cases"
+    )
+    sys.exit(1 if regressions or failed else 0)
+
+
+if __name__ == "__main__":
+    main()
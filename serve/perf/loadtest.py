@@ -0,0 +1,292 @@
+"""
+Replays a weighted request mix (mix.json) against a running serve instance
+with a fixed number of concurrent clients, each sending its next request as
+soon as the previous one is answered. Route parameters come from the
+manifest written by seed_db.py.
+
+Reports overall throughput, per-route latency percentiles and errors, and
+from the server's /metrics: connection pool saturation and acquire waits,
+queries cut short and requests shed by admission control.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import niquests
+import numpy as np
+from prometheus_client.openmetrics.parser import text_string_to_metric_families
+
+PLACEHOLDER = re.compile(r"^\$(\w+)(?::(\d+))?$")
+
+
+class Params:
+    """Random route parameters, skewed like production traffic."""
+
+    def __init__(self, manifest: dict, seed: int) -> None:
+        self.rng = random.Random(seed)
+        self.fids = range(1, manifest["fids"] + 1)
+        self.fid_weights = [1 / k for k in self.fids]
+        self.channels = manifest["channels"]
+        self.channel_weights = [1 / k for k in range(1, len(self.channels) + 1)]
+        self.tokens = manifest["tokens"]
+        self.addresses = manifest["addresses"]
+
+    def fid(self) -> int:
+        return self.rng.choices(self.fids, self.fid_weights)[0]
+
+    def fids_(self, count: int) -> list[int]:
+        return list(set(self.rng.choices(self.fids, self.fid_weights, k=count)))
+
+    def channel(self) -> str:
+        return self.rng.choices(self.channels, self.channel_weights)[0]
+
+    def token(self) -> str:
+        return self.rng.choice(self.tokens)
+
+    def addresses_(self, count: int) -> list[str]:
+        return self.rng.sample(self.addresses, min(count, len(self.addresses)))
+
+    def value(self, name: str, count: int | None):
+        if count is not None:
+            return getattr(self, f"{name}_")(count)
+        return getattr(self, name)()
+
+    def render(self, template):
+        if isinstance(template, str):
+            match = PLACEHOLDER.match(template)
+            if match is None:
+                return template
+            name, count = match.groups()
+            return self.value(name, None if count is None else int(count))
+        if isinstance(template, dict):
+            return {key: self.render(value) for key, value in template.items()}
+        return template
+
+    def path(self, template: str) -> str:
+        names = re.findall(r"\{(\w+)\}", template)
+        return template.format(**{name: self.value(name, None) for name in names})
+
+
+async def scrape(session: niquests.AsyncSession, base_url: str) -> dict:
+    """Samples of the serve metrics the report uses, keyed by (name, labels)."""
+    resp = await session.get(f"{base_url}/metrics", timeout=5)
+    resp.raise_for_status()
+    samples = {}
+    for family in text_string_to_metric_families(resp.text):
+        if not family.name.startswith(("db_", "admission_")):
+            continue
+        for sample in family.samples:
+            labels = tuple(sorted(sample.labels.items()))
+            samples[(sample.name, labels)] = sample.value
+    return samples
+
+
+def metric_sum(samples: dict, name: str, **labels) -> dict[str, float]:
+    """Sums the samples of `name` matching `labels`, by their `pool` label."""
+    totals = defaultdict(float)
+    for (sample_name, sample_labels), value in samples.items():
+        sample_labels = dict(sample_labels)
+        if sample_name != name:
+            continue
+        if any(sample_labels.get(key) != want for key, want in labels.items()):
+            continue
+        totals[sample_labels.get("pool", "")] += value
+    return totals
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        with open(args.mix) as f:
+            self.routes = json.load(f)["routes"]
+        with open(args.manifest) as f:
+            self.params = Params(json.load(f), args.seed)
+        self.weights = [route["weight"] for route in self.routes]
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        # (in_use, max) by pool, sampled every --metrics-interval
+        self.pool_samples: dict[str, list[tuple[float, float]]] = defaultdict(list)
+        self.recording = False
+
+    async def send(self, session: niquests.AsyncSession, route: dict):
+        kwargs = {"timeout": self.args.timeout}
+        if "params" in route:
+            kwargs["params"] = self.params.render(route["params"])
+        if "body" in route:
+            kwargs["json"] = self.params.render(route["body"])
+        url = self.args.base_url + self.params.path(route["path"])
+        start = time.perf_counter()
+        try:
+            resp = await session.request(route["method"], url, **kwargs)
+            error = None if resp.status_code < 400 else str(resp.status_code)
+        except Exception as e:
+            error = type(e).__name__
+        elapsed = time.perf_counter() - start
+        if not self.recording:
+            return
+        if error is None:
+            self.latencies[route["name"]].append(elapsed)
+        else:
+            self.errors[route["name"]][error] += 1
+
+    async def client(self, session: niquests.AsyncSession, stop_at: float):
+        while time.monotonic() < stop_at:
+            route = self.params.rng.choices(self.routes, self.weights)[0]
+            await self.send(session, route)
+
+    async def sample_pools(self, session: niquests.AsyncSession, stop_at: float):
+        while time.monotonic() < stop_at:
+            try:
+                samples = await scrape(session, self.args.base_url)
+            except Exception as e:
+                print(f"metrics scrape failed: {e}")
+            else:
+                in_use = metric_sum(samples, "db_pool_connections", state="in_use")
+                max_size = metric_sum(samples, "db_pool_connections", state="max")
+                if self.recording:
+                    for pool, value in in_use.items():
+                        self.pool_samples[pool].append((value, max_size[pool]))
+            await asyncio.sleep(self.args.metrics_interval)
+
+    async def run(self):
+        start = time.monotonic()
+        warm_until = start + self.args.warmup
+        stop_at = warm_until + self.args.duration
+        async with niquests.AsyncSession(
+            pool_maxsize=self.args.concurrency + 1
+        ) as session:
+            clients = [
+                asyncio.create_task(self.client(session, stop_at))
+                for _ in range(self.args.concurrency)
+            ]
+            sampler = asyncio.create_task(self.sample_pools(session, stop_at))
+            await asyncio.sleep(max(0.0, warm_until - time.monotonic()))
+            before = await scrape(session, self.args.base_url)
+            self.recording = True
+            recording_start = time.monotonic()
+            await asyncio.gather(*clients, sampler)
+            self.recording = False
+            elapsed = time.monotonic() - recording_start
+            after = await scrape(session, self.args.base_url)
+        return self.report(elapsed, before, after)
+
+    def report(self, elapsed: float, before: dict, after: dict) -> dict:
+        routes = {}
+        for route in sorted(set(self.latencies) | set(self.errors)):
+            latencies = np.array(self.latencies[route]) * 1000
+            routes[route] = {
+                "ok": len(latencies),
+                "errors": dict(self.errors[route]),
+                "rps": len(latencies) / elapsed,
+                **{
+                    f"p{q}_ms": (
+                        float(np.percentile(latencies, q)) if len(latencies) else None
+                    )
+                    for q in (50, 90, 99)
+                },
+                "max_ms": float(latencies.max()) if len(latencies) else None,
+            }
+
+        def delta(name: str, **labels) -> dict[str, float]:
+            start = metric_sum(before, name, **labels)
+            end = metric_sum(after, name, **labels)
+            return {pool: end[pool] - start.get(pool, 0.0) for pool in end}
+
+        acquire_secs = delta("db_pool_acquire_duration_seconds_sum")
+        acquires = delta("db_pool_acquire_duration_seconds_count")
+        pools = {}
+        for pool, samples in self.pool_samples.items():
+            in_use = np.array([s[0] for s in samples])
+            max_size = max(s[1] for s in samples) or 1
+            pools[pool] = {
+                "max_size": max_size,
+                "mean_in_use": float(in_use.mean()),
+                "peak_in_use": float(in_use.max()),
+                "saturated_pct": float((in_use >= max_size).mean() * 100),
+                "mean_acquire_ms": (
+                    acquire_secs[pool] / acquires[pool] * 1000
+                    if acquires.get(pool)
+                    else None
+                ),
+            }
+        total_ok = sum(r["ok"] for r in routes.values())
+        return {
+            "concurrency": self.args.concurrency,
+            "duration_secs": elapsed,
+            "rps": total_ok / elapsed,
+            "errors": sum(sum(r["errors"].values()) for r in routes.values()),
+            "routes": routes,
+            "pools": pools,
+            "queries_aborted": {
+                pool: count
+                for pool, count in delta("db_queries_aborted_total").items()
+                if count
+            },
+            "requests_shed": sum(delta("admission_shed_total").values()),
+        }
+
+
+def print_report(report: dict):
+    print(
+        f"\n{report['rps']:.1f} req/s over {report['duration_secs']:.0f} secs"
+        f" with {report['concurrency']} clients, {report['errors']} errors"
+    )
+    print(
+        f"\n{'route':<28}{'ok':>8}{'err':>6}{'req/s':>8}"
+        f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    )
+    for name, route in report["routes"].items():
+        cells = [
+            f"{route[key]:>9.1f}" if route[key] is not None else f"{'-':>9}"
+            for key in ("p50_ms", "p90_ms", "p99_ms", "max_ms")
+        ]
+        print(
+            f"{name:<28}{route['ok']:>8}{sum(route['errors'].values()):>6}"
+            f"{route['rps']:>8.1f}{''.join(cells)}"
+        )
+    print(
+        f"\n{'pool':<16}{'size':>6}{'mean in use':>13}{'peak':>6}"
+        f"{'% saturated':>13}{'acquire ms':>12}"
+    )
+    for name, pool in report["pools"].items():
+        acquire = pool["mean_acquire_ms"]
+        print(
+            f"{name:<16}{pool['max_size']:>6.0f}{pool['mean_in_use']:>13.1f}"
+            f"{pool['peak_in_use']:>6.0f}{pool['saturated_pct']:>13.1f}"
+            f"{acquire if acquire is not None else float('nan'):>12.2f}"
+        )
+    print(
+        f"\nqueries aborted: {report['queries_aborted'] or 0},"
+        f" requests shed: {report['requests_shed']:.0f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--manifest", required=True)
+    parser.add_argument("--mix", default=Path(__file__).with_name("mix.json"))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--warmup", type=float, default=10)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--metrics-interval", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    report = asyncio.run(LoadTest(args).run())
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/bin/bash
+# Runs the serve app against local stand-ins and replays the request mix:
+# a throwaway Postgres with the pipeline schema and synthetic data,
+# synthetic graph pickles and a go-eigentrust stub, all on this machine.
+#
+# Usage: perf/run.sh [loadtest.py options], e.g. perf/run.sh --concurrency 64
+#        perf/run.sh explain [explain_plans.py options] checks query plans
+#        against perf/plans.json instead of running the load test
+#
+# Environment:
+#   PG_BIN      directory of initdb/pg_ctl/psql if they are not on PATH
+#   WORK_DIR    where the database, graphs and report go (/tmp/serve-perf)
+#   REUSE=1     keep the database and graphs of a previous run
+#   FIDS, CHANNELS, CASTS_PER_DAY   size of the synthetic data
+#   WORKERS     uvicorn workers for the app (1)
+# App settings such as POSTGRES_POOL_SIZE are passed through as usual.
+set -euo pipefail
+
+PERF_DIR=$(cd "$(dirname "$0")" && pwd)
+SERVE_DIR=$(dirname "$PERF_DIR")
+SCHEMA_DIR="$SERVE_DIR/../pipeline/schema"
+WORK_DIR=${WORK_DIR:-/tmp/serve-perf}
+PG_PORT=${PG_PORT:-55432}
+APP_PORT=${APP_PORT:-8000}
+STUB_PORT=${STUB_PORT:-8080}
+FIDS=${FIDS:-50000}
+CHANNELS=${CHANNELS:-200}
+CASTS_PER_DAY=${CASTS_PER_DAY:-10000}
+WORKERS=${WORKERS:-1}
+PYTHON=${PYTHON:-python}
+if [ -n "${PG_BIN:-}" ]; then
+	PATH="$PG_BIN:$PATH"
+fi
+
+PGDATA="$WORK_DIR/pgdata"
+DSN="postgresql://postgres@127.0.0.1:$PG_PORT/farcaster"
+pids=()
+
+cleanup() {
+	for pid in "${pids[@]}"; do
+		kill "$pid" 2>/dev/null || true
+	done
+	wait 2>/dev/null || true
+	pg_ctl -D "$PGDATA" -m fast stop >/dev/null 2>&1 || true
+}
+trap cleanup EXIT
+
+wait_for() {
+	local url=$1
+	for _ in $(seq 120); do
+		if curl -sf -o /dev/null "$url"; then
+			return 0
+		fi
+		sleep 1
+	done
+	echo "timed out waiting for $url" >&2
+	exit 1
+}
+
+mkdir -p "$WORK_DIR"
+if [ "${REUSE:-0}" != 1 ] || [ ! -d "$PGDATA" ]; then
+	rm -rf "$PGDATA" "$WORK_DIR/graphs"
+	initdb -D "$PGDATA" -U postgres -A trust >/dev/null
+	{
+		echo "port = $PG_PORT"
+		echo "listen_addresses = '127.0.0.1'"
+		echo "unix_socket_directories = '$WORK_DIR'"
+		echo "shared_preload_libraries = 'pg_stat_statements'"
+		echo "shared_buffers = 1GB"
+		echo "max_connections = 200"
+	} >>"$PGDATA/postgresql.conf"
+	pg_ctl -D "$PGDATA" -l "$WORK_DIR/postgres.log" -w start >/dev/null
+
+	psql="psql -q -h 127.0.0.1 -p $PG_PORT -U postgres"
+	$psql -d postgres -c "CREATE DATABASE farcaster"
+	for role in k3l_user k3l_readonly neynar airbyte_user; do
+		$psql -d postgres -c "CREATE ROLE $role"
+	done
+	# views over tables that only exist in production fail to create,
+	# stand_ins.sql replaces the ones the app reads
+	$psql -d farcaster -f "$SCHEMA_DIR/neynar_db_schema.sql" \
+		>"$WORK_DIR/schema.log" 2>&1 || true
+	$psql -d farcaster -v ON_ERROR_STOP=1 -f "$SCHEMA_DIR/k3l_data_versions.sql"
+	$psql -d farcaster -v ON_ERROR_STOP=1 -f "$PERF_DIR/stand_ins.sql"
+
+	"$PYTHON" "$PERF_DIR/seed_db.py" --dsn "$DSN" \
+		--manifest "$WORK_DIR/manifest.json" --fids "$FIDS" \
+		--channels "$CHANNELS" --casts-per-day "$CASTS_PER_DAY"
+	"$PYTHON" "$PERF_DIR/synth_graph.py" --out "$WORK_DIR/graphs" --fids "$FIDS"
+else
+	pg_ctl -D "$PGDATA" -l "$WORK_DIR/postgres.log" -w start >/dev/null
+fi
+
+if [ "${1:-}" = explain ]; then
+	shift
+	"$PYTHON" "$PERF_DIR/explain_plans.py" --dsn "$DSN" "$@"
+	exit
+fi
+
+(cd "$PERF_DIR" && exec "$PYTHON" eigentrust_stub.py --port "$STUB_PORT") &
+pids+=($!)
+
+(
+	cd "$SERVE_DIR"
+	export DB_HOST=127.0.0.1 DB_PORT=$PG_PORT DB_NAME=farcaster
+	export DB_USERNAME=postgres DB_PASSWORD=postgres
+	export GO_EIGENTRUST_URL="http://127.0.0.1:$STUB_PORT"
+	export FOLLOW_GRAPH_PATHPREFIX="$WORK_DIR/graphs/fc_following_fid"
+	export NINETYDAYS_GRAPH_PATHPREFIX="$WORK_DIR/graphs/fc_90dv3_fid"
+	export SWAGGER_BASE_URL=${SWAGGER_BASE_URL:-http://127.0.0.1:$APP_PORT}
+	export CURA_API_KEY=${CURA_API_KEY:-perf}
+	export USE_PANDAS_PERF=${USE_PANDAS_PERF:-true}
+	exec "$PYTHON" -m uvicorn app.main:app --host 127.0.0.1 --port "$APP_PORT" \
+		--workers "$WORKERS" --log-level warning
+) >"$WORK_DIR/serve.log" 2>&1 &
+pids+=($!)
+
+wait_for "http://127.0.0.1:$STUB_PORT/docs"
+wait_for "http://127.0.0.1:$APP_PORT/_health"
+
+"$PYTHON" "$PERF_DIR/loadtest.py" --base-url "http://127.0.0.1:$APP_PORT" \
+	--manifest "$WORK_DIR/manifest.json" --out "$WORK_DIR/report.json" "$@"
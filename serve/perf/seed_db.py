@@ -0,0 +1,416 @@
+"""
+Fills a Postgres database that has the pipeline schema (see run.sh) with
+synthetic Farcaster data for load tests: fids and their names, channels
+with followers and members, 30 days of casts with their cast actions,
+global and channel ranks, channel token balances and ERC20 holders.
+
+Activity is skewed like the real network: a few fids and channels account
+for most casts and reactions. Everything is derived from --seed, so two
+runs with the same arguments load the same data.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import UTC, datetime, timedelta
+
+import asyncpg
+import numpy as np
+
+CHANNEL_STRATEGY_NAMES = (
+    "channel_engagement",
+    "60d_engagement",
+    "7d_engagement",
+    "1d_engagement",
+)
+# following, engagement v1 and engagement v3
+GLOBAL_STRATEGY_IDS = (1, 3, 9)
+CHANNEL_URL = "https://warpcast.com/~/channel/{}"
+
+
+def zipf_choice(rng: np.random.Generator, n: int, size: int, a: float = 1.1):
+    """Values in [0, n) where low values are much more likely."""
+    weights = 1 / np.arange(1, n + 1) ** a
+    return rng.choice(n, size, p=weights / weights.sum())
+
+
+def random_bytes(rng: np.random.Generator, n: int, width: int) -> list[bytes]:
+    data = rng.bytes(n * width)
+    return [data[k * width : (k + 1) * width] for k in range(n)]
+
+
+class Seeder:
+    def __init__(self, conn: asyncpg.Connection, args: argparse.Namespace) -> None:
+        self.conn = conn
+        self.args = args
+        self.rng = np.random.default_rng(args.seed)
+        self.now = datetime.now(UTC).replace(tzinfo=None)
+        self.fids = np.arange(1, args.fids + 1, dtype=np.int64)
+        self.channel_ids = [f"channel{c}" for c in range(args.channels)]
+
+    async def copy(self, table: str, columns: list[str], records: list[tuple]):
+        start = time.perf_counter()
+        await self.conn.copy_records_to_table(table, records=records, columns=columns)
+        print(f"{table}: {len(records)} rows in {time.perf_counter() - start:.1f} secs")
+
+    def active_fids(self, size: int) -> np.ndarray:
+        return self.fids[zipf_choice(self.rng, len(self.fids), size)]
+
+    def past(self, size: int, days: float) -> np.ndarray:
+        """Naive UTC timestamps up to `days` ago, as numpy datetimes."""
+        secs = self.rng.uniform(0, days * 86400, size)
+        return np.datetime64(self.now, "us") - (secs * 1e6).astype("timedelta64[us]")
+
+    async def profiles(self):
+        n = len(self.fids)
+        custody = random_bytes(self.rng, n, 20)
+        registered = self.past(n, 700).tolist()
+        await self.copy(
+            "fids",
+            ["fid", "custody_address", "registered_at"],
+            [
+                (int(fid), addr, ts.replace(tzinfo=UTC))
+                for fid, addr, ts in zip(self.fids, custody, registered)
+            ],
+        )
+        await self.copy(
+            "fnames",
+            ["fname", "fid", "custody_address"],
+            [(f"user{fid}", int(fid), addr) for fid, addr in zip(self.fids, custody)],
+        )
+        hashes = random_bytes(self.rng, 2 * n, 20)
+        await self.copy(
+            "user_data",
+            ["id", "timestamp", "fid", "hash", "type", "value"],
+            [
+                (k, registered[k % n], int(self.fids[k % n]), hashes[k], kind, value)
+                for k, (kind, value) in enumerate(
+                    [(6, f"user{fid}") for fid in self.fids]
+                    + [(2, f"User {fid}") for fid in self.fids]
+                )
+            ],
+        )
+        verified = self.rng.random(n) < 0.6
+        addresses = random_bytes(self.rng, int(verified.sum()), 20)
+        await self.copy(
+            "verifications",
+            ["id", "timestamp", "fid", "hash", "claim"],
+            [
+                (
+                    k,
+                    registered[0],
+                    int(fid),
+                    addr,
+                    json.dumps({"address": "0x" + addr.hex()}),
+                )
+                for k, (fid, addr) in enumerate(zip(self.fids[verified], addresses))
+            ],
+        )
+
+    async def channels(self):
+        n = len(self.channel_ids)
+        # channel sizes fall off with popularity, from --max-channel-members down
+        sizes = (self.args.max_channel_members / np.arange(1, n + 1)).astype(int)
+        sizes = sizes.clip(20, len(self.fids))
+        self.members = {
+            channel_id: np.sort(self.rng.choice(self.fids, size, replace=False))
+            for channel_id, size in zip(self.channel_ids, sizes)
+        }
+        pinned = random_bytes(self.rng, n, 20)
+        await self.copy(
+            "warpcast_channels_data",
+            [
+                "id",
+                "url",
+                "name",
+                "description",
+                "leadfid",
+                "moderatorfids",
+                "createdat",
+                "followercount",
+                "membercount",
+                "pinnedcasthash",
+            ],
+            [
+                (
+                    channel_id,
+                    CHANNEL_URL.format(channel_id),
+                    channel_id.title(),
+                    f"All about {channel_id}",
+                    int(members[0]),
+                    [int(fid) for fid in members[:3]],
+                    self.now - timedelta(days=365),
+                    len(members),
+                    len(members) // 4,
+                    "0x" + pin.hex(),
+                )
+                for (channel_id, members), pin in zip(self.members.items(), pinned)
+            ],
+        )
+        for table, ts_column in (
+            ("warpcast_followers", "followedat"),
+            ("warpcast_members", "memberat"),
+        ):
+            records = []
+            for channel_id, members in self.members.items():
+                subset = members if table == "warpcast_followers" else members[::4]
+                joined = self.past(len(subset), 365).astype("datetime64[s]")
+                records.extend(
+                    (int(fid), int(ts.astype(np.int64)), self.now, channel_id)
+                    for fid, ts in zip(subset, joined)
+                )
+            await self.copy(
+                table, ["fid", ts_column, "insert_ts", "channel_id"], records
+            )
+
+    async def casts(self):
+        days = self.args.days
+        n = self.args.casts_per_day * days
+        fids = self.active_fids(n)
+        timestamps = np.sort(self.past(n, days))
+        hashes = random_bytes(self.rng, n, 20)
+        # most root casts are in a channel, popular channels get more of them
+        channel_idx = zipf_choice(self.rng, len(self.channel_ids), n)
+        in_channel = self.rng.random(n) < 0.8
+        is_reply = self.rng.random(n) < 0.3
+        records = []
+        self.root_casts = []
+        for k in range(n):
+            ts = timestamps[k].item()
+            url = (
+                CHANNEL_URL.format(self.channel_ids[channel_idx[k]])
+                if in_channel[k]
+                else None
+            )
+            parent = None
+            if is_reply[k] and k > 0:
+                parent = hashes[int(self.rng.integers(0, k))]
+            else:
+                self.root_casts.append((hashes[k], int(fids[k]), ts))
+            records.append(
+                (
+                    k + 1,
+                    ts,
+                    ts,
+                    ts,
+                    int(fids[k]),
+                    hashes[k],
+                    parent,
+                    # replies point at their parent cast instead of the channel
+                    url if parent is None else None,
+                    f"synthetic cast {k} from fid {fids[k]}",
+                    "[]",
+                    parent or hashes[k],
+                    url,
+                )
+            )
+        await self.copy(
+            "casts",
+            [
+                "id",
+                "created_at",
+                "updated_at",
+                "timestamp",
+                "fid",
+                "hash",
+                "parent_hash",
+                "parent_url",
+                "text",
+                "embeds",
+                "root_parent_hash",
+                "root_parent_url",
+            ],
+            records,
+        )
+
+    async def cast_actions(self):
+        records = []
+        for cast_hash, author, ts in self.root_casts:
+            records.append((author, cast_hash, 1, 0, 0, 0, ts, ts))
+            reactions = min(int(self.rng.zipf(1.8)), self.args.max_reactions)
+            actors = self.active_fids(reactions)
+            delays = self.rng.exponential(3600, reactions)
+            kinds = self.rng.choice(3, reactions, p=[0.15, 0.15, 0.7])
+            for actor, delay, kind in zip(actors, delays, kinds):
+                action_ts = ts + timedelta(seconds=float(delay))
+                if action_ts > self.now:
+                    continue
+                flags = [0, 0, 0]
+                flags[kind] = 1
+                records.append((int(actor), cast_hash, 0, *flags, action_ts, action_ts))
+        columns = [
+            "fid",
+            "cast_hash",
+            "casted",
+            "replied",
+            "recasted",
+            "liked",
+            "action_ts",
+            "created_at",
+        ]
+        # the token holder feed reads the newer, channel tagged table
+        await self.copy("k3l_cast_action", columns, records)
+        await self.copy("k3l_cast_action_v1", columns, records)
+
+    async def ranks(self):
+        records = []
+        pseudo_id = 0
+        for strategy_id in GLOBAL_STRATEGY_IDS:
+            scores = self.rng.pareto(1.5, len(self.fids))
+            order = np.argsort(-scores, kind="stable")
+            for rank, idx in enumerate(order, start=1):
+                pseudo_id += 1
+                records.append(
+                    (
+                        pseudo_id,
+                        rank,
+                        float(scores[idx] / scores.sum()),
+                        int(self.fids[idx]),
+                        strategy_id,
+                        f"strategy_{strategy_id}",
+                        self.now.date(),
+                    )
+                )
+        await self.copy(
+            "k3l_rank",
+            [
+                "pseudo_id",
+                "rank",
+                "score",
+                "profile_id",
+                "strategy_id",
+                "strategy_name",
+                "date",
+            ],
+            records,
+        )
+
+        records = []
+        for strategy_name in CHANNEL_STRATEGY_NAMES:
+            for channel_id, members in self.members.items():
+                scores = self.rng.pareto(1.5, len(members))
+                order = np.argsort(-scores, kind="stable")
+                for rank, idx in enumerate(order, start=1):
+                    pseudo_id += 1
+                    records.append(
+                        (
+                            pseudo_id,
+                            channel_id,
+                            int(members[idx]),
+                            float(scores[idx] / scores.sum()),
+                            rank,
+                            self.now,
+                            strategy_name,
+                        )
+                    )
+        await self.copy(
+            "k3l_channel_rank",
+            [
+                "pseudo_id",
+                "channel_id",
+                "fid",
+                "score",
+                "rank",
+                "compute_ts",
+                "strategy_name",
+            ],
+            records,
+        )
+
+    async def balances(self):
+        # the most popular channels have tokens
+        token_channels = self.channel_ids[: max(1, len(self.channel_ids) // 5)]
+        await self.copy(
+            "k3l_channel_rewards_config",
+            ["channel_id", "is_ranked", "is_points", "is_tokens", "symbol"],
+            [
+                (channel_id, True, True, channel_id in token_channels, channel_id)
+                for channel_id in self.channel_ids
+            ],
+        )
+        records = []
+        for channel_id in token_channels:
+            members = self.members[channel_id]
+            balances = (self.rng.pareto(1.2, len(members)) * 1e6).astype(np.int64)
+            updated = self.past(len(members), 3).tolist()
+            for fid, balance, ts in zip(members, balances, updated):
+                ts = ts.replace(tzinfo=UTC)
+                records.append(
+                    (int(fid), channel_id, int(balance), int(balance) // 10, ts, ts)
+                )
+        await self.copy(
+            "k3l_channel_tokens_bal",
+            [
+                "fid",
+                "channel_id",
+                "balance",
+                "latest_earnings",
+                "insert_ts",
+                "update_ts",
+            ],
+            records,
+        )
+
+        records = []
+        self.tokens = random_bytes(self.rng, self.args.tokens, 20)
+        for token in self.tokens:
+            holders = np.unique(self.active_fids(len(self.fids) // 10))
+            values = (self.rng.pareto(1.2, len(holders)) * 1e18).astype(object)
+            records.extend(
+                (int(fid), token, int(value)) for fid, value in zip(holders, values)
+            )
+        await self.copy(
+            "k3l_token_holding_fids", ["fid", "token_address", "value"], records
+        )
+
+    async def run(self):
+        await self.profiles()
+        await self.channels()
+        await self.casts()
+        await self.cast_actions()
+        await self.ranks()
+        await self.balances()
+        for view in ("k3l_recent_parent_casts", "k3l_recent_frame_interaction"):
+            await self.conn.execute(f"REFRESH MATERIALIZED VIEW {view}")
+        await self.conn.execute("ANALYZE")
+        # what the load test picks its parameters from
+        manifest = {
+            "fids": len(self.fids),
+            "channels": self.channel_ids,
+            "tokens": ["0x" + token.hex() for token in self.tokens],
+            "addresses": [
+                "0x" + row["custody_address"].hex()
+                for row in await self.conn.fetch(
+                    "SELECT custody_address FROM fids ORDER BY fid LIMIT 1000"
+                )
+            ],
+        }
+        with open(self.args.manifest, "w") as f:
+            json.dump(manifest, f)
+        print(f"wrote {self.args.manifest}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dsn", required=True)
+    parser.add_argument("--manifest", required=True)
+    parser.add_argument("--fids", type=int, default=50_000)
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--max-channel-members", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--casts-per-day", type=int, default=10_000)
+    parser.add_argument("--max-reactions", type=int, default=500)
+    parser.add_argument("--tokens", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        await Seeder(conn, args).run()
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+-- Applied after pipeline/schema/neynar_db_schema.sql by run.sh.
+-- Stand-ins for what the dump cannot create on an empty database:
+-- rank views whose source tables are not in the dump, the ERC20 holders
+-- view from k3l_schema.sql, default partitions for rows outside the dumped
+-- ranges, foreign keys to hub messages, which are not synthesized, and the
+-- tables that k3l_objects.sql and k3l_schema.sql add to the dump.
+-- The stand-ins are plain tables with the columns and indexes of the views.
+
+ALTER TABLE public.casts DROP CONSTRAINT IF EXISTS casts_hash_foreign;
+ALTER TABLE public.reactions DROP CONSTRAINT IF EXISTS reactions_hash_foreign;
+
+CREATE TABLE IF NOT EXISTS public.k3l_cast_action_default
+    PARTITION OF public.k3l_cast_action DEFAULT;
+CREATE TABLE IF NOT EXISTS public.k3l_channel_openrank_results_default
+    PARTITION OF public.k3l_channel_openrank_results DEFAULT;
+CREATE TABLE IF NOT EXISTS public.k3l_channel_points_log_default
+    PARTITION OF public.k3l_channel_points_log DEFAULT;
+CREATE TABLE IF NOT EXISTS public.k3l_channel_tokens_log_default
+    PARTITION OF public.k3l_channel_tokens_log DEFAULT;
+
+DROP MATERIALIZED VIEW IF EXISTS public.k3l_rank;
+CREATE TABLE public.k3l_rank (
+    pseudo_id bigint,
+    rank bigint,
+    score real,
+    profile_id bigint,
+    strategy_id integer,
+    strategy_name character varying(255),
+    date date
+);
+CREATE UNIQUE INDEX k3l_rank_idx ON public.k3l_rank USING btree (pseudo_id);
+CREATE INDEX k3l_rank_profile_id_idx ON public.k3l_rank USING btree (profile_id);
+CREATE INDEX k3l_rank_profile_id_strategy_id_idx ON public.k3l_rank USING btree (profile_id, strategy_id);
+CREATE INDEX k3l_rank_strategy_id_idx ON public.k3l_rank USING btree (strategy_id);
+CREATE INDEX k3l_rank_strategy_id_profile_id_idx ON public.k3l_rank USING btree (strategy_id, profile_id);
+
+DROP MATERIALIZED VIEW IF EXISTS public.k3l_channel_rank;
+CREATE TABLE public.k3l_channel_rank (
+    pseudo_id bigint,
+    channel_id text,
+    fid bigint,
+    score real,
+    rank bigint,
+    compute_ts timestamp without time zone,
+    strategy_name text
+);
+CREATE INDEX k3l_channel_rank_ch_fid_idx ON public.k3l_channel_rank USING btree (channel_id, fid);
+CREATE INDEX k3l_channel_rank_ch_strat_fid_idx ON public.k3l_channel_rank USING btree (channel_id, strategy_name, fid);
+CREATE INDEX k3l_channel_rank_ch_strat_idx ON public.k3l_channel_rank USING btree (channel_id, strategy_name);
+CREATE INDEX k3l_channel_rank_fid_ch_idx ON public.k3l_channel_rank USING btree (fid, channel_id);
+CREATE INDEX k3l_channel_rank_fid_idx ON public.k3l_channel_rank USING btree (fid);
+CREATE INDEX k3l_channel_rank_rank_idx ON public.k3l_channel_rank USING btree (rank);
+CREATE INDEX k3l_channel_rank_strat_ch_ts_fid_idx ON public.k3l_channel_rank USING btree (strategy_name, channel_id, compute_ts, fid);
+CREATE UNIQUE INDEX k3l_channel_rank_unq_idx ON public.k3l_channel_rank USING btree (pseudo_id);
+
+DROP MATERIALIZED VIEW IF EXISTS public.k3l_token_holding_fids;
+CREATE TABLE public.k3l_token_holding_fids (
+    fid bigint,
+    token_address bytea,
+    value numeric
+);
+CREATE INDEX k3l_token_holding_fids_fid_idx ON public.k3l_token_holding_fids USING btree (fid, token_address);
+CREATE INDEX k3l_token_holding_fids_token_idx ON public.k3l_token_holding_fids USING btree (token_address, fid);
+
+
+CREATE TABLE IF NOT EXISTS public.k3l_cast_action_v1 (
+    channel_id text,
+    fid bigint NOT NULL,
+    cast_hash bytea NOT NULL,
+    casted integer NOT NULL,
+    replied integer NOT NULL,
+    recasted integer NOT NULL,
+    liked integer NOT NULL,
+    action_ts timestamp without time zone NOT NULL,
+    created_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    UNIQUE(cast_hash, fid, action_ts)
+)
+PARTITION BY RANGE (action_ts);
+CREATE INDEX IF NOT EXISTS k3l_cast_action_v1_covering_idx ON public.k3l_cast_action_v1
+    USING btree (cast_hash, action_ts, fid) INCLUDE (casted, replied, recasted, liked);
+CREATE INDEX IF NOT EXISTS k3l_cast_action_v1_fid_idx ON public.k3l_cast_action_v1 USING btree (fid);
+CREATE INDEX IF NOT EXISTS k3l_cast_action_v1_fid_ts_idx ON public.k3l_cast_action_v1 USING btree (fid, action_ts);
+CREATE INDEX IF NOT EXISTS k3l_cast_action_v1_timestamp_idx ON public.k3l_cast_action_v1 USING btree (action_ts);
+CREATE INDEX IF NOT EXISTS k3l_cast_action_v1_ch_idx ON public.k3l_cast_action_v1 USING btree (channel_id);
+CREATE TABLE IF NOT EXISTS public.k3l_cast_action_v1_default
+    PARTITION OF public.k3l_cast_action_v1 DEFAULT;
+
+CREATE TABLE IF NOT EXISTS public.k3l_action_discounted_fids (
+    fid bigint NOT NULL,
+    created_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    reason text DEFAULT ''::text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS public.k3l_channel_metrics (
+    metric_ts timestamp with time zone DEFAULT CURRENT_TIMESTAMP,
+    channel_id text NOT NULL,
+    metric text NOT NULL,
+    int_value int8,
+    float_value numeric,
+    insert_ts timestamp with time zone DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(metric_ts, channel_id, metric)
+)
+PARTITION BY RANGE (metric_ts);
+CREATE TABLE IF NOT EXISTS public.k3l_channel_metrics_default
+    PARTITION OF public.k3l_channel_metrics DEFAULT;
@@ -0,0 +1,61 @@
+"""
+Writes synthetic graph artifacts in the layout that GraphLoader reads:
+`{prefix}_df.pkl` (i, j, v edges), `{prefix}_ig.pkl` (igraph with fids as
+vertex names and `v` edge weights) and `{prefix}_SUCCESS`.
+
+Out-degrees are log-normal and targets are drawn with a Zipf-like skew,
+so that a few fids are followed/engaged with by many, like the real graphs.
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import igraph
+import numpy as np
+import pandas
+
+GRAPHS = ("fc_following_fid", "fc_90dv3_fid")
+
+
+def synth_edges(
+    num_fids: int, mean_degree: float, rng: np.random.Generator
+) -> pandas.DataFrame:
+    degrees = rng.lognormal(np.log(mean_degree), 1.0, num_fids).astype(np.int64)
+    degrees = degrees.clip(1, num_fids - 1)
+    i = np.repeat(np.arange(1, num_fids + 1, dtype=np.int64), degrees)
+    # popularity ~ 1 / rank, shuffled so that popular fids are spread out
+    popularity = 1 / np.arange(1, num_fids + 1)
+    popularity = rng.permutation(popularity / popularity.sum())
+    j = rng.choice(np.arange(1, num_fids + 1, dtype=np.int64), len(i), p=popularity)
+    df = pandas.DataFrame({"i": i, "j": j})
+    df = df[df["i"] != df["j"]].drop_duplicates()
+    df["v"] = rng.zipf(2.0, len(df)).clip(max=1000).astype(np.int64)
+    return df.reset_index(drop=True)
+
+
+def write_graph(prefix: Path, df: pandas.DataFrame):
+    df.to_pickle(f"{prefix}_df.pkl")
+    g = igraph.Graph.DataFrame(df, directed=True, use_vids=False)
+    g.write_pickle(f"{prefix}_ig.pkl")
+    # GraphLoader reloads when the mtime of this file changes
+    Path(f"{prefix}_SUCCESS").touch()
+    print(f"{prefix}: {g.vcount()} vertices, {g.ecount()} edges")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--fids", type=int, default=50_000)
+    parser.add_argument("--mean-degree", type=float, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    rng = np.random.default_rng(args.seed)
+    for name in GRAPHS:
+        write_graph(args.out / name, synth_edges(args.fids, args.mean_degree, rng))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+-- Schema for the optional cache database (CACHE_DB_* settings).
+-- Entries are derived data that can always be recomputed,
+-- ... so the table is UNLOGGED to keep write amplification low.
+CREATE UNLOGGED TABLE IF NOT EXISTS k3l_serve_cache (
+    namespace text NOT NULL,
+    key text NOT NULL,
+    value bytea NOT NULL,
+    stale_at timestamptz NOT NULL,
+    expires_at timestamptz NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+
+CREATE INDEX IF NOT EXISTS k3l_serve_cache_expires_at_idx
+    ON k3l_serve_cache (expires_at);
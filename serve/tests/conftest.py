@@ -0,0 +1,6 @@
+import os
+
+# settings without defaults; app modules read them at import
+os.environ.setdefault("SWAGGER_BASE_URL", "http://localhost:8000")
+os.environ.setdefault("CURA_API_KEY", "test")
+os.environ.setdefault("USE_PANDAS_PERF", "false")
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from app.config import settings
+from app.dependencies.cast_action_store import (
+    HASH_DTYPE,
+    CastActionColumns,
+    CastActionStore,
+)
+
+NOW = float(int(time.time()) // 3600 * 3600)
+
+
+def _columns(rows: list[tuple[int, int, float]]) -> CastActionColumns:
+    """Likes from (fid, cast number, action_ts) rows."""
+    n = len(rows)
+    return CastActionColumns(
+        np.array([fid for fid, _, _ in rows], dtype=np.int64),
+        np.array([bytes([cast]) * 20 for _, cast, _ in rows], dtype=HASH_DTYPE),
+        np.zeros(n, dtype=np.int8),
+        np.zeros(n, dtype=np.int8),
+        np.zeros(n, dtype=np.int8),
+        np.ones(n, dtype=np.int8),
+        np.array([ts for _, _, ts in rows], dtype=float),
+    )
+
+
+def _store(rows: list[tuple[int, int, float]], watermark: float) -> CastActionStore:
+    store = CastActionStore(timedelta(days=1))
+    store._add(_columns(rows))
+    store._watermark = watermark
+    store._loaded_at = time.time()
+    return store
+
+
+def _poll(store: CastActionStore, rows, created_at) -> list:
+    fetched = []
+
+    async def fetch(pool, query_name, condition, since):
+        fetched.append(since)
+        return _columns(rows), np.array(created_at, dtype=float)
+
+    store._fetch = fetch
+    asyncio.run(store.poll(None))
+    return fetched
+
+
+def _held(store: CastActionStore) -> list[tuple[int, int, float]]:
+    actions = store.actions_of(range(10), 0, NOW + 3600)
+    return sorted(
+        (int(fid), bytes(cast_hash)[0], float(ts))
+        for fid, cast_hash, ts in zip(
+            actions.fids, actions.cast_hashes, actions.action_ts
+        )
+    )
+
+
+def test_poll_rereads_overlap_without_duplicates():
+    store = _store([(1, 1, NOW + 10), (2, 1, NOW + 20)], watermark=NOW + 100)
+    fetched = _poll(
+        store,
+        # the first is held; the second landed at the watermark after it was
+        # ... read; the third is new
+        [(1, 1, NOW + 10), (3, 2, NOW + 30), (2, 2, NOW + 40)],
+        [NOW + 50, NOW + 100, NOW + 150],
+    )
+    assert fetched == [NOW + 100 - settings.CAST_ACTION_STORE_OVERLAP_SECS]
+    assert _held(store) == [
+        (1, 1, NOW + 10),
+        (2, 1, NOW + 20),
+        (2, 2, NOW + 40),
+        (3, 2, NOW + 30),
+    ]
+    assert store._watermark == NOW + 150
+
+
+def test_poll_keeps_distinct_actions_of_a_fid():
+    store = _store([(1, 1, NOW + 10)], watermark=NOW + 100)
+    _poll(store, [(1, 1, NOW + 11), (1, 2, NOW + 10)], [NOW + 90, NOW + 90])
+    assert _held(store) == [(1, 1, NOW + 10), (1, 1, NOW + 11), (1, 2, NOW + 10)]
+
+
+def test_poll_reloads_periodically():
+    store = _store([], watermark=NOW)
+    store._loaded_at = time.time() - settings.CAST_ACTION_STORE_RELOAD_SECS - 1
+    loads = []
+
+    async def load(pool):
+        loads.append(pool)
+
+    store.load = load
+    _poll(store, [], [])
+    assert loads == [None]
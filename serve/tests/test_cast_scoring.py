@@ -0,0 +1,251 @@
+from datetime import UTC, datetime
+
+import numpy as np
+import pytest
+
+from app.dependencies.cast_scoring import (
+    ChannelCastActions,
+    _is_after,
+    _ntile,
+    _order_rows,
+    score_channel_casts,
+    score_given_channel_casts,
+)
+from app.dependencies.cursor import cursor_as_of, decode_cursor, next_cursor
+from app.dependencies.db_utils import channel_casts_order_by
+from app.models.feed_model import CastsTimeDecay, SortingOrder
+from app.models.score_model import ScoreAgg, Weights
+
+NOW = 1_700_000_000.0
+
+
+def _naive(epoch: float) -> datetime:
+    return datetime.fromtimestamp(epoch, UTC).replace(tzinfo=None)
+
+
+def _actions() -> ChannelCastActions:
+    # 0xaa: fid 1 (score 2) likes it 2h ago and replies 1h ago,
+    # ... fid 2 (score 3) recasts it 100s ago
+    # 0xbb: fid 3 (score 1) likes it 10s ago
+    rows = [
+        {
+            "cast_hash": "0xaa",
+            "cast_ts": _naive(NOW - 7300),
+            "cast_epoch": NOW - 7300,
+            "in_window": True,
+            "fids": [1, 1, 2],
+            "fid_scores": [2.0, 2.0, 3.0],
+            "casted": [0, 0, 0],
+            "recasted": [0, 0, 1],
+            "replied": [0, 1, 0],
+            "liked": [1, 0, 0],
+            "action_ts": [NOW - 7200, NOW - 3600, NOW - 100],
+        },
+        {
+            "cast_hash": "0xbb",
+            "cast_ts": _naive(NOW - 20),
+            "cast_epoch": NOW - 20,
+            "in_window": True,
+            "fids": [3],
+            "fid_scores": [1.0],
+            "casted": [0],
+            "recasted": [0],
+            "replied": [0],
+            "liked": [1],
+            "action_ts": [NOW - 10],
+        },
+    ]
+    return ChannelCastActions.from_rows(NOW, rows)
+
+
+def _score(**kwargs) -> list[dict]:
+    params = {
+        "agg": ScoreAgg.SUM,
+        "score_threshold": 0,
+        "reactions_threshold": 0,
+        # like 1, cast 0, recast 2, reply 3
+        "weights": Weights.from_str("L1C0R2Y3"),
+        "time_decay": CastsTimeDecay.NEVER,
+        "normalize": False,
+        "offset": 0,
+        "limit": 25,
+        "order_by": channel_casts_order_by(SortingOrder.SCORE),
+    }
+    params.update(kwargs)
+    return score_channel_casts(_actions(), **params)
+
+
+@pytest.mark.parametrize(
+    "n, buckets, expected",
+    [
+        (10, 3, [1, 1, 1, 1, 2, 2, 2, 3, 3, 3]),
+        (3, 5, [1, 2, 3]),
+        (6, 3, [1, 1, 2, 2, 3, 3]),
+        (0, 100, []),
+    ],
+)
+def test_ntile(n, buckets, expected):
+    assert _ntile(n, buckets).tolist() == expected
+
+
+def test_order_rows():
+    rows = [
+        {"age_hours": 1, "cast_score": 5.0, "cast_hash": "0x01"},
+        {"age_hours": 0, "cast_score": 1.0, "cast_hash": "0x02"},
+        {"age_hours": 1, "cast_score": 5.0, "cast_hash": "0x03"},
+        {"age_hours": 1, "cast_score": 9.0, "cast_hash": "0x04"},
+    ]
+    _order_rows(rows, channel_casts_order_by(SortingOrder.HOUR))
+    assert [row["cast_hash"] for row in rows] == ["0x02", "0x04", "0x03", "0x01"]
+
+
+def test_order_rows_shuffle_keeps_leading_bucket():
+    rows = [
+        {"age_hours": hours, "cast_score": float(i), "cast_hash": f"0x{i:02x}"}
+        for i, hours in enumerate([2, 0, 1, 0, 2, 1])
+    ]
+    _order_rows(rows, channel_casts_order_by(SortingOrder.HOUR), shuffle=True)
+    assert [row["age_hours"] for row in rows] == [0, 0, 1, 1, 2, 2]
+
+
+def test_is_after():
+    order_by = channel_casts_order_by(SortingOrder.HOUR)
+    after = [1, 5.0, "0x03"]
+    row = {"age_hours": 1, "cast_score": 5.0, "cast_hash": "0x03"}
+    assert not _is_after(row, order_by, after)
+    assert _is_after({**row, "cast_hash": "0x01"}, order_by, after)
+    assert not _is_after({**row, "cast_hash": "0x04"}, order_by, after)
+    assert _is_after({**row, "cast_score": 4.0}, order_by, after)
+    assert _is_after({**row, "age_hours": 2, "cast_score": 9.0}, order_by, after)
+    assert not _is_after({**row, "age_hours": 0, "cast_score": 1.0}, order_by, after)
+
+
+def test_score_channel_casts_popular():
+    rows = _score()
+    assert rows == [
+        {
+            "cast_hash": "0xaa",
+            "age_hours": 2,
+            "age_days": 0,
+            "cast_ts": _naive(NOW - 7200),
+            # fid 1: like 2*1 + reply 2*3, fid 2: recast 3*2
+            "cast_score": 14.0,
+            "reaction_count": 1,
+            "as_of": datetime.fromtimestamp(NOW, UTC),
+        },
+        {
+            "cast_hash": "0xbb",
+            "age_hours": 0,
+            "age_days": 0,
+            "cast_ts": _naive(NOW - 10),
+            "cast_score": 1.0,
+            "reaction_count": 0,
+            "as_of": datetime.fromtimestamp(NOW, UTC),
+        },
+    ]
+
+
+def test_score_channel_casts_agg_and_normalize():
+    rows = _score(agg=ScoreAgg.SUMSQUARE)
+    assert [row["cast_score"] for row in rows] == [8.0**2 + 6.0**2, 1.0]
+    rows = _score(normalize=True)
+    scores = [row["cast_score"] for row in rows]
+    assert scores == pytest.approx([4 * 2 ** (1 / 3) + 2 * 3 ** (1 / 3), 1.0])
+
+
+def test_score_channel_casts_thresholds():
+    assert [row["cast_hash"] for row in _score(reactions_threshold=1)] == ["0xaa"]
+    assert [row["cast_hash"] for row in _score(score_threshold=2)] == ["0xaa"]
+
+
+def test_score_channel_casts_orders_and_pages():
+    order_by = channel_casts_order_by(SortingOrder.HOUR)
+    rows = _score(order_by=order_by)
+    assert [row["cast_hash"] for row in rows] == ["0xbb", "0xaa"]
+    assert [row["cast_hash"] for row in _score(offset=1, limit=1)] == ["0xbb"]
+    after = [2, 14.0, "0xaa"]
+    assert _score(order_by=order_by, after=after) == []
+    after = [14.0, "0xaa"]
+    assert [row["cast_hash"] for row in _score(after=after)] == ["0xbb"]
+
+
+def test_score_channel_casts_as_of_keeps_later_pages_stable():
+    # a page after the first one is scored as of the first page's time:
+    # ... same ages and decay, and no actions that happened since
+    as_of = datetime.fromtimestamp(NOW - 50, UTC)
+    order_by = channel_casts_order_by(SortingOrder.HOUR)
+    rows = _score(order_by=order_by, as_of=as_of, time_decay=CastsTimeDecay.HOUR)
+    assert [row["cast_hash"] for row in rows] == ["0xaa"]
+    assert rows[0]["age_hours"] == 1
+    assert rows[0]["as_of"] == as_of
+    # fid 2's recast 100s before NOW is 50s old as of the first page
+    decay = (1 - 1 / 365) ** (50 / 3600)
+    assert rows[0]["reaction_count"] == 1
+    assert rows[0]["cast_score"] == pytest.approx(
+        2 * (1 - 1 / 365) ** (7150 / 3600)
+        + 6 * (1 - 1 / 365) ** (3550 / 3600)
+        + 6 * decay
+    )
+
+
+def test_next_cursor_carries_as_of():
+    order_by = channel_casts_order_by(SortingOrder.HOUR)
+    rows = _score(order_by=order_by, limit=1)
+    cursor = next_cursor(order_by, rows, limit=1)
+    assert decode_cursor(cursor, order_by) == [0, 1.0, "0xbb"]
+    assert cursor_as_of(cursor) == datetime.fromtimestamp(NOW, UTC)
+    assert cursor_as_of(None) is None
+
+
+def test_score_channel_casts_reactions_cursor_columns():
+    order_by = channel_casts_order_by(SortingOrder.REACTIONS)
+    rows = _score(order_by=order_by)
+    assert [row["reaction_count"] for row in rows] == [1, 0]
+    after = [rows[0][col] for col, _ in order_by]
+    assert [row["cast_hash"] for row in _score(order_by=order_by, after=after)] == [
+        "0xbb"
+    ]
+
+
+def test_score_channel_casts_trending():
+    rows = _score(trending=True)
+    assert [(row["cast_hash"], row["ptile"]) for row in rows] == [
+        ("0xaa", 1),
+        ("0xbb", 2),
+    ]
+    # trending casts keep their own timestamp, not their first action's
+    assert rows[0]["cast_ts"] == _naive(NOW - 7300)
+    assert rows[0]["age_hours"] == 2
+    assert [row["cast_hash"] for row in _score(trending=True, cutoff_ptile=1)] == [
+        "0xaa"
+    ]
+
+
+def test_score_given_channel_casts_with_fid_scores():
+    # fid 2 is unranked now; fid 3's score went from 1 to 4
+    actions = _actions().with_fid_scores(np.array([2.0, 2.0, np.nan, 4.0]))
+    rows = score_given_channel_casts(
+        actions,
+        agg=ScoreAgg.SUM,
+        score_threshold=0,
+        weights=Weights.from_str("L1C0R2Y3"),
+        time_decay=CastsTimeDecay.NEVER,
+        normalize=False,
+        order_by=channel_casts_order_by(SortingOrder.SCORE),
+    )
+    assert rows == [
+        {
+            "cast_hash": "0xaa",
+            "age_hours": 2,
+            "age_days": 0,
+            "cast_ts": _naive(NOW - 7200),
+            "cast_score": 8.0,
+        },
+        {
+            "cast_hash": "0xbb",
+            "age_hours": 0,
+            "age_days": 0,
+            "cast_ts": _naive(NOW - 10),
+            "cast_score": 4.0,
+        },
+    ]
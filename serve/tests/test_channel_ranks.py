@@ -0,0 +1,18 @@
+import numpy as np
+
+from app.dependencies.channel_ranks import ChannelRanks, _parse_ranks
+
+
+def test_fid_scores():
+    ranks = ChannelRanks("60d_engagement")
+    assert ranks.fid_scores("degen", "60d_engagement", np.array([1])) is None
+    ranks._channels = _parse_ranks(b"degen,1,2,0.5\ndegen,3,1,0.75\nnan,1,1,1.0\n")
+    assert ranks.fid_scores("degen", "7d_engagement", np.array([1])) is None
+    scores = ranks.fid_scores("degen", "60d_engagement", np.array([3, 2, 1, 3]))
+    np.testing.assert_array_equal(scores, [0.75, np.nan, 0.5, 0.75])
+    assert ranks.fid_scores("nan", "60d_engagement", np.array([1])).tolist() == [1.0]
+    assert np.isnan(ranks.fid_scores("base", "60d_engagement", np.array([1]))).all()
+    assert ranks.lookup("degen", "60d_engagement", [1, 3]) == [
+        {"fid": 3, "rank": 1},
+        {"fid": 1, "rank": 2},
+    ]
@@ -0,0 +1,58 @@
+import asyncio
+
+from app.config import settings
+from app.dependencies import db_utils, feed_materializer
+from app.dependencies.channel_metadata import channel_metadata
+from app.dependencies.feed_materializer import FeedMaterializer
+
+
+def test_popular_refresh_fetches_actions_afresh(monkeypatch):
+    monkeypatch.setattr(settings, "CHANNEL_FEED_SCORING_IN_PROCESS", True)
+    monkeypatch.setattr(settings, "FEED_MATERIALIZE_ENABLED", True)
+    fetches = []
+
+    async def url_for_id(channel_id, pool):
+        return f"chain://{channel_id}"
+
+    async def fetch_rows(*args, **kwargs):
+        fetches.append(args)
+        return []
+
+    monkeypatch.setattr(channel_metadata, "url_for_id", url_for_id)
+    monkeypatch.setattr(db_utils, "fetch_rows", fetch_rows)
+    materializer = FeedMaterializer()
+
+    async def run():
+        await materializer._refresh_popular("degen", pool=None)
+        await materializer._refresh_popular("degen", pool=None)
+
+    asyncio.run(run())
+    # every refresh reads the actions, not the copy in the feed cache
+    assert len(fetches) == 2
+    assert materializer.get("popular", "degen", 0, 25) == []
+
+
+def test_refresh_seeds_most_active_channels(monkeypatch):
+    monkeypatch.setattr(settings, "FEED_MATERIALIZE_ENABLED", True)
+    monkeypatch.setattr(settings, "FEED_MATERIALIZE_SEED_CHANNELS", 1)
+    queries = []
+
+    async def top(lookback, rank_threshold, offset, limit, pool):
+        return [{"id": "degen", "score": 1.0}][:limit]
+
+    async def url_for_id(channel_id, pool):
+        return f"chain://{channel_id}"
+
+    async def fetch_rows(*args, sql_query, **kwargs):
+        queries.append(args[0])
+        return []
+
+    monkeypatch.setattr(feed_materializer.trending_channels, "top", top)
+    monkeypatch.setattr(channel_metadata, "url_for_id", url_for_id)
+    monkeypatch.setattr(db_utils, "fetch_rows", fetch_rows)
+    materializer = FeedMaterializer()
+    asyncio.run(materializer.refresh(pool=None))
+    # both feeds of the never requested channel, by the live feed functions
+    assert queries == ["degen", "degen"]
+    assert materializer.get("trending", "degen", 0, 25) == []
+    assert materializer.get("popular", "degen", 0, 25) == []
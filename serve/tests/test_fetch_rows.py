@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+import pytest
+
+from app.dependencies import db_utils
+from app.dependencies.deadlines import deadline
+from app.models.feed_model import CASTS_AGE, TrendingFeed
+from app.models.score_model import Weights
+
+
+def _slow_fetch(calls: list, secs: float):
+    async def fetch(*args, sql_query, pool, query_name, query_class):
+        calls.append(args)
+        await asyncio.sleep(secs)
+        return [{"fid": args[0]}]
+
+    return fetch
+
+
+def test_coalesced_calls_share_one_execution(monkeypatch):
+    calls = []
+    monkeypatch.setattr(db_utils, "_fetch_rows", _slow_fetch(calls, 0.05))
+
+    async def run():
+        return await asyncio.gather(
+            *(
+                db_utils.fetch_rows(1, sql_query="SELECT $1", pool=None, coalesce=True)
+                for _ in range(3)
+            ),
+            db_utils.fetch_rows(2, sql_query="SELECT $1", pool=None, coalesce=True),
+        )
+
+    results = asyncio.run(run())
+    assert results == [[{"fid": 1}]] * 3 + [[{"fid": 2}]]
+    assert calls == [(1,), (2,)]
+
+
+def test_coalesced_call_times_out_per_key(monkeypatch):
+    calls = []
+    monkeypatch.setattr(db_utils, "_fetch_rows", _slow_fetch(calls, 1))
+
+    async def run():
+        return await db_utils.fetch_rows(
+            1, sql_query="SELECT $1", pool=None, coalesce=True, timeout_secs=0.05
+        )
+
+    assert asyncio.run(run()) == [{"Unknown error. Contact K3L team"}]
+    assert not db_utils._inflight_queries
+
+
+def test_coalesced_call_returns_within_the_callers_deadline(monkeypatch):
+    calls = []
+    monkeypatch.setattr(db_utils, "_fetch_rows", _slow_fetch(calls, 0.3))
+
+    async def with_deadline():
+        with deadline(0.05):
+            start = time.monotonic()
+            rows = await db_utils.fetch_rows(
+                1, sql_query="SELECT $1", pool=None, coalesce=True
+            )
+            return rows, time.monotonic() - start
+
+    async def run():
+        return await asyncio.gather(
+            with_deadline(),
+            db_utils.fetch_rows(1, sql_query="SELECT $1", pool=None, coalesce=True),
+        )
+
+    (rows, elapsed), shared_rows = asyncio.run(run())
+    assert rows == [{"Unknown error. Contact K3L team"}]
+    assert elapsed < 0.2
+    # the query goes on for the callers without a deadline
+    assert shared_rows == [{"fid": 1}]
+    assert calls == [(1,)]
+
+
+def test_check_rows_raises_on_the_error_sentinel():
+    rows = [{"fid": 1}]
+    assert db_utils.check_rows(rows, "fids") is rows
+    with pytest.raises(RuntimeError, match="failed to fetch fids"):
+        db_utils.check_rows([{"Unknown error. Contact K3L team"}], "fids")
+
+
+def test_trending_channels_casts_raise_on_failed_fetch(monkeypatch):
+    async def failed_fetch(*args, **kwargs):
+        return [{"Unknown error. Contact K3L team"}]
+
+    monkeypatch.setattr(db_utils, "fetch_rows", failed_fetch)
+    trending = TrendingFeed(feedType="trending")
+
+    async def run():
+        return await db_utils.get_trending_channels_casts_lite(
+            channel_ids=["failed-channel"],
+            channel_strategy="60d_engagement",
+            max_cast_age=CASTS_AGE[trending.lookback],
+            agg=trending.agg,
+            score_threshold=trending.score_threshold,
+            reactions_threshold=trending.reactions_threshold,
+            cutoff_ptile=trending.cutoff_ptile,
+            weights=Weights.from_str(trending.weights),
+            shuffle=trending.shuffle,
+            time_decay=trending.time_decay,
+            normalize=trending.normalize,
+            offset=0,
+            limit=25,
+            sorting_order=trending.sorting_order,
+            pool=None,
+        )
+
+    with pytest.raises(RuntimeError, match="failed to fetch trending channels casts"):
+        asyncio.run(run())
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import urllib.parse
+
+import orjson
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.dependencies import cache_db_utils
+from app.routers import cast_router, channel_router
+
+
+class _Pool:
+    def get_max_size(self):
+        return 10
+
+
+def _request() -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/casts/personalized/popular/1",
+            "query_string": b"",
+            "headers": [],
+        }
+    )
+
+
+def _for_you(offset: int, limit: int, **metadata):
+    provider_metadata = urllib.parse.quote(
+        json.dumps({"feedType": "popular", "channels": ["a", "b"]} | metadata)
+    )
+    return cast_router.get_popular_casts_for_fid(
+        _request(),
+        fid=1,
+        offset=offset,
+        limit=limit,
+        provider_metadata=provider_metadata,
+        cursor=None,
+        pool=_Pool(),
+        cache_pool=object(),
+        ninetyday_model=None,
+    )
+
+
+@pytest.fixture
+def channel_casts(monkeypatch):
+    async def fetch(channel, offset, limit, **kwargs):
+        # channel b's casts score a little better than a's of the same rank
+        bonus = 0.5 if channel == "b" else 0
+        casts = [
+            {"cast_hash": f"{channel}{i}", "age_hours": 0, "cast_score": 10 - i + bonus}
+            for i in range(offset, 10)
+        ]
+        return {"result": casts[:limit]}
+
+    monkeypatch.setattr(channel_router, "fetch_popular_channel_casts", fetch)
+
+
+def test_for_you_pages_hold_limit_casts_with_or_without_session(
+    monkeypatch, channel_casts
+):
+    async def set_homefeed(fid, session_id, casts, cache_pool):
+        pass
+
+    monkeypatch.setattr(cache_db_utils, "set_homefeed_for_fid", set_homefeed)
+
+    def page(offset, **metadata):
+        response = asyncio.run(_for_you(offset, 3, **metadata))
+        return [cast["cast_hash"] for cast in orjson.loads(response.body)["result"]]
+
+    # merged by score, not by age
+    assert page(0) == page(0, sessionId="s") == ["b0", "a0", "b1"]
+    assert page(3) == ["a1", "b2", "a2"]
+
+
+def test_for_you_session_miss_is_gone(monkeypatch, channel_casts):
+    async def no_homefeed(fid, session_id, cache_pool):
+        return None
+
+    monkeypatch.setattr(cache_db_utils, "get_homefeed_for_fid", no_homefeed)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(_for_you(25, 25, sessionId="s"))
+    assert e.value.status_code == 410
+
+
+def test_for_you_trending_reads_materialized_feeds(monkeypatch):
+    def materialized(feed_type, channel_id, offset, limit):
+        if channel_id != "a":
+            return None
+        return [{"cast_hash": "a0", "cast_score": 2.0, "ptile": 1, "as_of": 0}]
+
+    async def live(channel_ids, pool, **kwargs):
+        assert channel_ids == ("b",)
+        return [{"channel_id": "b", "cast_hash": "b0", "cast_score": 1.0, "ptile": 1}]
+
+    monkeypatch.setattr(cast_router.feed_materializer, "get", materialized)
+    monkeypatch.setattr(cast_router.db_utils, "get_trending_channels_casts_lite", live)
+    response = asyncio.run(_for_you(0, 3, feedType="trending"))
+    assert orjson.loads(response.body)["result"] == [
+        {"cast_hash": "a0", "cast_score": 2.0, "ptile": 1},
+        {"cast_hash": "b0", "cast_score": 1.0, "ptile": 1},
+    ]
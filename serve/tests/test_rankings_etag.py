@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+from fastapi import Response
+from starlette.requests import Request
+
+from app.config import settings
+from app.dependencies.data_versions import data_versions
+from app.dependencies.replicas import replica_router
+from app.dependencies.tiered_cache import feed_cache
+from app.models.score_model import QueryType
+from app.routers.channel_router import _lite_ranks_etag
+from app.routers.globaltrust_router import _superlite_rank_etag
+
+
+@pytest.fixture(autouse=True)
+def fresh_data_versions(monkeypatch):
+    # publishing also moves feed cache namespaces to new versions
+    monkeypatch.setattr(data_versions, "_versions", {})
+    monkeypatch.setattr(data_versions, "_pending", {})
+    monkeypatch.setattr(feed_cache, "_versions", {})
+
+
+async def _lite_etag(lite: bool) -> str | None:
+    request = Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/channels/rankings/degen",
+            "query_string": f"lite={str(lite).lower()}".encode(),
+            "headers": [],
+        }
+    )
+    response = Response()
+    await _lite_ranks_etag(request, response, lite=lite)
+    return response.headers.get("etag")
+
+
+def _etag(lite: bool) -> str | None:
+    return asyncio.run(_lite_etag(lite))
+
+
+def test_rankings_etag_only_for_lite():
+    assert _etag(lite=True) is None
+    data_versions.apply("k3l_channel_rank", 1)
+    assert _etag(lite=True) is not None
+    # balances are not covered by the data versions
+    assert _etag(lite=False) is None
+
+
+def test_rankings_etag_ignores_global_ranks():
+    data_versions.apply("k3l_channel_rank", 1)
+    etag = _etag(lite=True)
+    data_versions.apply("k3l_rank", 2)
+    assert _etag(lite=True) == etag
+    data_versions.apply("k3l_channel_rank", 2)
+    assert _etag(lite=True) != etag
+
+
+def test_new_version_waits_for_replicas_to_replay_it(monkeypatch):
+    monkeypatch.setattr(replica_router, "pools", lambda: [object()])
+    monkeypatch.setattr(settings, "DB_REPLICA_MAX_LAG_SECS", 0.01)
+    monkeypatch.setattr(settings, "DB_REPLICA_LAG_CHECK_SECS", 0)
+
+    async def publish():
+        # the first version seen is applied at once
+        data_versions.apply("k3l_channel_rank", 1)
+        assert data_versions.get("k3l_channel_rank") == 1
+        data_versions.apply("k3l_channel_rank", 2)
+        assert data_versions.get("k3l_channel_rank") == 1
+        assert feed_cache._versions["channel_feed"] == "1.0"
+        await asyncio.sleep(0.05)
+        assert data_versions.get("k3l_channel_rank") == 2
+        assert feed_cache._versions["channel_feed"] == "2.0"
+
+    asyncio.run(publish())
+
+
+def test_rankings_etag_waits_for_replicas(monkeypatch):
+    monkeypatch.setattr(replica_router, "pools", lambda: [object()])
+    monkeypatch.setattr(settings, "DB_REPLICA_MAX_LAG_SECS", 0.01)
+    monkeypatch.setattr(settings, "DB_REPLICA_LAG_CHECK_SECS", 0)
+    data_versions.apply("k3l_channel_rank", 1)
+    etag = _etag(lite=True)
+
+    async def publish():
+        data_versions.apply("k3l_channel_rank", 2)
+        # replicas may still serve version 1, which the old ETag describes
+        assert await _lite_etag(lite=True) == etag
+        await asyncio.sleep(0.05)
+
+    asyncio.run(publish())
+    assert _etag(lite=True) != etag
+
+
+def _global_etag(query_type: QueryType) -> str | None:
+    request = Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/scores/global/following/rankings",
+            "query_string": f"query_type={query_type}".encode(),
+            "headers": [],
+        }
+    )
+    response = Response()
+    asyncio.run(_superlite_rank_etag(request, response, query_type=query_type))
+    return response.headers.get("etag")
+
+
+def test_global_rankings_etag_only_for_superlite():
+    data_versions.apply("k3l_rank", 1)
+    assert _global_etag(QueryType.SUPERLITE) is not None
+    # user_data and fnames are not covered by the data versions
+    assert _global_etag(QueryType.LITE) is None
+    assert _global_etag(QueryType.HEAVY) is None
@@ -0,0 +1,22 @@
+from datetime import datetime
+from decimal import Decimal
+
+import orjson
+
+from app.responses import json_dumps
+
+
+def test_json_dumps_query_types():
+    row = {
+        "cast_hash": b"\x8f\xff\x00",
+        "ts": datetime(2024, 1, 2, 3, 4, 5),
+        "balance": Decimal("12"),
+        "score": Decimal("0.5"),
+    }
+    assert orjson.loads(json_dumps(row)) == {
+        # binary columns would not decode as utf-8
+        "cast_hash": "0x8fff00",
+        "ts": "2024-01-02T03:04:05",
+        "balance": 12,
+        "score": 0.5,
+    }
@@ -0,0 +1,47 @@
+from fastapi import FastAPI
+
+from app.telemetry import PrometheusMiddleware
+
+app = FastAPI()
+
+
+@app.get("/channels/rankings/{channel}")
+async def rankings(channel: str):
+    return {}
+
+
+@app.get("/channels/rankings/{channel}/stats")
+async def stats(channel: str):
+    return {}
+
+
+@app.get("/channels/{channel}/stats")
+async def channel_stats(channel: str):
+    return {}
+
+
+def _path(middleware: PrometheusMiddleware, method: str, path: str):
+    scope = {"type": "http", "method": method, "path": path, "app": app}
+    return middleware.get_path(scope)
+
+
+def test_get_path_resolves_route_templates():
+    middleware = PrometheusMiddleware(app)
+    assert _path(middleware, "GET", "/channels/rankings/degen") == (
+        "/channels/rankings/{channel}",
+        True,
+    )
+    assert _path(middleware, "GET", "/channels/rankings/base/stats") == (
+        "/channels/rankings/{channel}/stats",
+        True,
+    )
+    assert _path(middleware, "GET", "/channels/degen/stats") == (
+        "/channels/{channel}/stats",
+        True,
+    )
+    assert _path(middleware, "GET", "/casts/degen") == ("/casts/degen", False)
+    # method mismatches are only partial matches
+    assert _path(middleware, "POST", "/channels/rankings/degen") == (
+        "/channels/rankings/degen",
+        False,
+    )
@@ -0,0 +1,117 @@
+import asyncio
+import pickle
+import time
+from datetime import timedelta
+
+from app.dependencies import cache_db_utils
+from app.dependencies.tiered_cache import TieredCache
+
+TTL = timedelta(minutes=10)
+EARLY_TTL = timedelta(minutes=5)
+
+
+def _get_many(cache: TieredCache, items: list[str], computed: list[list]):
+    async def compute(missing):
+        computed.append(sorted(missing))
+        return {item: item.upper() for item in missing}
+
+    return cache.get_many_or_compute(
+        "test", {item: f"key:{item}" for item in items}, compute, TTL, EARLY_TTL
+    )
+
+
+def test_get_many_computes_misses_together():
+    cache = TieredCache(l1_size=10)
+    computed = []
+
+    async def run():
+        first = await _get_many(cache, ["a", "b"], computed)
+        second = await _get_many(cache, ["b", "c", "d"], computed)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == {"a": "A", "b": "B"}
+    assert second == {"b": "B", "c": "C", "d": "D"}
+    # b is shared by both calls and computed only once
+    assert computed == [["a", "b"], ["c", "d"]]
+
+
+def test_get_many_shares_entries_with_concurrent_callers():
+    cache = TieredCache(l1_size=10)
+    computed = []
+
+    async def run():
+        return await asyncio.gather(
+            _get_many(cache, ["a", "b"], computed),
+            _get_many(cache, ["b", "c"], computed),
+        )
+
+    first, second = asyncio.run(run())
+    assert first == {"a": "A", "b": "B"}
+    assert second == {"b": "B", "c": "C"}
+    assert computed == [["a", "b"], ["c"]]
+
+
+def test_get_many_is_invalidated_by_version():
+    cache = TieredCache(l1_size=10)
+    computed = []
+
+    async def run():
+        await _get_many(cache, ["a"], computed)
+        cache.set_version("test", "2")
+        await _get_many(cache, ["a"], computed)
+
+    asyncio.run(run())
+    assert computed == [["a"], ["a"]]
+
+
+def test_get_many_reads_l1_misses_from_l2_in_one_query(monkeypatch):
+    now = time.time()
+    cache = TieredCache(l1_size=10)
+    cache.setup(object())
+    l2 = {
+        cache._l2_key("v:key:b"): {
+            "key": cache._l2_key("v:key:b"),
+            "value": pickle.dumps("B from l2"),
+            "stale_at": now + 60,
+            "expires_at": now + 120,
+        }
+    }
+    reads, writes = [], []
+
+    async def get_cache_entries(namespace, keys, cache_pool):
+        reads.append(sorted(keys))
+        return {key: l2[key] for key in keys if key in l2}
+
+    async def set_cache_entry(namespace, key, value, **kwargs):
+        writes.append(key)
+
+    monkeypatch.setattr(cache_db_utils, "get_cache_entries", get_cache_entries)
+    monkeypatch.setattr(cache_db_utils, "set_cache_entry", set_cache_entry)
+    computed = []
+
+    values = asyncio.run(_get_many(cache, ["a", "b", "c"], computed))
+    assert values == {"a": "A", "b": "B from l2", "c": "C"}
+    assert reads == [sorted(cache._l2_key(f"v:key:{item}") for item in "abc")]
+    assert computed == [["a", "c"]]
+    assert len(writes) == 2
+
+
+def test_early_keys_on_bound_arguments():
+    cache = TieredCache(l1_size=10)
+    calls = []
+
+    @cache.early("test", TTL, EARLY_TTL)
+    async def feed(channel, limit=25, pool=None):
+        calls.append((channel, limit))
+        return channel
+
+    async def run():
+        await feed("a", pool=object())
+        await feed("a", 25, object())
+        await feed(channel="a", limit=25, pool=object())
+        await feed("a", limit=10, pool=object())
+
+    asyncio.run(run())
+    # the pool is left out however it is passed; defaults are part of the key
+    assert calls == [("a", 25), ("a", 10)]
@@ -0,0 +1,43 @@
+import asyncio
+
+from app import utils
+from app.config import settings
+from app.dependencies import db_utils
+from app.dependencies.token_balances import channel_token_balances, token_holders
+from app.routers import token_router
+from app.routers.channel_router import get_token_claim
+
+
+def test_token_claim_falls_back_to_db_on_store_miss(monkeypatch):
+    # loaded, but without the balance written since the last refresh
+    monkeypatch.setattr(channel_token_balances, "_channels", {"degen": {}})
+    lookups = []
+
+    async def get_balance(channel_id, fid, pool):
+        lookups.append((channel_id, fid))
+        return {"fid": fid, "channel_id": channel_id, "balance": 10}
+
+    async def fetch_channel_token(channel_id):
+        return {"channelId": channel_id}
+
+    monkeypatch.setattr(db_utils, "get_fid_channel_token_balance", get_balance)
+    monkeypatch.setattr(utils, "fetch_channel_token", fetch_channel_token)
+
+    result = asyncio.run(get_token_claim("degen", fid=3, pool=None))
+    assert lookups == [("degen", 3)]
+    assert result["result"]["balance"] == 10
+
+
+def test_token_balances_skip_the_store_when_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "TOKEN_BALANCES_IN_MEMORY", False)
+    monkeypatch.setattr(token_holders, "_requested_at", {})
+
+    async def get_balances(token_address, fids, pool):
+        return [(fid, 5) for fid in fids]
+
+    monkeypatch.setattr(token_router, "get_token_balances", get_balances)
+    token = token_router.Token.from_str("0x" + "11" * 20)
+    result = asyncio.run(token_router.get_balances(token, fids=[1, 2], pool=None))
+    assert result == {"balances": [{"fid": 1, "value": "5"}, {"fid": 2, "value": "5"}]}
+    # nothing to load in the background without the refresh loop
+    assert token_holders._requested_at == {}